@@ -0,0 +1,99 @@
+"""add status_latest
+
+Revision ID: 269a340bf877
+Revises: fe568344379b
+Create Date: 2026-10-17 02:40:12.104518+00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '269a340bf877'
+down_revision = 'fe568344379b'
+branch_labels = None
+depends_on = None
+
+columns = (
+    "hardware_id, status_id, hostname, time, rpi_cpu_temp, sdr_temp, "
+    "avg_cpu_usage, bytes_recorded, rem_nfs_storage_cap, rem_rpi_storage_cap, "
+    "rpi_uptime_minutes, wr_servo_state, wr_sfp1_link, wr_sfp2_link, "
+    "wr_sfp1_tx, wr_sfp1_rx, wr_sfp2_tx, wr_sfp2_rx, wr_phase_setp, wr_rtt, "
+    "wr_crtt, wr_clck_offset, wr_updt_cnt, wr_temp, wr_host"
+)
+update_columns = ", ".join(
+    "{0} = EXCLUDED.{0}".format(c.strip())
+    for c in columns.split(",")
+    if c.strip() != "hardware_id"
+)
+
+
+def upgrade():
+    op.create_table('status_latest',
+    sa.Column('hardware_id', sa.Integer(), nullable=False),
+    sa.Column('status_id', sa.BigInteger(), nullable=False),
+    sa.Column('hostname', sa.String(length=100), nullable=False),
+    sa.Column('time', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('rpi_cpu_temp', sa.Numeric(), nullable=False),
+    sa.Column('sdr_temp', sa.Numeric(), nullable=False),
+    sa.Column('avg_cpu_usage', sa.Numeric(), nullable=False),
+    sa.Column('bytes_recorded', sa.BigInteger(), nullable=False),
+    sa.Column('rem_nfs_storage_cap', sa.BigInteger(), nullable=False),
+    sa.Column('rem_rpi_storage_cap', sa.BigInteger(), nullable=False),
+    sa.Column('rpi_uptime_minutes', sa.BigInteger(), nullable=False),
+    sa.Column('wr_servo_state', sa.String(length=50), nullable=True),
+    sa.Column('wr_sfp1_link', sa.Boolean(), nullable=True),
+    sa.Column('wr_sfp2_link', sa.Boolean(), nullable=True),
+    sa.Column('wr_sfp1_tx', sa.BigInteger(), nullable=True),
+    sa.Column('wr_sfp1_rx', sa.BigInteger(), nullable=True),
+    sa.Column('wr_sfp2_tx', sa.BigInteger(), nullable=True),
+    sa.Column('wr_sfp2_rx', sa.BigInteger(), nullable=True),
+    sa.Column('wr_phase_setp', sa.Integer(), nullable=True),
+    sa.Column('wr_rtt', sa.Integer(), nullable=True),
+    sa.Column('wr_crtt', sa.Integer(), nullable=True),
+    sa.Column('wr_clck_offset', sa.Integer(), nullable=True),
+    sa.Column('wr_updt_cnt', sa.Integer(), nullable=True),
+    sa.Column('wr_temp', sa.Numeric(), nullable=True),
+    sa.Column('wr_host', sa.String(length=100), nullable=True),
+    sa.ForeignKeyConstraint(['hardware_id'], ['hardware.hardware_id'], onupdate='CASCADE', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('hardware_id')
+    )
+
+    # statement level triggers keep status_latest up to date from the
+    # transition table of the rows written to status.
+    op.execute(
+        "CREATE OR REPLACE FUNCTION status_latest_update() RETURNS trigger AS $$\n"
+        "BEGIN\n"
+        "    INSERT INTO status_latest ({cols})\n"
+        "    SELECT DISTINCT ON (hardware_id) {cols} FROM new_rows\n"
+        "    ORDER BY hardware_id, time DESC NULLS LAST, status_id DESC\n"
+        "    ON CONFLICT (hardware_id) DO UPDATE SET {sets}\n"
+        "    WHERE status_latest.time IS NULL\n"
+        "    OR EXCLUDED.time >= status_latest.time;\n"
+        "    RETURN NULL;\n"
+        "END;\n"
+        "$$ LANGUAGE plpgsql".format(cols=columns, sets=update_columns)
+    )
+    for action in ["INSERT", "UPDATE"]:
+        op.execute(
+            "CREATE TRIGGER status_latest_{0} AFTER {1} ON status "
+            "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT "
+            "EXECUTE PROCEDURE status_latest_update()".format(action.lower(), action)
+        )
+
+    # fill in from the existing status history
+    op.execute(
+        "INSERT INTO status_latest ({cols}) "
+        "SELECT DISTINCT ON (hardware_id) {cols} FROM status "
+        "ORDER BY hardware_id, time DESC NULLS LAST, status_id DESC".format(
+            cols=columns
+        )
+    )
+
+
+def downgrade():
+    for action in ["insert", "update"]:
+        op.execute("DROP TRIGGER IF EXISTS status_latest_{0} ON status".format(action))
+    op.execute("DROP FUNCTION IF EXISTS status_latest_update()")
+    op.drop_table('status_latest')
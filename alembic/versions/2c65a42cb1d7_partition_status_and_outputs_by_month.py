@@ -0,0 +1,181 @@
+"""partition status and outputs by month
+
+Revision ID: 2c65a42cb1d7
+Revises: a7949cc11a17
+Create Date: 2026-10-17 03:05:51.228417+00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c65a42cb1d7'
+down_revision = 'a7949cc11a17'
+branch_labels = None
+depends_on = None
+
+# number of months after the current one to create partitions for, after
+# that the partitions are created by CMSession.create_time_partitions
+months_ahead = 3
+
+
+def status_columns(partitioned):
+    return [
+        sa.Column('status_id', sa.BigInteger(), sa.Identity(always=True), nullable=False),
+        sa.Column('hostname', sa.String(length=100), nullable=False),
+        sa.Column('time', sa.DateTime(timezone=True), nullable=not partitioned),
+        sa.Column('rpi_cpu_temp', sa.Numeric(), nullable=False),
+        sa.Column('sdr_temp', sa.Numeric(), nullable=False),
+        sa.Column('avg_cpu_usage', sa.Numeric(), nullable=False),
+        sa.Column('bytes_recorded', sa.BigInteger(), nullable=False),
+        sa.Column('rem_nfs_storage_cap', sa.BigInteger(), nullable=False),
+        sa.Column('rem_rpi_storage_cap', sa.BigInteger(), nullable=False),
+        sa.Column('rpi_uptime_minutes', sa.BigInteger(), nullable=False),
+        sa.Column('hardware_id', sa.Integer(), nullable=False),
+        sa.Column('wr_servo_state', sa.String(length=50), nullable=True),
+        sa.Column('wr_sfp1_link', sa.Boolean(), nullable=True),
+        sa.Column('wr_sfp2_link', sa.Boolean(), nullable=True),
+        sa.Column('wr_sfp1_tx', sa.BigInteger(), nullable=True),
+        sa.Column('wr_sfp1_rx', sa.BigInteger(), nullable=True),
+        sa.Column('wr_sfp2_tx', sa.BigInteger(), nullable=True),
+        sa.Column('wr_sfp2_rx', sa.BigInteger(), nullable=True),
+        sa.Column('wr_phase_setp', sa.Integer(), nullable=True),
+        sa.Column('wr_rtt', sa.Integer(), nullable=True),
+        sa.Column('wr_crtt', sa.Integer(), nullable=True),
+        sa.Column('wr_clck_offset', sa.Integer(), nullable=True),
+        sa.Column('wr_updt_cnt', sa.Integer(), nullable=True),
+        sa.Column('wr_temp', sa.Numeric(), nullable=True),
+        sa.Column('wr_host', sa.String(length=100), nullable=True),
+        sa.ForeignKeyConstraint(['hardware_id'], ['hardware.hardware_id'], onupdate='CASCADE', ondelete='CASCADE', name='status_hardware_id_fkey'),
+        sa.PrimaryKeyConstraint(*(['status_id', 'time'] if partitioned else ['status_id'])),
+    ]
+
+
+def outputs_columns(partitioned):
+    return [
+        sa.Column('output_id', sa.BigInteger(), sa.Identity(always=True), nullable=False),
+        sa.Column('hardware_id', sa.Integer(), nullable=False),
+        sa.Column('metadata_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('average_db', sa.Numeric(precision=21, scale=16), nullable=False),
+        sa.Column('max_db', sa.Numeric(precision=21, scale=16), nullable=False),
+        sa.Column('median_db', sa.Numeric(precision=21, scale=16), nullable=False),
+        sa.Column('std_dev', sa.Numeric(), nullable=False),
+        sa.Column('kurtosis', sa.Numeric(), nullable=False),
+        sa.ForeignKeyConstraint(['hardware_id'], ['hardware.hardware_id'], onupdate='CASCADE', ondelete='CASCADE', name='outputs_hardware_id_fkey'),
+        sa.ForeignKeyConstraint(['metadata_id'], ['metadata.metadata_id'], onupdate='CASCADE', ondelete='CASCADE', name='outputs_metadata_id_fkey'),
+        sa.PrimaryKeyConstraint(*(['output_id', 'created_at'] if partitioned else ['output_id'])),
+    ]
+
+
+tables = {
+    'status': ('status_id', 'time', status_columns),
+    'outputs': ('output_id', 'created_at', outputs_columns),
+}
+
+
+def set_status_latest_triggers(create):
+    for action in ["insert", "update"]:
+        if create:
+            op.execute(
+                "CREATE TRIGGER status_latest_{0} AFTER {1} ON status "
+                "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT "
+                "EXECUTE PROCEDURE status_latest_update()".format(action, action.upper())
+            )
+        else:
+            op.execute("DROP TRIGGER IF EXISTS status_latest_{0} ON status".format(action))
+
+
+index_names = {
+    'status': ['ix_status_hardware_id_time', 'ix_status_time_brin'],
+    'outputs': ['ix_outputs_hardware_id_metadata_id_created_at', 'ix_outputs_created_at_brin'],
+}
+
+
+def create_indexes(table):
+    if table == 'status':
+        op.create_index('ix_status_hardware_id_time', 'status', ['hardware_id', 'time'], unique=False)
+        op.create_index('ix_status_time_brin', 'status', ['time'], unique=False, postgresql_using='brin')
+    else:
+        op.create_index('ix_outputs_hardware_id_metadata_id_created_at', 'outputs', ['hardware_id', 'metadata_id', 'created_at'], unique=False)
+        op.create_index('ix_outputs_created_at_brin', 'outputs', ['created_at'], unique=False, postgresql_using='brin')
+
+
+def replace_table(table, partitioned):
+    """Copy a table into a new (un)partitioned version of it."""
+    id_column, time_column, columns = tables[table]
+    old = table + '_old'
+
+    # move the old table and the objects named after it out of the way, the
+    # foreign keys are named explicitly so their names do not need freeing up
+    op.execute("ALTER TABLE {0} RENAME TO {1}".format(table, old))
+    op.execute("ALTER TABLE {0} RENAME CONSTRAINT {1}_pkey TO {0}_pkey".format(old, table))
+    op.execute(
+        "ALTER SEQUENCE {0}_{1}_seq RENAME TO {2}_{1}_seq".format(table, id_column, old)
+    )
+    for index in index_names[table]:
+        op.execute("DROP INDEX IF EXISTS {0}".format(index))
+
+    if partitioned:
+        op.create_table(table, *columns(True), postgresql_partition_by='RANGE ({0})'.format(time_column))
+        op.execute("CREATE TABLE {0}_default PARTITION OF {0} DEFAULT".format(table))
+        # monthly (UTC) partitions from the first month with data through
+        # months_ahead months after the current one
+        op.execute(
+            "DO $$\n"
+            "DECLARE\n"
+            "    month timestamp;\n"
+            "BEGIN\n"
+            "    FOR month IN SELECT generate_series(\n"
+            "        date_trunc('month', coalesce(\n"
+            "            (SELECT min({t}) FROM {old}), now()) AT TIME ZONE 'UTC'),\n"
+            "        date_trunc('month', now() AT TIME ZONE 'UTC')\n"
+            "            + interval '{n} months',\n"
+            "        interval '1 month')\n"
+            "    LOOP\n"
+            "        EXECUTE 'CREATE TABLE '\n"
+            "            || quote_ident('{table}_y' || to_char(month, 'YYYY')\n"
+            "                || 'm' || to_char(month, 'MM'))\n"
+            "            || ' PARTITION OF {table} FOR VALUES FROM ('\n"
+            "            || quote_literal(month AT TIME ZONE 'UTC') || ') TO ('\n"
+            "            || quote_literal((month + interval '1 month') AT TIME ZONE 'UTC')\n"
+            "            || ')';\n"
+            "    END LOOP;\n"
+            "END;\n"
+            "$$".format(t=time_column, old=old, n=months_ahead, table=table)
+        )
+    else:
+        op.create_table(table, *columns(False))
+
+    names = [c.name for c in columns(partitioned) if isinstance(c, sa.Column)]
+    select = ", ".join(
+        # the partition key cannot be null, put rows without a time at the epoch
+        "coalesce(time, 'epoch')" if partitioned and name == 'time' else name
+        for name in names
+    )
+    op.execute(
+        "INSERT INTO {0} ({1}) OVERRIDING SYSTEM VALUE SELECT {2} FROM {3}".format(
+            table, ", ".join(names), select, old
+        )
+    )
+    op.execute(
+        "SELECT setval(pg_get_serial_sequence('{0}', '{1}'), "
+        "coalesce(max({1}), 0) + 1, false) FROM {0}".format(table, id_column)
+    )
+    op.execute("DROP TABLE {0} CASCADE".format(old))
+    create_indexes(table)
+
+
+def upgrade():
+    set_status_latest_triggers(create=False)
+    for table in tables:
+        replace_table(table, partitioned=True)
+    set_status_latest_triggers(create=True)
+
+
+def downgrade():
+    set_status_latest_triggers(create=False)
+    for table in tables:
+        replace_table(table, partitioned=False)
+    set_status_latest_triggers(create=True)
@@ -0,0 +1,68 @@
+"""add status_hourly
+
+Revision ID: 5d1f0b6e83a2
+Revises: 2c65a42cb1d7
+Create Date: 2026-10-17 04:12:37.581902+00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d1f0b6e83a2'
+down_revision = '2c65a42cb1d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('status_hourly',
+    sa.Column('hardware_id', sa.Integer(), nullable=False),
+    sa.Column('hour', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('n_samples', sa.Integer(), nullable=False),
+    sa.Column('first_time', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('last_time', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('hostname', sa.String(length=100), nullable=False),
+    sa.Column('rpi_cpu_temp_min', sa.Numeric(), nullable=False),
+    sa.Column('rpi_cpu_temp_max', sa.Numeric(), nullable=False),
+    sa.Column('rpi_cpu_temp_mean', sa.Float(), nullable=False),
+    sa.Column('sdr_temp_min', sa.Numeric(), nullable=False),
+    sa.Column('sdr_temp_max', sa.Numeric(), nullable=False),
+    sa.Column('sdr_temp_mean', sa.Float(), nullable=False),
+    sa.Column('avg_cpu_usage_min', sa.Numeric(), nullable=False),
+    sa.Column('avg_cpu_usage_max', sa.Numeric(), nullable=False),
+    sa.Column('avg_cpu_usage_mean', sa.Float(), nullable=False),
+    sa.Column('bytes_recorded_min', sa.BigInteger(), nullable=False),
+    sa.Column('bytes_recorded_max', sa.BigInteger(), nullable=False),
+    sa.Column('bytes_recorded_mean', sa.Float(), nullable=False),
+    sa.Column('rem_nfs_storage_cap_min', sa.BigInteger(), nullable=False),
+    sa.Column('rem_nfs_storage_cap_max', sa.BigInteger(), nullable=False),
+    sa.Column('rem_nfs_storage_cap_mean', sa.Float(), nullable=False),
+    sa.Column('rem_rpi_storage_cap_min', sa.BigInteger(), nullable=False),
+    sa.Column('rem_rpi_storage_cap_max', sa.BigInteger(), nullable=False),
+    sa.Column('rem_rpi_storage_cap_mean', sa.Float(), nullable=False),
+    sa.Column('rpi_uptime_minutes_min', sa.BigInteger(), nullable=False),
+    sa.Column('rpi_uptime_minutes_max', sa.BigInteger(), nullable=False),
+    sa.Column('rpi_uptime_minutes_mean', sa.Float(), nullable=False),
+    sa.Column('wr_servo_state', sa.String(length=50), nullable=True),
+    sa.Column('wr_sfp1_link', sa.Boolean(), nullable=True),
+    sa.Column('wr_sfp2_link', sa.Boolean(), nullable=True),
+    sa.Column('wr_sfp1_tx', sa.BigInteger(), nullable=True),
+    sa.Column('wr_sfp1_rx', sa.BigInteger(), nullable=True),
+    sa.Column('wr_sfp2_tx', sa.BigInteger(), nullable=True),
+    sa.Column('wr_sfp2_rx', sa.BigInteger(), nullable=True),
+    sa.Column('wr_phase_setp', sa.Integer(), nullable=True),
+    sa.Column('wr_rtt', sa.Integer(), nullable=True),
+    sa.Column('wr_crtt', sa.Integer(), nullable=True),
+    sa.Column('wr_clck_offset', sa.Integer(), nullable=True),
+    sa.Column('wr_updt_cnt', sa.Integer(), nullable=True),
+    sa.Column('wr_temp', sa.Numeric(), nullable=True),
+    sa.Column('wr_host', sa.String(length=100), nullable=True),
+    sa.ForeignKeyConstraint(['hardware_id'], ['hardware.hardware_id'], onupdate='CASCADE', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('hardware_id', 'hour')
+    )
+
+
+def downgrade():
+    op.drop_table('status_hourly')
@@ -0,0 +1,71 @@
+"""use floats for telemetry columns
+
+Revision ID: 8e3c1a9f4b27
+Revises: 5d1f0b6e83a2
+Create Date: 2026-10-17 09:41:05.218337+00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e3c1a9f4b27'
+down_revision = '5d1f0b6e83a2'
+branch_labels = None
+depends_on = None
+
+# columns holding measurements, by table, with their old types
+float_columns = {
+    'status': {
+        'rpi_cpu_temp': 'numeric',
+        'sdr_temp': 'numeric',
+        'avg_cpu_usage': 'numeric',
+        'wr_temp': 'numeric',
+    },
+    'status_latest': {
+        'rpi_cpu_temp': 'numeric',
+        'sdr_temp': 'numeric',
+        'avg_cpu_usage': 'numeric',
+        'wr_temp': 'numeric',
+    },
+    'status_hourly': {
+        'rpi_cpu_temp_min': 'numeric',
+        'rpi_cpu_temp_max': 'numeric',
+        'sdr_temp_min': 'numeric',
+        'sdr_temp_max': 'numeric',
+        'avg_cpu_usage_min': 'numeric',
+        'avg_cpu_usage_max': 'numeric',
+        'wr_temp': 'numeric',
+    },
+    'outputs': {
+        'average_db': 'numeric(21, 16)',
+        'max_db': 'numeric(21, 16)',
+        'median_db': 'numeric(21, 16)',
+        'std_dev': 'numeric',
+        'kurtosis': 'numeric',
+    },
+}
+
+
+def alter_types(to_float):
+    # one ALTER TABLE per table so that each table is rewritten only once,
+    # on a partitioned table it changes all the partitions
+    for table, columns in float_columns.items():
+        op.execute(
+            'ALTER TABLE {t} '.format(t=table)
+            + ', '.join(
+                'ALTER COLUMN {c} TYPE {n} USING {c}::{n}'.format(
+                    c=column, n='double precision' if to_float else old_type
+                )
+                for column, old_type in columns.items()
+            )
+        )
+
+
+def upgrade():
+    alter_types(to_float=True)
+
+
+def downgrade():
+    alter_types(to_float=False)
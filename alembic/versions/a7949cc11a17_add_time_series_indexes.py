@@ -0,0 +1,34 @@
+"""add time series indexes
+
+Revision ID: a7949cc11a17
+Revises: 269a340bf877
+Create Date: 2026-10-17 02:52:37.481920+00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7949cc11a17'
+down_revision = '269a340bf877'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Build the indexes concurrently (outside of a transaction) so the
+    # ingest into these large tables is not blocked while they are built.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_status_hardware_id_time', 'status', ['hardware_id', 'time'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_status_time_brin', 'status', ['time'], unique=False, postgresql_using='brin', postgresql_concurrently=True)
+        op.create_index('ix_outputs_hardware_id_metadata_id_created_at', 'outputs', ['hardware_id', 'metadata_id', 'created_at'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_outputs_created_at_brin', 'outputs', ['created_at'], unique=False, postgresql_using='brin', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_outputs_created_at_brin', table_name='outputs', postgresql_concurrently=True)
+        op.drop_index('ix_outputs_hardware_id_metadata_id_created_at', table_name='outputs', postgresql_concurrently=True)
+        op.drop_index('ix_status_time_brin', table_name='status', postgresql_concurrently=True)
+        op.drop_index('ix_status_hardware_id_time', table_name='status', postgresql_concurrently=True)
@@ -0,0 +1,64 @@
+"""add output_spectra
+
+Revision ID: b41f7d2c9e05
+Revises: 8e3c1a9f4b27
+Create Date: 2026-10-17 11:26:48.703154+00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b41f7d2c9e05'
+down_revision = '8e3c1a9f4b27'
+branch_labels = None
+depends_on = None
+
+# number of months after the current one to create partitions for, after
+# that the partitions are created by CMSession.create_time_partitions
+months_ahead = 3
+
+
+def upgrade():
+    op.create_table('output_spectra',
+    sa.Column('output_id', sa.BigInteger(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('n_bins', sa.Integer(), nullable=False),
+    sa.Column('mean_power', sa.LargeBinary(), nullable=False),
+    sa.Column('max_power', sa.LargeBinary(), nullable=False),
+    sa.Column('median_power', sa.LargeBinary(), nullable=False),
+    sa.CheckConstraint('length(mean_power) = 4 * n_bins AND length(max_power) = 4 * n_bins AND length(median_power) = 4 * n_bins', name='output_spectra_n_bins_check'),
+    sa.ForeignKeyConstraint(['output_id', 'created_at'], ['outputs.output_id', 'outputs.created_at'], onupdate='CASCADE', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('output_id', 'created_at'),
+    postgresql_partition_by='RANGE (created_at)'
+    )
+    op.execute("CREATE TABLE output_spectra_default PARTITION OF output_spectra DEFAULT")
+    # monthly (UTC) partitions from the current month through months_ahead
+    # months after it
+    op.execute(
+        "DO $$\n"
+        "DECLARE\n"
+        "    month timestamp;\n"
+        "BEGIN\n"
+        "    FOR month IN SELECT generate_series(\n"
+        "        date_trunc('month', now() AT TIME ZONE 'UTC'),\n"
+        "        date_trunc('month', now() AT TIME ZONE 'UTC')\n"
+        "            + interval '{n} months',\n"
+        "        interval '1 month')\n"
+        "    LOOP\n"
+        "        EXECUTE 'CREATE TABLE '\n"
+        "            || quote_ident('output_spectra_y' || to_char(month, 'YYYY')\n"
+        "                || 'm' || to_char(month, 'MM'))\n"
+        "            || ' PARTITION OF output_spectra FOR VALUES FROM ('\n"
+        "            || quote_literal(month AT TIME ZONE 'UTC') || ') TO ('\n"
+        "            || quote_literal((month + interval '1 month') AT TIME ZONE 'UTC')\n"
+        "            || ')';\n"
+        "    END LOOP;\n"
+        "END;\n"
+        "$$".format(n=months_ahead)
+    )
+
+
+def downgrade():
+    op.drop_table('output_spectra')
@@ -0,0 +1,220 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""
+Check that a database matches the schema defined by the table classes.
+
+A full check reflects the live schema, which is slow. Once a database has
+passed it, a fingerprint (the alembic revision of the database and a hash of
+the table definitions) is cached on disk, and later checks only compare the
+fingerprint unless it has changed.
+"""
+
+import hashlib
+import json
+import os
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+
+# file holding the fingerprints of the databases that passed a full check
+fingerprint_file = os.path.join(
+    os.path.expanduser("~"), ".cache", "nrdz_toolkit", "schema_fingerprints.json"
+)
+
+
+def check_connection(session):
+    """
+    Check whether the database can be reached.
+
+    Parameters
+    ----------
+    session : Session object
+        Session to test.
+
+    Returns
+    -------
+    bool
+        True if a trivial query succeeds.
+
+    """
+    try:
+        session.execute(text("SELECT 1"))
+    except (DBAPIError, OSError):
+        return False
+    return True
+
+
+def is_valid_database(base, session):
+    """
+    Check that the live database has all the tables and columns of a base.
+
+    Every table of the base's metadata must exist with all of its columns,
+    and the columns must have the same Python type and nullability. Extra
+    tables and columns in the database are allowed.
+
+    Parameters
+    ----------
+    base : declarative base
+        Base holding the table definitions (usually CMDeclarativeBase).
+    session : Session object
+        Session connected to the database to check.
+
+    Returns
+    -------
+    bool
+        True if the database matches.
+
+    """
+    inspector = inspect(session.connection())
+    db_tables = set(inspector.get_table_names())
+
+    valid = True
+    for table in base.metadata.sorted_tables:
+        if table.name not in db_tables:
+            print("table {t} is missing from the database".format(t=table.name))
+            valid = False
+            continue
+        db_columns = {col["name"]: col for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            db_column = db_columns.get(column.name)
+            if db_column is None:
+                print(
+                    "column {t}.{c} is missing from the database".format(
+                        t=table.name, c=column.name
+                    )
+                )
+                valid = False
+                continue
+            if _python_type(column.type) != _python_type(db_column["type"]):
+                print(
+                    "column {t}.{c} has type {d} in the database, expected "
+                    "{e}".format(
+                        t=table.name, c=column.name, d=db_column["type"], e=column.type
+                    )
+                )
+                valid = False
+            if column.nullable != db_column["nullable"]:
+                print(
+                    "column {t}.{c} nullability differs from the "
+                    "database".format(t=table.name, c=column.name)
+                )
+                valid = False
+    return valid
+
+
+def _python_type(sqltype):
+    """Get the Python type of a column type, None if it is not known."""
+    try:
+        return sqltype.python_type
+    except NotImplementedError:
+        return None
+
+
+def metadata_hash(base):
+    """
+    Hash the table definitions of a base.
+
+    Parameters
+    ----------
+    base : declarative base
+        Base holding the table definitions.
+
+    Returns
+    -------
+    str
+        Hex digest, changes whenever a table, column, column type,
+        nullability or primary key changes.
+
+    """
+    definition = []
+    for table in sorted(base.metadata.tables.values(), key=lambda t: t.name):
+        definition.append(
+            [
+                table.name,
+                [
+                    [col.name, str(col.type), col.nullable, col.primary_key]
+                    for col in table.columns
+                ],
+            ]
+        )
+    return hashlib.sha256(json.dumps(definition).encode()).hexdigest()
+
+
+def get_alembic_revision(session):
+    """
+    Get the alembic revision of a database.
+
+    Returns
+    -------
+    str or None
+        Current revision, None if the database is not managed by alembic.
+
+    """
+    if not inspect(session.connection()).has_table("alembic_version"):
+        return None
+    return session.execute(text("SELECT version_num FROM alembic_version")).scalar()
+
+
+def get_fingerprint(base, session):
+    """Get the fingerprint of a database: its alembic revision and the metadata hash."""
+    return {
+        "revision": get_alembic_revision(session),
+        "metadata_hash": metadata_hash(base),
+    }
+
+
+def _read_fingerprints():
+    try:
+        with open(fingerprint_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _fingerprint_key(session):
+    return make_url(session.get_bind().url).render_as_string(hide_password=True)
+
+
+def check_database(base, session):
+    """
+    Check a database against a base, skipping the full check when possible.
+
+    The full check (`is_valid_database`) is only run if the fingerprint of the
+    database differs from the one cached when it last passed, after which the
+    new fingerprint is cached. The cache is best effort, if it cannot be
+    written the full check runs every time.
+
+    Parameters
+    ----------
+    base : declarative base
+        Base holding the table definitions (usually CMDeclarativeBase).
+    session : Session object
+        Session connected to the database to check.
+
+    Returns
+    -------
+    bool
+        True if the database matches.
+
+    """
+    fingerprint = get_fingerprint(base, session)
+    key = _fingerprint_key(session)
+    if _read_fingerprints().get(key) == fingerprint:
+        return True
+    if not is_valid_database(base, session):
+        return False
+
+    fingerprints = _read_fingerprints()
+    fingerprints[key] = fingerprint
+    try:
+        os.makedirs(os.path.dirname(fingerprint_file), exist_ok=True)
+        temp_file = fingerprint_file + ".{p}.tmp".format(p=os.getpid())
+        with open(temp_file, "w") as f:
+            json.dump(fingerprints, f, indent=1)
+        os.replace(temp_file, fingerprint_file)
+    except OSError:
+        pass
+    return True
@@ -9,7 +9,11 @@ your database and configure CM to find it.
 
 """
 
+import os
 import os.path as op
+import threading
+import time
+import weakref
 from abc import ABCMeta
 from sqlalchemy import create_engine
 from sqlalchemy.ext.automap import automap_base
@@ -18,10 +22,118 @@ import json
 
 
 from . import CMDeclarativeBase
-from .ntk_session import CMSession
+from .ntk_session import AsyncCMSession, CMSession
 
 default_config_file = 'db_config.json'
 
+# connection pool settings that can be given in a database entry of the config
+# file, they are passed on to `create_engine`
+pool_option_names = [
+    "pool_size",
+    "max_overflow",
+    "pool_timeout",
+    "pool_recycle",
+    "pool_pre_ping",
+]
+
+# DB objects made by connect_to_cm_db, keyed by (config path, db name)
+_db_cache = {}
+_db_cache_lock = threading.Lock()
+
+# engines whose pools are reset in child processes after a fork
+_engines = weakref.WeakSet()
+
+
+def _dispose_engines_after_fork():
+    """
+    Drop the connection pools inherited by a forked child process.
+
+    The child must not use the parent's connections, which share its sockets.
+    The pools are replaced without closing the connections, which the parent
+    may still be using.
+    """
+    for engine in list(_engines):
+        engine = getattr(engine, "sync_engine", engine)
+        engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_dispose_engines_after_fork)
+
+
+class ReplicaSet(object):
+    """
+    Read replicas of a database, used in turn (round-robin).
+
+    A replica is checked (with a trivial query) before it is first used. It is
+    taken out of the rotation when a connection to it fails and is checked
+    again after check_interval seconds, so a replica that goes down fails at
+    most the queries already running on it.
+
+    Parameters
+    ----------
+    engines : list of Engine objects
+        Engines of the replicas.
+    check_interval : float
+        Time (in seconds) after which a failed replica is checked again.
+
+    """
+
+    def __init__(self, engines, check_interval=30.0):
+        from sqlalchemy import event
+
+        self.engines = list(engines)
+        self.check_interval = check_interval
+        self._next = 0
+        # time each replica was found to be down, new replicas are unverified
+        self._failed = {engine: float("-inf") for engine in self.engines}
+        # reentrant, a failed health check reports the error from inside choose
+        self._lock = threading.RLock()
+        for engine in self.engines:
+            event.listen(engine, "handle_error", self._handle_error)
+
+    def _handle_error(self, context):
+        if context.is_disconnect or context.connection is None:
+            engine = context.engine
+            with self._lock:
+                self._failed[engine] = time.monotonic()
+
+    def _is_healthy(self, engine):
+        from sqlalchemy import text
+        from sqlalchemy.exc import DBAPIError
+
+        failed_at = self._failed.get(engine)
+        if failed_at is None:
+            return True
+        if time.monotonic() - failed_at < self.check_interval:
+            return False
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        except (DBAPIError, OSError):
+            self._failed[engine] = time.monotonic()
+            return False
+        self._failed.pop(engine, None)
+        return True
+
+    def choose(self):
+        """
+        Get the next healthy replica.
+
+        Returns
+        -------
+        Engine object or None
+            Engine of the replica, None if no replica is healthy.
+
+        """
+        with self._lock:
+            for _ in range(len(self.engines)):
+                engine = self.engines[self._next]
+                self._next = (self._next + 1) % len(self.engines)
+                if self._is_healthy(engine):
+                    return engine
+        return None
+
 
 class DB(object, metaclass=ABCMeta):
     """
@@ -33,13 +145,26 @@ class DB(object, metaclass=ABCMeta):
     """
 
     engine = None
-    sessionmaker = sessionmaker(class_=CMSession)
+    sessionmaker = None
     sqlalchemy_base = None
+    replicas = None
 
-    def __init__(self, sqlalchemy_base, db_url):  # noqa
+    def __init__(  # noqa
+        self, sqlalchemy_base, db_url, pool_options=None, replica_urls=None
+    ):
         self.sqlalchemy_base = CMDeclarativeBase
-        self.engine = create_engine(db_url)
-        self.sessionmaker.configure(bind=self.engine)
+        self.engine = create_engine(db_url, **(pool_options or {}))
+        _engines.add(self.engine)
+        if replica_urls:
+            replica_engines = [
+                create_engine(url, **(pool_options or {})) for url in replica_urls
+            ]
+            for engine in replica_engines:
+                _engines.add(engine)
+            self.replicas = ReplicaSet(replica_engines)
+        self.sessionmaker = sessionmaker(
+            class_=CMSession, bind=self.engine, replicas=self.replicas
+        )
 
 
 class DeclarativeDB(DB):
@@ -50,11 +175,21 @@ class DeclarativeDB(DB):
     ----------
     db_url : str
         Database location.
+    pool_options : dict
+        Connection pool settings passed on to `create_engine` (e.g.
+        pool_size, max_overflow, pool_timeout, pool_recycle, pool_pre_ping).
+    replica_urls : list of str
+        Locations of read replicas of the database.
 
     """
 
-    def __init__(self, db_url):
-        super(DeclarativeDB, self).__init__(CMDeclarativeBase, db_url)
+    def __init__(self, db_url, pool_options=None, replica_urls=None):
+        super(DeclarativeDB, self).__init__(
+            CMDeclarativeBase,
+            db_url,
+            pool_options=pool_options,
+            replica_urls=replica_urls,
+        )
 
     def create_tables(self):
         """Create all CM tables."""
@@ -71,27 +206,83 @@ class AutomappedDB(DB):
 
     This is intended for use with the production CM database. __init__()
     raises an exception if the existing database does not match the schema
-    defined in the SQLAlchemy initialization magic.
+    defined in the SQLAlchemy initialization magic. The full comparison is
+    only run when the database's alembic revision or the table definitions
+    changed since it last passed (see `db_check.check_database`).
 
     Parameters
     ----------
     db_url : str
         Database location.
+    pool_options : dict
+        Connection pool settings passed on to `create_engine` (e.g.
+        pool_size, max_overflow, pool_timeout, pool_recycle, pool_pre_ping).
+    replica_urls : list of str
+        Locations of read replicas of the database.
 
     """
 
-    def __init__(self, db_url):
-        super(AutomappedDB, self).__init__(automap_base(), db_url)
+    def __init__(self, db_url, pool_options=None, replica_urls=None):
+        super(AutomappedDB, self).__init__(
+            automap_base(),
+            db_url,
+            pool_options=pool_options,
+            replica_urls=replica_urls,
+        )
 
-        from .db_check import is_valid_database
+        from .db_check import check_database
 
         with self.sessionmaker() as session:
-            if not is_valid_database(CMDeclarativeBase, session):
+            if not check_database(CMDeclarativeBase, session):
                 raise RuntimeError(
                     "database {0} does not match expected schema".format(db_url)
                 )
 
 
+class AsyncDB(object):
+    """
+    asyncio CM database object -- attaches to an existing CM database.
+
+    Sessions made by its sessionmaker are `AsyncCMSession` objects sharing an
+    async connection pool. PostgreSQL URLs without an async driver are
+    switched to asyncpg. Requires asyncpg.
+
+    Parameters
+    ----------
+    db_url : str
+        Database location.
+    pool_options : dict
+        Connection pool settings passed on to `create_async_engine` (e.g.
+        pool_size, max_overflow, pool_timeout, pool_recycle, pool_pre_ping).
+
+    """
+
+    def __init__(self, db_url, pool_options=None):
+        from sqlalchemy.engine import make_url
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        url = make_url(db_url)
+        if url.drivername in ["postgresql", "postgresql+psycopg2"]:
+            url = url.set(drivername="postgresql+asyncpg")
+        try:
+            self.engine = create_async_engine(url, **(pool_options or {}))
+        except ImportError as err:  # pragma: no cover
+            raise ImportError(
+                "asyncpg must be installed to use an async database connection."
+            ) from err
+        _engines.add(self.engine)
+        self.sqlalchemy_base = CMDeclarativeBase
+        # objects are used after commits in async code, where expired
+        # attributes cannot be lazily reloaded
+        self.sessionmaker = async_sessionmaker(
+            self.engine, class_=AsyncCMSession, expire_on_commit=False
+        )
+
+    async def dispose(self):
+        """Close all the connections of the pool."""
+        await self.engine.dispose()
+
+
 class CMSessionWrapper():
     """
     Class to handle when a session may already exist.
@@ -166,9 +357,9 @@ def get_cm_argument_parser():
     return p
 
 
-def connect_to_cm_db(args, check_connect=True):
+def _get_db_config(args):
     """
-    Get a DB object that is connected to the CM database.
+    Get the entry of a database in the CM config file.
 
     Parameters
     ----------
@@ -176,13 +367,17 @@ def connect_to_cm_db(args, check_connect=True):
         The result of calling `parse_args` on an `argparse.ArgumentParser`
         instance created by calling `get_cm_argument_parser()`. Alternatively,
         it can be None to use the full defaults.
-    check_connect : bool
-        Option to test the database connection.
 
     Returns
     -------
-    DB object
-        An instance of the `DB` class providing access to the CM database.
+    config_path : str
+        Path to the config file.
+    db_name : str
+        Name of the database.
+    db_data : dict
+        Entry of the database in the "databases" section, with at least the
+        "url" and "mode" items and optionally connection pool settings (see
+        `pool_option_names`).
 
     """
     if args is None:
@@ -231,21 +426,99 @@ def connect_to_cm_db(args, check_connect=True):
             "the DB named {0!r} in {1!r}".format(db_name, config_path)
         )
 
+    return config_path, db_name, db_data
+
+
+def _get_pool_options(db_data):
+    """Get the connection pool settings from a database entry of the config."""
+    return {name: db_data[name] for name in pool_option_names if name in db_data}
+
+
+def clear_db_cache():
+    """Forget the DB objects cached by `connect_to_cm_db` and close their pools."""
+    with _db_cache_lock:
+        for db in _db_cache.values():
+            db.engine.dispose()
+            if db.replicas is not None:
+                for engine in db.replicas.engines:
+                    engine.dispose()
+        _db_cache.clear()
+
+
+def connect_to_cm_db(args, check_connect=True, use_cache=True):
+    """
+    Get a DB object that is connected to the CM database.
+
+    DB objects are cached per process by config file path and database name,
+    so repeated calls (e.g. from `CMSessionWrapper`) share one engine and its
+    connection pool rather than re-reading the config and reconnecting.
+
+    Connection pool settings (pool_size, max_overflow, pool_timeout,
+    pool_recycle and pool_pre_ping) can be given in the database entry of the
+    config file, e.g.::
+
+        "databases": {
+            "nrdz": {
+                "url": "postgresql://user@host/nrdz",
+                "mode": "production",
+                "pool_size": 10,
+                "pool_pre_ping": true,
+                "replicas": ["postgresql://user@replica1/nrdz"]
+            }
+        }
+
+    The optional "replicas" item lists read replicas, the read methods of the
+    sessions are spread over them (see `CMSession`).
+
+    Parameters
+    ----------
+    args : arguments
+        The result of calling `parse_args` on an `argparse.ArgumentParser`
+        instance created by calling `get_cm_argument_parser()`. Alternatively,
+        it can be None to use the full defaults.
+    check_connect : bool
+        Option to test the database connection. Not done again for a cached
+        DB object.
+    use_cache : bool
+        Option to use (and add to) the process-wide cache of DB objects.
+
+    Returns
+    -------
+    DB object
+        An instance of the `DB` class providing access to the CM database.
+
+    """
+    if not use_cache:
+        return _connect_to_cm_db(args, check_connect=check_connect)
+
+    if args is None:
+        key = (op.abspath(default_config_file), None)
+    else:
+        key = (op.abspath(args.cm_config_path), args.cm_db_name)
+    with _db_cache_lock:
+        db = _db_cache.get(key)
+        if db is None:
+            db = _connect_to_cm_db(args, check_connect=check_connect)
+            _db_cache[key] = db
+    return db
+
+
+def _connect_to_cm_db(args, check_connect=True):
+    """Make a DB object for `connect_to_cm_db`."""
+    config_path, db_name, db_data = _get_db_config(args)
+    db_url = db_data["url"]
+    db_mode = db_data["mode"]
+    pool_options = _get_pool_options(db_data)
+    replica_urls = db_data.get("replicas")
+
     if db_mode == "testing":
-        db = DeclarativeDB(db_url)
+        db = DeclarativeDB(
+            db_url, pool_options=pool_options, replica_urls=replica_urls
+        )
     elif db_mode == "production":
-        db = AutomappedDB(db_url)
-    else:
-        raise RuntimeError(
-            "cannot connect to CM database: unrecognized mode "
-            "{0!r} for the DB named {1!r} in {2!r}".format(
-                db_mode, db_name, config_path
-            )
+        db = AutomappedDB(
+            db_url, pool_options=pool_options, replica_urls=replica_urls
         )
-
-    if check_connect:
-        # Test database connection
-        db = AutomappedDB(db_url)
     else:
         raise RuntimeError(
             "cannot connect to CM database: unrecognized mode "
@@ -265,3 +538,44 @@ def connect_to_cm_db(args, check_connect=True):
                 )
 
     return db
+
+
+async def connect_to_cm_db_async(args, check_connect=True):
+    """
+    Get an AsyncDB object that is connected to the CM database.
+
+    The database is found in the same config file as for `connect_to_cm_db`.
+
+    Parameters
+    ----------
+    args : arguments
+        The result of calling `parse_args` on an `argparse.ArgumentParser`
+        instance created by calling `get_cm_argument_parser()`. Alternatively,
+        it can be None to use the full defaults.
+    check_connect : bool
+        Option to test the database connection.
+
+    Returns
+    -------
+    AsyncDB object
+        An instance of the `AsyncDB` class providing access to the CM database.
+
+    """
+    from sqlalchemy import text
+    from sqlalchemy.exc import DBAPIError
+
+    config_path, db_name, db_data = _get_db_config(args)
+    db = AsyncDB(db_data["url"], pool_options=_get_pool_options(db_data))
+
+    if check_connect:
+        # Test database connection
+        try:
+            async with db.engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+        except (DBAPIError, OSError) as err:
+            await db.dispose()
+            raise RuntimeError(
+                "Could not establish valid connection to database."
+            ) from err
+
+    return db
@@ -0,0 +1,281 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""
+In-process cache for the results of CMSession read methods.
+
+A cache is attached to sessions through their sessionmaker, e.g.::
+
+    db.sessionmaker.configure(query_cache=QueryCache(ttl=2))
+
+All the sessions made by that sessionmaker then share the cache. Entries
+expire after their time to live, the least recently used entries are evicted
+to keep under the entry and memory limits, and entries for tables a session
+wrote to are dropped when it commits. Writes made by other processes are
+only seen once the entries expire.
+
+`DimensionCache` is attached the same way (``dimension_cache=``) and keeps
+the hardware and metadata ids looked up while ingesting records.
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+# tables that are written by triggers when another table is written
+dependent_tables = {"status": ("status_latest",)}
+
+
+def _estimate_size(value):
+    """Estimate the memory used by a cached value in bytes."""
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_estimate_size(v) for v in value)
+    if hasattr(value, "__table__"):
+        return sys.getsizeof(value) + sum(
+            sys.getsizeof(getattr(value, c.key))
+            for c in inspect(type(value)).column_attrs
+        )
+    return sys.getsizeof(value)
+
+
+def snapshot(obj):
+    """
+    Copy a mapped object so that it can be shared between sessions.
+
+    The copy holds the column values of the object and is detached, so it can
+    be merged into any session (with ``load=False``) without a query.
+    """
+    mapper = inspect(type(obj))
+    copy = mapper.class_manager.new_instance()
+    for attr in mapper.column_attrs:
+        setattr(copy, attr.key, getattr(obj, attr.key))
+    make_transient_to_detached(copy)
+    return copy
+
+
+class QueryCache(object):
+    """
+    Thread safe TTL and LRU cache of query results.
+
+    Parameters
+    ----------
+    ttl : float
+        Time to live of the entries in seconds.
+    max_entries : int
+        Maximum number of entries.
+    max_bytes : int
+        Maximum (estimated) memory used by the cached values in bytes.
+
+    """
+
+    def __init__(self, ttl=1.0, max_entries=1024, max_bytes=64 * 2**20):
+        if ttl <= 0:
+            raise ValueError("ttl must be positive.")
+        if max_entries < 1 or max_bytes < 1:
+            raise ValueError("max_entries and max_bytes must be positive.")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Get a cached value.
+
+        Returns
+        -------
+        tuple
+            (found, value), value is None if found is False.
+
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[3]
+
+    def set(self, key, value, tables=()):
+        """
+        Cache a value.
+
+        Parameters
+        ----------
+        key : hashable
+            Key of the entry, made from the normalized query arguments.
+        value : object
+            Value to cache.
+        tables : list of str
+            Names of the tables the value was read from.
+
+        """
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (
+                time.monotonic() + self.ttl, frozenset(tables), size, value
+            )
+            self.n_bytes += size
+            while (
+                len(self._entries) > self.max_entries or self.n_bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, tables=None):
+        """
+        Drop the entries read from some tables.
+
+        Parameters
+        ----------
+        tables : list of str
+            Names of the tables that were written. All entries are dropped if
+            None.
+
+        """
+        with self._lock:
+            if tables is None:
+                self._entries.clear()
+                self.n_bytes = 0
+                return
+            tables = set(tables)
+            for table in list(tables):
+                tables.update(dependent_tables.get(table, ()))
+            for key in [
+                key for key, entry in self._entries.items() if entry[1] & tables
+            ]:
+                self._remove(key)
+
+    def clear(self):
+        """Drop all entries."""
+        self.invalidate()
+
+    def _remove(self, key):
+        self.n_bytes -= self._entries.pop(key)[2]
+
+
+# tables whose writes can change the ids cached by DimensionCache
+dimension_tables = {
+    "hardware": ("hardware", "rpi", "wrlen"),
+    "metadata": ("metadata",),
+}
+
+
+class DimensionCache(object):
+    """
+    Thread safe cache of the foreign keys used when ingesting records.
+
+    It maps sensor hostnames to hardware_id and metadata keys (the columns of
+    metadata_unique_key) to metadata_id, see `CMSession.get_hardware_ids` and
+    `CMSession.get_metadata_ids`. These rarely change, so entries are kept
+    until a session sharing the cache commits a write to the tables they
+    were read from (or until the optional time to live expires).
+
+    Parameters
+    ----------
+    ttl : float
+        Time to live of the entries in seconds, to pick up changes made by
+        other processes. Entries never expire if None.
+
+    """
+
+    def __init__(self, ttl=None):
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl must be positive.")
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {kind: {} for kind in dimension_tables}
+        self._lock = threading.Lock()
+
+    def get_many(self, kind, keys):
+        """
+        Look up a list of keys.
+
+        Parameters
+        ----------
+        kind : str
+            Kind of key, "hardware" or "metadata".
+        keys : list of hashable
+            Keys to look up.
+
+        Returns
+        -------
+        found : dict
+            Cached ids keyed by key.
+        missing : list
+            Keys that are not cached, without duplicates.
+
+        """
+        found = {}
+        missing = {}
+        now = time.monotonic()
+        with self._lock:
+            entries = self._entries[kind]
+            for key in keys:
+                if key in found:
+                    continue
+                entry = entries.get(key)
+                if entry is None or (entry[0] is not None and entry[0] < now):
+                    missing[key] = None
+                    continue
+                found[key] = entry[1]
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, list(missing)
+
+    def update(self, kind, ids):
+        """
+        Cache ids.
+
+        Parameters
+        ----------
+        kind : str
+            Kind of key, "hardware" or "metadata".
+        ids : dict
+            Ids keyed by key.
+
+        """
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[kind].update(
+                (key, (expires, value)) for key, value in ids.items()
+            )
+
+    def invalidate(self, tables=None):
+        """
+        Drop the ids read from some tables.
+
+        Parameters
+        ----------
+        tables : list of str
+            Names of the tables that were written. All ids are dropped if
+            None.
+
+        """
+        with self._lock:
+            for kind, kind_tables in dimension_tables.items():
+                if tables is None or set(tables) & set(kind_tables):
+                    self._entries[kind].clear()
+
+    def clear(self):
+        """Drop all ids."""
+        self.invalidate()
@@ -0,0 +1,328 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""
+Bulk comparison of table contents, e.g. a spool against the central database
+or a database against a restored backup.
+
+Values are compared with the rules of `CMDeclarativeBase.isclose`: integer,
+string (and other non numeric) columns must be equal, float-like columns must
+agree within the table's ``tols`` for that column (numpy's defaults
+otherwise), and null values only match null values. Array values (e.g. of
+`Float32Array` columns) must have the same shape and agree elementwise, within
+the tolerances for float arrays. The comparison is done a column at a time
+over numpy arrays rather than an object pair at a time.
+"""
+
+import datetime
+import decimal
+
+import numpy as np
+from sqlalchemy import Text, cast, func, literal_column, select, tuple_
+
+# column types compared within tolerances, all others must be equal
+_float_like = (float, decimal.Decimal)
+
+
+def _python_type(column):
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return None
+
+
+def _normalize(value):
+    """Make naive times UTC, as the spool keeps them (see `ntk_spool`)."""
+    if isinstance(value, datetime.datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+def _object_array(values):
+    """Make a 1D object array of values, keeping arrays as single values."""
+    array = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        array[i] = value
+    return array
+
+
+def _tolerances(column, tols):
+    """Get the (atol, rtol) to compare the values of a column with."""
+    if column.name in tols:
+        return tols[column.name]["atol"], tols[column.name]["rtol"]
+    # use numpy defaults
+    return 1e-08, 1e-05
+
+
+def _arrays_differ(a_val, b_val, atol, rtol):
+    """Compare two array values, float arrays within the tolerances."""
+    a_val = np.asarray(a_val)
+    b_val = np.asarray(b_val)
+    if a_val.shape != b_val.shape:
+        return True
+    if a_val.dtype.kind in "fc" or b_val.dtype.kind in "fc":
+        return not np.allclose(a_val, b_val, atol=atol, rtol=rtol)
+    return not np.array_equal(a_val, b_val)
+
+
+def _get_columns(table_class, key, ignore):
+    """Get the key and value column names of a comparison."""
+    table = table_class.__table__
+    if key is None:
+        key = [col.name for col in table.primary_key.columns]
+    key = list(key)
+    ignore = set(ignore)
+    for name in key + sorted(ignore):
+        if name not in table.columns:
+            raise ValueError(
+                "{n} is not a column of {t}.".format(n=name, t=table.name)
+            )
+    if ignore & set(key):
+        raise ValueError("key columns cannot be ignored.")
+    values = [
+        col.name
+        for col in table.columns
+        if col.name not in key and col.name not in ignore
+    ]
+    return key, values
+
+
+def _column_mismatch(column, tols, a_vals, b_vals):
+    """
+    Compare two object arrays of column values.
+
+    Returns
+    -------
+    numpy array of bool
+        True where the values differ.
+
+    """
+    a_null = np.array([val is None for val in a_vals], dtype=bool)
+    b_null = np.array([val is None for val in b_vals], dtype=bool)
+    mismatch = a_null != b_null
+    both = ~(a_null | b_null)
+    if not np.any(both):
+        return mismatch
+
+    atol, rtol = _tolerances(column, tols)
+    if any(isinstance(val, np.ndarray) for val in a_vals[both]) or any(
+        isinstance(val, np.ndarray) for val in b_vals[both]
+    ):
+        # one array per record, compared a record at a time
+        for i in np.flatnonzero(both):
+            mismatch[i] = _arrays_differ(a_vals[i], b_vals[i], atol, rtol)
+    elif issubclass(_python_type(column) or object, _float_like):
+        a_float = a_vals[both].astype(float)
+        b_float = b_vals[both].astype(float)
+        mismatch[both] |= ~np.isclose(a_float, b_float, atol=atol, rtol=rtol)
+    else:
+        mismatch[both] |= np.asarray(a_vals[both] != b_vals[both], dtype=bool)
+    return mismatch
+
+
+def compare_rows(table_class, rows_a, rows_b, key=None, ignore=()):
+    """
+    Compare two sets of records of a table.
+
+    Records are matched by their key and the matched records are compared a
+    column at a time with the `CMDeclarativeBase.isclose` rules.
+
+    Parameters
+    ----------
+    table_class : class
+        Class of the table the records belong to.
+    rows_a, rows_b : list of objects, dicts or rows
+        Records to compare, either objects of class table_class or mappings
+        keyed by column name (e.g. from ``session.execute(...).mappings()``).
+    key : list of str
+        Names of the columns that identify a record. Defaults to the primary
+        key. Use a natural key (e.g. ``["hardware_id", "time"]``) when the ids
+        are assigned independently by the two databases, as for a spool.
+    ignore : list of str
+        Names of columns to leave out of the comparison (e.g. ids).
+
+    Returns
+    -------
+    dict
+        "only_a" and "only_b" hold the keys of records missing from the other
+        set, "different" maps the keys of the matched records that differ to
+        the names of the differing columns. Keys are tuples of the key
+        column values.
+
+    """
+    key, value_columns = _get_columns(table_class, key, ignore)
+    table = table_class.__table__
+    tols = getattr(table_class, "tols", {})
+    names = key + value_columns
+    n_key = len(key)
+    time_columns = [
+        i
+        for i, name in enumerate(names)
+        if _python_type(table.c[name]) is datetime.datetime
+    ]
+
+    def _index(rows):
+        index = {}
+        for row in rows:
+            if hasattr(row, "__getitem__"):
+                values = [row[name] for name in names]
+            else:
+                values = [getattr(row, name) for name in names]
+            for i in time_columns:
+                values[i] = _normalize(values[i])
+            index[tuple(values[:n_key])] = values
+        return index
+
+    index_a = _index(rows_a)
+    index_b = _index(rows_b)
+    common = [row_key for row_key in index_a if row_key in index_b]
+    result = {
+        "only_a": [row_key for row_key in index_a if row_key not in index_b],
+        "only_b": [row_key for row_key in index_b if row_key not in index_a],
+        "different": {},
+    }
+    if len(common) == 0:
+        return result
+
+    # one object array per column, rows in the order of common
+    a_columns = [
+        _object_array(col) for col in zip(*[index_a[row_key] for row_key in common])
+    ]
+    b_columns = [
+        _object_array(col) for col in zip(*[index_b[row_key] for row_key in common])
+    ]
+
+    for i, name in enumerate(value_columns, start=n_key):
+        mismatch = _column_mismatch(table.c[name], tols, a_columns[i], b_columns[i])
+        for j in np.flatnonzero(mismatch):
+            result["different"].setdefault(common[j], []).append(name)
+    return result
+
+
+def _chunk_bounds(session, table_class, key, chunk_size):
+    """Get the key of every chunk_size-th record, in key order."""
+    table = table_class.__table__
+    key_cols = [table.c[name] for name in key]
+    numbered = select(
+        *key_cols, func.row_number().over(order_by=key_cols).label("_ntk_row")
+    ).subquery()
+    query = (
+        select(*[numbered.c[name] for name in key])
+        .where((numbered.c._ntk_row - 1) % chunk_size == 0)
+        .order_by(*[numbered.c[name] for name in key])
+    )
+    return [tuple(_normalize(val) for val in row) for row in session.execute(query)]
+
+
+def _in_range(table_class, key, lower, upper):
+    """Build the condition selecting the records with lower <= key < upper."""
+    key_tuple = tuple_(*[table_class.__table__.c[name] for name in key])
+    conditions = []
+    if lower is not None:
+        conditions.append(key_tuple >= tuple_(*lower))
+    if upper is not None:
+        conditions.append(key_tuple < tuple_(*upper))
+    return conditions
+
+
+def _chunk_hash(session, table_class, key, value_columns, lower, upper):
+    """
+    Hash the records of a key range on the database side.
+
+    Returns None if the database cannot hash (only PostgreSQL does), the
+    chunk is then always compared in full.
+    """
+    if session.get_bind(table_class).dialect.name != "postgresql":
+        return None
+    from sqlalchemy.dialects.postgresql import aggregate_order_by
+
+    table = table_class.__table__
+    cols = [table.c[name] for name in key + value_columns]
+    row_text = cast(tuple_(*cols), Text)
+    query = select(
+        func.count(),
+        func.md5(
+            func.string_agg(
+                row_text,
+                aggregate_order_by(
+                    literal_column("E'\\n'"), *[table.c[name] for name in key]
+                ),
+            )
+        ),
+    ).where(*_in_range(table_class, key, lower, upper))
+    return tuple(session.execute(query).one())
+
+
+def compare_tables(
+    table_class, session_a, session_b, key=None, ignore=(), chunk_size=10000
+):
+    """
+    Compare the contents of a table in two databases.
+
+    The records are split into chunks of about chunk_size records by key
+    range. On PostgreSQL each chunk is first hashed by the database on both
+    sides and only the chunks whose hashes differ are read and compared with
+    `compare_rows`, so identical ranges are never transferred. Identical
+    hashes mean identical records, different hashes can still hold records
+    that agree within the tolerances (e.g. after a column type change), so
+    those chunks are compared in full. Everything is read and compared when
+    either database is not PostgreSQL.
+
+    Parameters
+    ----------
+    table_class : class
+        Class of the table to compare.
+    session_a, session_b : Session objects
+        Sessions connected to the two databases.
+    key : list of str
+        Names of the columns that identify a record, see `compare_rows`.
+        Defaults to the primary key.
+    ignore : list of str
+        Names of columns to leave out of the comparison.
+    chunk_size : int
+        Number of records (of the first database) per chunk.
+
+    Returns
+    -------
+    dict
+        Differences, as returned by `compare_rows`, plus "n_chunks" and
+        "n_chunks_compared", the number of chunks and of chunks that had to
+        be read.
+
+    """
+    if not isinstance(chunk_size, int) or chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer.")
+    key, value_columns = _get_columns(table_class, key, ignore)
+    table = table_class.__table__
+
+    bounds = _chunk_bounds(session_a, table_class, key, chunk_size)
+    # the first range is open so it catches records of b before a's first key
+    ranges = list(zip([None] + bounds[1:], bounds[1:] + [None]))
+
+    result = {
+        "only_a": [],
+        "only_b": [],
+        "different": {},
+        "n_chunks": len(ranges),
+        "n_chunks_compared": 0,
+    }
+    cols = [table.c[name] for name in key + value_columns]
+    for lower, upper in ranges:
+        hash_a = _chunk_hash(session_a, table_class, key, value_columns, lower, upper)
+        hash_b = _chunk_hash(session_b, table_class, key, value_columns, lower, upper)
+        if hash_a is not None and hash_a == hash_b:
+            continue
+        result["n_chunks_compared"] += 1
+        query = select(*cols).where(*_in_range(table_class, key, lower, upper))
+        diff = compare_rows(
+            table_class,
+            session_a.execute(query).mappings().all(),
+            session_b.execute(query).mappings().all(),
+            key=key,
+            ignore=ignore,
+        )
+        result["only_a"].extend(diff["only_a"])
+        result["only_b"].extend(diff["only_b"])
+        result["different"].update(diff["different"])
+    return result
@@ -8,13 +8,381 @@ See INSTALL.md in the Git repository for instructions on how to initialize
 your database and configure M&C to find it.
 """
 
-from sqlalchemy import desc, asc
-from sqlalchemy.orm import Session
-from sqlalchemy.sql.expression import func
+import contextlib
+import datetime
+import decimal
+import functools
+import itertools
+import re
+import time
+import weakref
+
+import numpy as np
+from sqlalchemy import asc, event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.sql.expression import Insert, func
+from sqlalchemy.types import DateTime, Integer, Numeric
 from astropy.time import Time
 
+
+def _defaulted_columns(table_class):
+    """
+    Get the names of columns the database or a column default can fill in.
+
+    These columns can be left out of an insert when no record supplies a
+    value for them (e.g. identity primary keys).
+    """
+    return {
+        c.name
+        for c in table_class.__table__.columns
+        if c.identity is not None
+        or c.default is not None
+        or c.server_default is not None
+    }
+
+
+def _on_conflict(stmt, ies, columns, update):
+    """
+    Add the primary key conflict handling to a PostgreSQL insert statement.
+
+    Parameters
+    ----------
+    stmt : sqlalchemy.dialects.postgresql.Insert
+        Insert statement to add the ``ON CONFLICT`` clause to.
+    ies : list of str
+        Names of the primary key columns.
+    columns : list of str
+        Names of the columns being inserted.
+    update : bool
+        If true, update the non primary key columns of conflicting rows,
+        otherwise leave the existing rows untouched.
+
+    Returns
+    -------
+    sqlalchemy.dialects.postgresql.Insert
+        Statement returning the primary keys of the rows it inserted or
+        updated (rows left untouched are not returned).
+
+    """
+    update_dict = {col: stmt.excluded[col] for col in columns if col not in ies}
+    if update and update_dict:
+        # The special PostgreSQL insert statement lets us update
+        # existing rows via `ON CONFLICT ... DO UPDATE` syntax.
+        stmt = stmt.on_conflict_do_update(index_elements=ies, set_=update_dict)
+    else:
+        # The special PostgreSQL insert statement lets us ignore
+        # existing rows via `ON CONFLICT ... DO NOTHING` syntax.
+        stmt = stmt.on_conflict_do_nothing(index_elements=ies)
+    # The xmax trick to tell inserted from updated rows does not work on
+    # partitioned tables, so callers count the conflicting rows beforehand.
+    return stmt.returning(*[stmt.table.c[col] for col in ies])
+
+
+def _supplies_identity(table_class, columns):
+    """Check if values are given for an identity column of a table."""
+    return any(
+        table_class.__table__.c[col].identity is not None for col in columns
+    )
+
+
+# Values for GENERATED ALWAYS identity columns (e.g. ids of records copied
+# from another database) are only accepted with OVERRIDING SYSTEM VALUE.
+Insert.argument_for("postgresql", "overriding_system_value", False)
+
+
+@compiles(Insert, "postgresql")
+def _compile_insert(insert, compiler, **kw):
+    sql = compiler.visit_insert(insert, **kw)
+    if insert.dialect_options["postgresql"]["overriding_system_value"]:
+        sql = re.sub(
+            r"^(INSERT INTO \S+ \([^)]*\))",
+            r"\1 OVERRIDING SYSTEM VALUE",
+            sql,
+            count=1,
+        )
+    return sql
+
+
+def _copy_text(value):
+    """Format a value for the PostgreSQL COPY text format."""
+    if value is None:
+        return "\\N"
+    if isinstance(getattr(value, "adapted", None), (bytes, bytearray, memoryview)):
+        # bytes wrapped by the driver's bind processing (psycopg2.Binary)
+        value = value.adapted
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # bytea hex format, the backslash is escaped for COPY
+        return "\\\\x" + bytes(value).hex()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _is_value_list(value):
+    """Check if a filter value is a collection of values to match any of."""
+    return isinstance(value, (list, tuple, set))
+
+
+def _time_bound(time_attr, time, upper=False):
+    """
+    Convert an astropy Time into a value comparable with a time column.
+
+    The value is bound with the column's own type so that the database can
+    use an index on the column for the comparison. DateTime columns get a
+    timezone-aware (UTC) datetime, other columns are assumed to hold GPS
+    seconds. Integer GPS columns get the GPS second rounded towards the
+    inside of the range (down for an upper bound, up for a lower bound),
+    which gives the same matches as comparing against the exact time.
+
+    Parameters
+    ----------
+    time_attr : sqlalchemy column attribute
+        Column holding the time.
+    time : astropy Time object
+        Time to convert.
+    upper : bool
+        Whether the time is an upper bound (e.g. stoptime) or a lower bound
+        (e.g. starttime).
+
+    Returns
+    -------
+    datetime.datetime or float or int
+        Value to compare the column with.
+
+    """
+    if isinstance(time_attr.type, DateTime):
+        return time.utc.to_datetime(timezone=datetime.timezone.utc)
+    if isinstance(time_attr.type, Integer):
+        if upper:
+            return int(np.floor(time.gps))
+        return int(np.ceil(time.gps))
+    return float(time.gps)
+
+
+def _column_array(values, sqltype):
+    """
+    Convert a list of column values into a NumPy array.
+
+    DateTime values become UTC datetime64 (NULLs as NaT), numeric columns
+    with NULLs become floats with NaN, anything else is left to NumPy.
+    """
+    if isinstance(sqltype, DateTime):
+        return np.array(
+            [
+                None
+                if val is None
+                else val.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+                for val in values
+            ],
+            dtype="datetime64[us]",
+        )
+    array = np.array(values)
+    if array.dtype.kind == "O" and isinstance(sqltype, (Integer, Numeric)):
+        array = np.array(
+            [np.nan if val is None else val for val in values], dtype=float
+        )
+    return array
+
+
+def _month_start(year, month):
+    """Get the start of a month (UTC), month may be outside 1-12."""
+    year += (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    return datetime.datetime(year, month, 1, tzinfo=datetime.timezone.utc)
+
+
+def _partition_column(table_class):
+    """Get the name of the column a table is range partitioned on."""
+    partition_by = table_class.__table__.dialect_options["postgresql"]["partition_by"]
+    match = re.fullmatch(r"\s*RANGE\s*\(\s*(\w+)\s*\)\s*", partition_by or "")
+    if match is None:
+        raise ValueError(
+            "table {t} is not range partitioned on a single column.".format(
+                t=table_class.__tablename__
+            )
+        )
+    return match.group(1)
+
+
+def _open_text_output(filename, compression=None):
+    """
+    Open a text file for writing, optionally through a compressed stream.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the file to write to.
+    compression : {None, "gzip", "zstd"}
+        Compression to apply to the output stream.
+
+    Returns
+    -------
+    file object
+        Text-mode file object, close it to flush the compressed stream.
+
+    """
+    import io
+
+    if compression is None:
+        return open(filename, "w", newline="", encoding="utf-8")
+    if compression == "gzip":
+        import gzip
+
+        return gzip.open(filename, "wt", newline="", encoding="utf-8")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError as err:  # pragma: no cover
+            raise ImportError(
+                "zstandard must be installed to write zstd compressed files."
+            ) from err
+
+        raw = zstandard.ZstdCompressor().stream_writer(
+            open(filename, "wb"), closefd=True
+        )
+        return io.TextIOWrapper(raw, newline="", encoding="utf-8")
+    raise ValueError(
+        "compression must be one of None, 'gzip' or 'zstd'. "
+        "value was: {c}".format(c=compression)
+    )
+
+
+# offset between the database and local clocks (in seconds) and the
+# (monotonic) time it was measured, per engine
+_clock_offsets = weakref.WeakKeyDictionary()
+
+
+def _replica_read(method):
+    """Mark a CMSession method as a read that can be sent to a read replica."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._replica_reads():
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+# columns of metadata_unique_key, in the order of the metadata keys
+metadata_key_columns = (
+    "frequency",
+    "sample_rate",
+    "bandwidth",
+    "gain",
+    "length",
+    "interval",
+    "bit_depth",
+)
+
+
+def _metadata_key(value):
+    """
+    Normalize a metadata key given as a tuple or a dict.
+
+    Floats for the Numeric columns are converted to Decimal so that the key
+    compares equal to the values read back from the database.
+    """
+    if isinstance(value, dict):
+        value = tuple(value[col] for col in metadata_key_columns)
+    else:
+        value = tuple(value)
+    if len(value) != len(metadata_key_columns):
+        raise ValueError(
+            "metadata keys must have the values of {c}. value was: {v}".format(
+                c=metadata_key_columns, v=value
+            )
+        )
+    return tuple(
+        decimal.Decimal(repr(val)) if isinstance(val, float) else val
+        for val in value
+    )
+
+
+def _cache_key(value):
+    """Make a hashable key from a query argument."""
+    if isinstance(value, Time):
+        return ("Time", float(np.sum(value.jd1)), float(np.sum(value.jd2)))
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(value, key=repr))
+    if isinstance(value, (list, tuple)):
+        return tuple(_cache_key(v) for v in value)
+    return value
+
+
 class CMSession(Session):
-    """Primary session object that handles most DB queries."""
+    """
+    Primary session object that handles most DB queries.
+
+    Parameters
+    ----------
+    query_cache : QueryCache object
+        Optional cache for the results of the read methods, usually shared by
+        all the sessions of a sessionmaker (see `ntk_cache`).
+    dimension_cache : DimensionCache object
+        Optional cache for `get_hardware_ids` and `get_metadata_ids`, usually
+        shared by all the sessions of a sessionmaker (see `ntk_cache`).
+    clock_refresh_interval : float
+        Interval (in seconds) at which `get_current_db_time` measures the
+        offset between the local and database clocks again.
+    replicas : ReplicaSet object
+        Optional read replicas of the database (see `ntk.ReplicaSet`). The
+        read methods (e.g. `_time_filter`, `get_current_db_time`) are run on
+        a replica unless the session has uncommitted writes, everything else
+        goes to the primary database (the session's bind).
+
+    """
+
+    def __init__(
+        self,
+        *args,
+        query_cache=None,
+        dimension_cache=None,
+        clock_refresh_interval=600.0,
+        replicas=None,
+        **kwargs
+    ):
+        super(CMSession, self).__init__(*args, **kwargs)
+        self.query_cache = query_cache
+        self.dimension_cache = dimension_cache
+        self.clock_refresh_interval = clock_refresh_interval
+        self.replicas = replicas
+        self._replica_depth = 0
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        """
+        Get the engine to run a statement on.
+
+        Statements run by the read methods go to a healthy read replica if
+        there is one and this session has no uncommitted writes, everything
+        else goes to the primary database.
+        """
+        if (
+            self._replica_depth > 0
+            and self.replicas is not None
+            and not self._flushing
+            and not getattr(clause, "is_dml", False)
+            and not self.info.get("written_tables")
+            and not (self.new or self.dirty or self.deleted)
+        ):
+            engine = self.replicas.choose()
+            if engine is not None:
+                return engine
+        return super(CMSession, self).get_bind(mapper=mapper, clause=clause, **kwargs)
+
+    @contextlib.contextmanager
+    def _replica_reads(self):
+        """Send the reads made in this context to a read replica."""
+        self._replica_depth += 1
+        try:
+            yield
+        finally:
+            self._replica_depth -= 1
 
     def __enter__(self):
         """Enter the session."""
@@ -29,22 +397,663 @@ class CMSession(Session):
         self.close()
         return False  # propagate exception if any occurred
 
-    def get_current_db_time(self):
+    @_replica_read
+    def get_current_db_time(self, force=False):
         """
         Get the current time according to the database.
 
+        The offset between the local and database clocks is measured once per
+        database and measured again every clock_refresh_interval seconds, in
+        between the database time is computed from the local clock without a
+        query.
+
+        Parameters
+        ----------
+        force : bool
+            Option to query the database for its time. Note that the database
+            gives the start time of the current transaction.
+
         Returns
         -------
         astropy Time object
             Current database time as an astropy time object.
 
         """
-        db_timestamp = self.execute(func.current_timestamp()).scalar()
+        if force:
+            db_timestamp = self.execute(func.current_timestamp()).scalar()
+
+            # convert to astropy time object
+            return Time(db_timestamp)
+
+        bind = self.get_bind()
+        engine = getattr(bind, "engine", bind)
+        measured = _clock_offsets.get(engine)
+        if measured is None or (
+            time.monotonic() - measured[0] > self.clock_refresh_interval
+        ):
+            if engine.dialect.name == "postgresql":
+                # current_timestamp is the transaction start time, the offset
+                # needs the actual time
+                now_func = func.clock_timestamp()
+            else:
+                now_func = func.current_timestamp()
+            before = time.time()
+            db_timestamp = self.execute(select(now_func)).scalar()
+            after = time.time()
+            # assume the database read its clock halfway through the round trip
+            offset = Time(db_timestamp).unix - (before + after) / 2
+            measured = (time.monotonic(), offset)
+            _clock_offsets[engine] = measured
+
+        return Time(
+            datetime.datetime.fromtimestamp(
+                time.time() + measured[1], tz=datetime.timezone.utc
+            )
+        )
+
+    def _cached(self, key, tables, query):
+        """
+        Get a query result through the query cache, if there is one.
+
+        The cache is bypassed while this session has writes that are not
+        committed, so that the session always sees its own writes. Mapped
+        objects are cached as detached copies and merged into this session
+        when they are returned.
+
+        Parameters
+        ----------
+        key : tuple
+            Key of the result, made from the normalized query arguments.
+        tables : list of str
+            Names of the tables the result is read from.
+        query : callable
+            Function that runs the query and returns the result.
+
+        """
+        from . import ntk_cache
+
+        cache = self.query_cache
+        if (
+            cache is None
+            or self.info.get("written_tables")
+            or self.new
+            or self.dirty
+            or self.deleted
+        ):
+            return query()
+        found, value = cache.get(key)
+        if not found:
+            result = query()
+            if isinstance(result, list):
+                value = [ntk_cache.snapshot(obj) for obj in result]
+            else:
+                value = result
+            cache.set(key, value, tables)
+            return result
+        if isinstance(value, list):
+            return [self.merge(obj, load=False) for obj in value]
+        return value
+
+    def _mark_written(self, *tables):
+        """
+        Record that tables were written, so cached results read from them are
+        dropped when this session commits. Writes made through the session
+        are recorded automatically, this is for writes that bypass it. A
+        table name of None stands for any table.
+        """
+        self.info.setdefault("written_tables", set()).update(tables)
+
+    @_replica_read
+    def get_fleet_snapshot(self, hardware_id=None):
+        """
+        Get the most recent status of every sensor.
+
+        This reads the status_latest table, which is kept up to date by
+        triggers on the status table, so it costs one row per sensor rather
+        than a search of the status history.
+
+        Parameters
+        ----------
+        hardware_id : int or list of int
+            Sensor(s) to get the status for. Defaults to all sensors.
+
+        Returns
+        -------
+        list of status_latest objects
+            Most recent status of each sensor, ordered by hardware_id.
+
+        """
+        from .ntk_tables import status_latest
+
+        query = self.query(status_latest)
+        if hardware_id is not None:
+            if not _is_value_list(hardware_id):
+                hardware_id = [hardware_id]
+            query = query.filter(status_latest.hardware_id.in_(hardware_id))
+        query = query.order_by(status_latest.hardware_id)
+        key = ("get_fleet_snapshot", _cache_key(hardware_id))
+        return self._cached(key, ("status_latest",), query.all)
+
+    def get_hardware_ids(self, hostnames):
+        """
+        Get the hardware_id of sensors from their hostnames.
+
+        Hostnames are looked up in the rpi table and then in the wr_host
+        column of the wrlen table. All the hostnames that are not in the
+        dimension cache are looked up with a single query.
+
+        Parameters
+        ----------
+        hostnames : list of str
+            Hostnames to look up, may contain duplicates.
+
+        Returns
+        -------
+        list of int
+            hardware_id of each hostname, in the same order.
+
+        Raises
+        ------
+        ValueError
+            If a hostname is not known, or belongs to several sensors.
+
+        """
+        from sqlalchemy import literal, union_all
+        from .ntk_tables import rpi, wrlen
+
+        cache = self.dimension_cache
+        if cache is not None:
+            ids, missing = cache.get_many("hardware", hostnames)
+        else:
+            ids, missing = {}, list(dict.fromkeys(hostnames))
+
+        if len(missing) > 0:
+            query = union_all(
+                select(rpi.hostname, rpi.hardware_id, literal(0).label("rank")).where(
+                    rpi.hostname.in_(missing)
+                ),
+                select(
+                    wrlen.wr_host, wrlen.hardware_id, literal(1).label("rank")
+                ).where(wrlen.wr_host.in_(missing)),
+            )
+            found = {}
+            for hostname, hardware_id, rank in self.execute(query):
+                found.setdefault(hostname, {}).setdefault(rank, set()).add(
+                    hardware_id
+                )
+            new_ids = {}
+            for hostname, by_rank in found.items():
+                # the rpi hostname wins over the White Rabbit host name
+                candidates = by_rank[min(by_rank)]
+                if len(candidates) > 1:
+                    raise ValueError(
+                        "hostname {h} belongs to several sensors: {i}".format(
+                            h=hostname, i=sorted(candidates)
+                        )
+                    )
+                new_ids[hostname] = candidates.pop()
+            unknown = [hostname for hostname in missing if hostname not in new_ids]
+            if len(unknown) > 0:
+                raise ValueError("unknown hostnames: {u}".format(u=unknown))
+            ids.update(new_ids)
+            if cache is not None:
+                cache.update("hardware", new_ids)
+
+        return [ids[hostname] for hostname in hostnames]
+
+    def get_metadata_ids(self, keys, create=True):
+        """
+        Get (and create if needed) the metadata_id of recording settings.
+
+        All the keys that are not in the dimension cache are resolved with
+        one ``SELECT``, and the ones that do not exist yet are created with
+        one ``INSERT ... ON CONFLICT DO NOTHING RETURNING`` on
+        metadata_unique_key. Keys created by a concurrent session between
+        the two are picked up by a second ``SELECT``.
+
+        Ids created by this session are only added to the dimension cache
+        once the session commits.
+
+        Parameters
+        ----------
+        keys : list of tuple or dict
+            Recording settings, with the values of `metadata_key_columns`
+            (frequency, sample_rate, bandwidth, gain, length, interval and
+            bit_depth) either in that order or keyed by column name. May
+            contain duplicates.
+        create : bool
+            Option to create the metadata records that do not exist yet.
+
+        Returns
+        -------
+        list of int
+            metadata_id of each key, in the same order.
+
+        Raises
+        ------
+        ValueError
+            If create is False and a key does not exist.
+
+        """
+        from .ntk_tables import metadata
+
+        keys = [_metadata_key(key) for key in keys]
+        cache = self.dimension_cache
+        if cache is not None:
+            ids, missing = cache.get_many("metadata", keys)
+        else:
+            ids, missing = {}, list(dict.fromkeys(keys))
+
+        if len(missing) > 0:
+            new_ids = self._select_metadata_ids(missing)
+            to_create = [key for key in missing if key not in new_ids]
+            if len(to_create) > 0 and create:
+                dialect = self.get_bind(metadata).dialect.name
+                if dialect == "postgresql":
+                    from sqlalchemy.dialects.postgresql import insert
+                elif dialect == "sqlite":
+                    from sqlalchemy.dialects.sqlite import insert
+                else:  # pragma: no cover
+                    raise ValueError(
+                        "get_metadata_ids can only create records on PostgreSQL "
+                        "and SQLite."
+                    )
+                key_cols = [metadata.__table__.c[col] for col in metadata_key_columns]
+                stmt = (
+                    insert(metadata)
+                    .values([dict(zip(metadata_key_columns, key)) for key in to_create])
+                    .on_conflict_do_nothing(index_elements=metadata_key_columns)
+                    .returning(metadata.metadata_id, *key_cols)
+                )
+                created = {
+                    _metadata_key(row[1:]): row[0] for row in self.execute(stmt)
+                }
+                new_ids.update(created)
+                self.info.setdefault("created_metadata_ids", {}).update(created)
+                raced = [key for key in to_create if key not in new_ids]
+                if len(raced) > 0:
+                    new_ids.update(self._select_metadata_ids(raced))
+            unknown = [key for key in missing if key not in new_ids]
+            if len(unknown) > 0:
+                raise ValueError("unknown metadata keys: {u}".format(u=unknown))
+            ids.update(new_ids)
+            if cache is not None:
+                cache.update(
+                    "metadata",
+                    {
+                        key: val
+                        for key, val in new_ids.items()
+                        if key not in self.info.get("created_metadata_ids", {})
+                    },
+                )
+
+        return [ids[key] for key in keys]
+
+    def _select_metadata_ids(self, keys):
+        """Look up the metadata_id of existing keys with a single query."""
+        from sqlalchemy import or_, tuple_
+        from .ntk_tables import metadata
+
+        # NULLs never match in an IN, so the keys without a bit_depth are
+        # matched separately
+        key_cols = [metadata.__table__.c[col] for col in metadata_key_columns]
+        with_bits = [key for key in keys if key[-1] is not None]
+        without_bits = [key[:-1] for key in keys if key[-1] is None]
+        conditions = []
+        if len(with_bits) > 0:
+            conditions.append(tuple_(*key_cols).in_(with_bits))
+        if len(without_bits) > 0:
+            conditions.append(
+                tuple_(*key_cols[:-1]).in_(without_bits)
+                & metadata.bit_depth.is_(None)
+            )
+        rows = self.execute(
+            select(metadata.metadata_id, *key_cols).where(or_(*conditions))
+        )
+        return {_metadata_key(row[1:]): row[0] for row in rows}
+
+    def create_time_partitions(self, table_class, months_ahead=3, start=None):
+        """
+        Create the monthly partitions of a table ahead of time.
+
+        Partitions are named like ``status_y2024m05`` and cover a calendar
+        month (UTC). Any rows in the default partition that belong in a new
+        partition are moved into it. Rows of other tables referencing the
+        moved rows with ``ON DELETE CASCADE`` (e.g. output_spectra rows of
+        moved outputs rows), which the move would delete, are put back.
+        Existing partitions are left alone, so this is safe to run repeatedly
+        (e.g. from a daily cron job).
+
+        Parameters
+        ----------
+        table_class : class
+            Class specifying a partitioned table (e.g. status or outputs).
+        months_ahead : int
+            Number of months after the current one to create partitions for.
+        start : astropy Time object
+            Time in the first month to create a partition for. Defaults to
+            the current database time.
+
+        Returns
+        -------
+        list of str
+            Names of the partitions that were created.
+
+        """
+        from sqlalchemy import text
+
+        from . import CMDeclarativeBase
+
+        column = _partition_column(table_class)
+        table = table_class.__tablename__
+        # foreign keys whose rows are deleted with the rows they reference
+        cascades = [
+            fk
+            for other in CMDeclarativeBase.metadata.sorted_tables
+            for fk in other.foreign_key_constraints
+            if fk.referred_table is table_class.__table__
+            and (fk.ondelete or "").upper() == "CASCADE"
+        ]
+        if start is None:
+            start = self.get_current_db_time()
+        elif not isinstance(start, Time):
+            raise ValueError(
+                "start must be an astropy time object. value was: {t}".format(t=start)
+            )
+        start = start.utc.to_datetime(timezone=datetime.timezone.utc)
+        existing = set(self._list_time_partitions(table_class))
+
+        created = []
+        for offset in range(months_ahead + 1):
+            lower = _month_start(start.year, start.month + offset)
+            upper = _month_start(start.year, start.month + offset + 1)
+            name = "{t}_y{y:04d}m{m:02d}".format(t=table, y=lower.year, m=lower.month)
+            if name in existing:
+                continue
+            params = {"lower": lower, "upper": upper}
+            # Keep a copy of the rows referencing the rows to move, deleting
+            # those from the default partition deletes them too.
+            for i, fk in enumerate(cascades):
+                self.execute(
+                    text(
+                        "CREATE TEMPORARY TABLE _ntk_keep_{i} ON COMMIT DROP AS "
+                        "SELECT r.* FROM {r} r JOIN {t}_default d ON {on} "
+                        "WHERE d.{c} >= :lower AND d.{c} < :upper".format(
+                            i=i,
+                            r=fk.parent.name,
+                            t=table,
+                            on=" AND ".join(
+                                "r.{a} = d.{b}".format(
+                                    a=elem.parent.name, b=elem.column.name
+                                )
+                                for elem in fk.elements
+                            ),
+                            c=column,
+                        )
+                    ),
+                    params,
+                )
+            # Build the partition as a plain table, move in any rows that
+            # landed in the default partition, then attach it.
+            self.execute(
+                text(
+                    "CREATE TABLE {p} (LIKE {t} INCLUDING DEFAULTS "
+                    "INCLUDING CONSTRAINTS)".format(p=name, t=table)
+                )
+            )
+            self.execute(
+                text(
+                    "INSERT INTO {p} OVERRIDING SYSTEM VALUE SELECT * FROM "
+                    "{t}_default WHERE {c} >= :lower AND {c} < :upper".format(
+                        p=name, t=table, c=column
+                    )
+                ),
+                params,
+            )
+            self.execute(
+                text(
+                    "DELETE FROM {t}_default WHERE {c} >= :lower "
+                    "AND {c} < :upper".format(t=table, c=column)
+                ),
+                params,
+            )
+            self.execute(
+                text(
+                    "ALTER TABLE {t} ATTACH PARTITION {p} FOR VALUES "
+                    "FROM ('{lower}') TO ('{upper}')".format(
+                        t=table,
+                        p=name,
+                        lower=lower.isoformat(),
+                        upper=upper.isoformat(),
+                    )
+                )
+            )
+            for i, fk in enumerate(cascades):
+                self.execute(
+                    text(
+                        "INSERT INTO {r} OVERRIDING SYSTEM VALUE "
+                        "SELECT * FROM _ntk_keep_{i}".format(r=fk.parent.name, i=i)
+                    )
+                )
+                self.execute(text("DROP TABLE _ntk_keep_{i}".format(i=i)))
+            created.append(name)
+        return created
+
+    def remove_time_partitions(self, table_class, keep_months, drop=False):
+        """
+        Detach or drop the monthly partitions of a table that have expired.
+
+        A partition expires when its whole month is more than keep_months
+        months before the current (database time) month. Removing a partition
+        is a metadata operation, much cheaper than deleting its rows.
+
+        Parameters
+        ----------
+        table_class : class
+            Class specifying a partitioned table (e.g. status or outputs).
+        keep_months : int
+            Number of months before the current one to keep.
+        drop : bool
+            Option to drop the expired partitions. By default they are only
+            detached, so they remain as standalone tables (e.g. for archiving).
+
+        Returns
+        -------
+        list of str
+            Names of the partitions that were detached or dropped.
+
+        """
+        from sqlalchemy import text
+
+        if not isinstance(keep_months, int) or keep_months < 0:
+            raise ValueError("keep_months must be a non-negative integer.")
+        table = table_class.__tablename__
+        now = self.get_current_db_time().to_datetime(timezone=datetime.timezone.utc)
+        cutoff = _month_start(now.year, now.month - keep_months)
+
+        removed = []
+        for name, lower in self._list_time_partitions(table_class).items():
+            if _month_start(lower.year, lower.month + 1) > cutoff:
+                continue
+            self.execute(
+                text("ALTER TABLE {t} DETACH PARTITION {p}".format(t=table, p=name))
+            )
+            if drop:
+                self.execute(text("DROP TABLE {p}".format(p=name)))
+            removed.append(name)
+        return removed
 
-        # convert to astropy time object
-        db_time = Time(db_timestamp)
-        return db_time
+    def rollup_status(self, max_age_days=28, batch_size=10000):
+        """
+        Roll old status records up into the status_hourly table.
+
+        Status records older than max_age_days (rounded down to the start of
+        the hour) are deleted from the status table and summarized per sensor
+        and hour in the status_hourly table. Each batch is deleted, summarized
+        and merged into any existing summary of the same hour in a single
+        statement and then committed, so no record is lost or counted twice
+        and locks are only held for one batch. Requires PostgreSQL.
+
+        The records are walked one sensor at a time in time windows of about
+        batch_size records, found and deleted through the (hardware_id, time)
+        index, so a batch only reads its own records (and partitions) rather
+        than the whole backlog.
+
+        Parameters
+        ----------
+        max_age_days : float
+            Age (in days) past which status records are rolled up.
+        batch_size : int
+            Number of status records to move per transaction. A batch can be
+            larger if more records share the time at its end.
 
+        Returns
+        -------
+        int
+            Number of status records rolled up.
+
+        """
+        from sqlalchemy import text
+
+        from .ntk_tables import hardware, status, status_hourly
+
+        if not isinstance(max_age_days, (int, float)) or max_age_days < 0:
+            raise ValueError("max_age_days must be a non-negative number.")
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise ValueError("batch_size must be a positive integer.")
+
+        names = [col.name for col in status_hourly.__table__.columns]
+        stat_columns = [name[:-4] for name in names if name.endswith("_min")]
+        last_columns = ["hostname"] + [
+            name for name in names if name.startswith("wr_")
+        ]
+
+        selected = [
+            "hardware_id",
+            "date_trunc('hour', time AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'",
+            "count(*)",
+            "min(time)",
+            "max(time)",
+        ]
+        updates = [
+            "n_samples = t.n_samples + EXCLUDED.n_samples",
+            "first_time = LEAST(t.first_time, EXCLUDED.first_time)",
+            "last_time = GREATEST(t.last_time, EXCLUDED.last_time)",
+        ]
+        for col in last_columns:
+            selected.append("(array_agg({c} ORDER BY time DESC))[1]".format(c=col))
+            updates.append(
+                "{c} = CASE WHEN EXCLUDED.last_time >= t.last_time "
+                "THEN EXCLUDED.{c} ELSE t.{c} END".format(c=col)
+            )
+        for col in stat_columns:
+            selected += [
+                "min({c})".format(c=col),
+                "max({c})".format(c=col),
+                "avg({c})::double precision".format(c=col),
+            ]
+            updates += [
+                "{c}_min = LEAST(t.{c}_min, EXCLUDED.{c}_min)".format(c=col),
+                "{c}_max = GREATEST(t.{c}_max, EXCLUDED.{c}_max)".format(c=col),
+                # mean of the combined samples
+                "{c}_mean = (t.{c}_mean * t.n_samples + EXCLUDED.{c}_mean "
+                "* EXCLUDED.n_samples) / (t.n_samples + EXCLUDED.n_samples)".format(
+                    c=col
+                ),
+            ]
+        inserted = ["hardware_id", "hour", "n_samples", "first_time", "last_time"]
+        inserted += last_columns
+        for col in stat_columns:
+            inserted += [col + "_min", col + "_max", col + "_mean"]
+
+        stmt = text(
+            "WITH moved AS ("
+            "DELETE FROM status WHERE hardware_id = :hardware_id "
+            "AND time >= :lower AND time < :upper RETURNING *), "
+            "merged AS ("
+            "INSERT INTO status_hourly AS t ({i}) SELECT {s} FROM moved "
+            "GROUP BY 1, 2 "
+            "ON CONFLICT (hardware_id, hour) DO UPDATE SET {u} RETURNING 1) "
+            "SELECT (SELECT count(*) FROM moved), "
+            "(SELECT count(*) FROM merged)".format(
+                i=", ".join(inserted), s=", ".join(selected), u=", ".join(updates)
+            )
+        )
+
+        now = self.get_current_db_time().to_datetime(timezone=datetime.timezone.utc)
+        cutoff = (now - datetime.timedelta(days=max_age_days)).replace(
+            minute=0, second=0, microsecond=0
+        )
+
+        def _next_time(hardware_id, lower, offset, inclusive=True):
+            # time of the record offset records after lower, read through the
+            # (hardware_id, time) index
+            query = select(status.time).where(
+                status.hardware_id == hardware_id, status.time < cutoff
+            )
+            if lower is not None:
+                query = query.where(
+                    status.time >= lower if inclusive else status.time > lower
+                )
+            query = query.order_by(status.time).offset(offset).limit(1)
+            return self.execute(query).scalar()
+
+        total = 0
+        hardware_ids = self.execute(
+            select(hardware.hardware_id).order_by(hardware.hardware_id)
+        ).scalars().all()
+        for hardware_id in hardware_ids:
+            lower = _next_time(hardware_id, None, 0)
+            while lower is not None:
+                upper = _next_time(hardware_id, lower, batch_size)
+                if upper is not None and upper == lower:
+                    # more than batch_size records at the same time
+                    upper = _next_time(hardware_id, lower, 0, inclusive=False)
+                n_moved, _ = self.execute(
+                    stmt,
+                    {
+                        "hardware_id": hardware_id,
+                        "lower": lower,
+                        "upper": cutoff if upper is None else upper,
+                    },
+                ).one()
+                self.commit()
+                total += n_moved
+                lower = upper
+        return total
+
+    def _list_time_partitions(self, table_class):
+        """
+        Get the monthly partitions attached to a table.
+
+        Returns
+        -------
+        dict
+            Start of month (UTC datetime) keyed by partition name, in time
+            order. The default partition is not included.
+
+        """
+        from sqlalchemy import text
+
+        table = table_class.__tablename__
+        names = self.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = CAST(:table AS regclass)"
+            ),
+            {"table": table},
+        ).scalars()
+        partitions = {}
+        for name in names:
+            match = re.fullmatch(re.escape(table) + r"_y(\d{4})m(\d{2})", name)
+            if match is not None:
+                partitions[name] = _month_start(
+                    int(match.group(1)), int(match.group(2))
+                )
+        return dict(sorted(partitions.items(), key=lambda item: item[1]))
+
+    @_replica_read
     def _time_filter(
         self,
         table_class,
@@ -56,6 +1065,8 @@ class CMSession(Session):
         filter_value=None,
         write_to_file=False,
         filename=None,
+        stream=False,
+        batch_size=None,
     ):
         """
         Fiter entries by time, used by most get methods on this object.
@@ -73,7 +1084,9 @@ class CMSession(Session):
         table_class : class
             Class specifying a table to query.
         time_column : str
-            column name holding the time to filter on.
+            column name holding the time to filter on. This can be a DateTime
+            column or a column of GPS seconds, the times are converted to
+            the column's type so that indexes on it can be used.
         most_recent : bool
             Option to get the most recent record(s). Defaults to True if
             starttime is None.
@@ -90,23 +1103,43 @@ class CMSession(Session):
             primary key).
         filter_value : str or int or list of str or int
             Type coresponds to filter_column(s), value(s) to require
-            that the filter_column(s) are equal to.
+            that the filter_column(s) are equal to. A value may itself be a
+            list, tuple or set of values to match any of, in which case the
+            most recent record(s) (or first record(s) after starttime) are
+            found for each of those values, e.g. the latest status of each of
+            a list of sensors.
         write_to_file : bool
             Option to write records to a CSV file.
         filename : str
             Name of file to write to. If not provided, defaults to a file in the
             current directory named based on the table name.
             Ignored if write_to_file is False.
+        stream : bool
+            Option to fetch the records through a server-side cursor and return
+            a generator instead of a list, so memory use does not grow with the
+            size of the time range. The session's connection is held until the
+            generator is exhausted or closed. Ignored if write_to_file is True.
+        batch_size : int
+            Number of records to fetch from the server at a time when streaming.
+            If set, the generator yields lists of up to batch_size objects,
+            otherwise it yields single objects (fetched 1000 at a time).
+            Ignored if stream is False.
 
         Returns
         -------
-        list of objects, optional
-            If write_to_file is False: List of objects that match the filtering.
+        list of objects or generator, optional
+            If write_to_file is False: List of objects that match the filtering,
+            or a generator of objects (or of lists of objects if batch_size is
+            set) if stream is True.
 
         """
         if starttime is None and most_recent is None:
             most_recent = True
 
+        if stream and batch_size is not None:
+            if not isinstance(batch_size, int) or batch_size < 1:
+                raise ValueError("batch_size must be a positive integer.")
+
         if not isinstance(most_recent, (type(None), bool)):
             raise TypeError("most_recent must be None or a boolean")
 
@@ -150,40 +1183,89 @@ class CMSession(Session):
         query = self.query(table_class)
         if filter_value is not None:
             for index, val in enumerate(filter_value):
-                if val is not None:
+                if _is_value_list(val):
+                    query = query.filter(filter_attr[index].in_(val))
+                elif val is not None:
                     query = query.filter(filter_attr[index] == val)
 
         if most_recent or stoptime is None:
+            # Find the time of the first row with a subquery so that all the
+            # rows at that time come back in a single statement. Columns
+            # filtered on a list of values get a time for each of the values.
+            inner = aliased(table_class)
+            inner_time = getattr(inner, time_column)
             if most_recent:
                 current_time = Time.now()
                 # get most recent row
-                first_query = (
-                    query.filter(time_attr <= current_time.gps)
-                    .order_by(desc(time_attr))
-                    .limit(1)
+                first_time = select(func.max(inner_time).label("first_time")).where(
+                    inner_time <= _time_bound(time_attr, current_time, upper=True)
                 )
             else:
                 # get first row after starttime
-                first_query = (
-                    query.filter(time_attr >= starttime.gps)
-                    .order_by(asc(time_attr))
-                    .limit(1)
+                first_time = select(func.min(inner_time).label("first_time")).where(
+                    inner_time >= _time_bound(time_attr, starttime)
                 )
+            list_filters = []
+            if filter_value is not None:
+                for col, attr, val in zip(filter_column, filter_attr, filter_value):
+                    if _is_value_list(val):
+                        # a repeated value would repeat its records
+                        list_filters.append((col, attr, list(dict.fromkeys(val))))
+                    elif val is not None:
+                        first_time = first_time.where(getattr(inner, col) == val)
+
+            combos = list(itertools.product(*[val for _, _, val in list_filters]))
+            if (
+                len(list_filters) > 0
+                and len(combos) > 0
+                and self.get_bind().dialect.name == "postgresql"
+            ):
+                # Find the time separately for each combination of the listed
+                # values with a LATERAL subquery over a VALUES list, so that
+                # each time comes from one index probe, and join the records
+                # at those times.
+                from sqlalchemy import and_, column, true, values
 
-            # get the time of the first row
-            first_result = first_query.all()
-            if len(first_result) < 1:
-                query = first_query
+                filter_values = values(
+                    *[column(col, attr.type) for col, attr, _ in list_filters],
+                    name="filter_values",
+                ).data(combos)
+                for col, _, _ in list_filters:
+                    first_time = first_time.where(
+                        getattr(inner, col) == filter_values.c[col]
+                    )
+                first_time = first_time.lateral("first_times")
+                latest = (
+                    select(
+                        *[filter_values.c[col] for col, _, _ in list_filters],
+                        first_time.c.first_time,
+                    )
+                    .select_from(filter_values.join(first_time, true()))
+                    .subquery("latest")
+                )
+                query = query.join(
+                    latest,
+                    and_(
+                        time_attr == latest.c.first_time,
+                        *[attr == latest.c[col] for col, attr, _ in list_filters],
+                    ),
+                )
             else:
-                first_time = getattr(first_result[0], time_column)
+                for col, attr, _ in list_filters:
+                    first_time = first_time.where(getattr(inner, col) == attr)
                 # then get all results at that time
-                query = query.filter(time_attr == first_time)
-                if filter_value is not None:
-                    for attr in filter_attr:
-                        query = query.order_by(asc(attr))
+                query = query.filter(time_attr == first_time.scalar_subquery())
+            if filter_value is not None:
+                for attr in filter_attr:
+                    query = query.order_by(asc(attr))
 
         else:
-            query = query.filter(time_attr.between(starttime.gps, stoptime.gps))
+            query = query.filter(
+                time_attr.between(
+                    _time_bound(time_attr, starttime),
+                    _time_bound(time_attr, stoptime, upper=True),
+                )
+            )
             query = query.order_by(time_attr)
             if filter_value is not None:
                 for attr in filter_attr:
@@ -191,10 +1273,359 @@ class CMSession(Session):
 
         if write_to_file:
             self._write_query_to_file(query, table_class, filename=filename)
+        elif stream:
+            return self._stream_query(query, batch_size=batch_size)
+        else:
+            key = (
+                "_time_filter",
+                table_class.__tablename__,
+                time_column,
+                most_recent,
+                _cache_key(starttime),
+                _cache_key(stoptime),
+                _cache_key(filter_column),
+                _cache_key(filter_value),
+            )
+            return self._cached(key, (table_class.__tablename__,), query.all)
+
+    @_replica_read
+    def get_columns(
+        self,
+        table_class,
+        columns,
+        starttime,
+        stoptime,
+        time_column="time",
+        filter_column=None,
+        filter_value=None,
+        as_dataframe=False,
+    ):
+        """
+        Get selected columns over a time range as arrays.
+
+        This runs a Core select rather than an ORM query, so no objects are
+        built for the records, which makes it much faster than `_time_filter`
+        for pulling a few columns over many records (e.g. for plotting).
+        Numeric columns are cast to floats in the database.
+
+        Parameters
+        ----------
+        table_class : class
+            Class specifying a table to query.
+        columns : str or list of str
+            Column name(s) to get. The time column is always included.
+        starttime : astropy Time object
+            Time to get records after.
+        stoptime : astropy Time object
+            Last time to get records for.
+        time_column : str
+            column name holding the time to filter on.
+        filter_column : str or list of str
+            Column name(s) to use as an additional filter.
+        filter_value : str or int or list of str or int
+            Type coresponds to filter_column(s), value(s) to require
+            that the filter_column(s) are equal to. A value may itself be a
+            list, tuple or set of values to match any of.
+        as_dataframe : bool
+            Option to return a pandas DataFrame (requires pandas).
+
+        Returns
+        -------
+        dict or pandas DataFrame
+            Dict keyed by column name of NumPy arrays (time ordered), or a
+            DataFrame with those columns if as_dataframe is True.
+
+        """
+        from sqlalchemy import cast, Float
+
+        for name, val in [("starttime", starttime), ("stoptime", stoptime)]:
+            if not isinstance(val, Time):
+                raise ValueError(
+                    "{n} must be an astropy time object. "
+                    "value was: {t}".format(n=name, t=val)
+                )
+        if as_dataframe:
+            try:
+                import pandas as pd
+            except ImportError as err:  # pragma: no cover
+                raise ImportError(
+                    "pandas must be installed to get a DataFrame."
+                ) from err
+
+        if isinstance(columns, str):
+            columns = [columns]
+        columns = [time_column] + [col for col in columns if col != time_column]
+        time_attr = getattr(table_class, time_column)
+
+        selected = []
+        for col in columns:
+            attr = getattr(table_class, col)
+            if isinstance(attr.type, Numeric) and attr.type.asdecimal:
+                # let the database send floats rather than building Decimals
+                attr = cast(attr, Float)
+            selected.append(attr.label(col))
+
+        stmt = select(*selected).where(
+            time_attr.between(
+                _time_bound(time_attr, starttime),
+                _time_bound(time_attr, stoptime, upper=True),
+            )
+        )
+        if filter_value is not None:
+            if not isinstance(filter_column, list):
+                filter_column = [filter_column]
+                filter_value = [filter_value]
+            for col, val in zip(filter_column, filter_value):
+                if _is_value_list(val):
+                    stmt = stmt.where(getattr(table_class, col).in_(val))
+                elif val is not None:
+                    stmt = stmt.where(getattr(table_class, col) == val)
+        stmt = stmt.order_by(time_attr)
+
+        rows = self.execute(stmt).all()
+        if len(rows) > 0:
+            values = list(zip(*rows))
+        else:
+            values = [[] for _ in columns]
+
+        result = {
+            col: _column_array(vals, getattr(table_class, col).type)
+            for col, vals in zip(columns, values)
+        }
+        if as_dataframe:
+            return pd.DataFrame(result)
+        return result
+
+    @_replica_read
+    def get_status_aggregates(
+        self,
+        bucket,
+        columns,
+        starttime,
+        stoptime,
+        aggs=("min", "max", "avg", "count"),
+        hardware_ids=None,
+        as_dataframe=False,
+    ):
+        """
+        Get time-bucketed aggregates of status columns, computed in the database.
+
+        The status records are grouped into time buckets per sensor and the
+        requested aggregates are computed in SQL, so only one row per
+        (hardware_id, bucket) is sent back. This is the way to get long time
+        ranges for plotting. Requires PostgreSQL.
+
+        Parameters
+        ----------
+        bucket : str or number
+            Bucket size, either a ``date_trunc`` unit (e.g. "minute", "hour",
+            "day") or a width in seconds.
+        columns : str or list of str
+            Name(s) of numeric status column(s) to aggregate.
+        starttime : astropy Time object
+            Time to get records after.
+        stoptime : astropy Time object
+            Last time to get records for.
+        aggs : list of str
+            Aggregates to compute for each column, any of "min", "max", "avg"
+            and "count" (number of non-null values).
+        hardware_ids : int or list of int
+            Sensor(s) to get aggregates for. Defaults to all sensors.
+        as_dataframe : bool
+            Option to return a pandas DataFrame (requires pandas).
+
+        Returns
+        -------
+        list of rows or pandas DataFrame
+            Rows ordered by hardware_id and bucket, with "hardware_id",
+            "bucket" (the bucket start time) and "<column>_<agg>" fields.
+
+        """
+        from sqlalchemy import cast, Float
+
+        from .ntk_tables import status
+
+        for name, val in [("starttime", starttime), ("stoptime", stoptime)]:
+            if not isinstance(val, Time):
+                raise ValueError(
+                    "{n} must be an astropy time object. "
+                    "value was: {t}".format(n=name, t=val)
+                )
+        if isinstance(columns, str):
+            columns = [columns]
+        if isinstance(aggs, str):
+            aggs = [aggs]
+        agg_funcs = {
+            "min": func.min,
+            "max": func.max,
+            "avg": func.avg,
+            "count": func.count,
+        }
+        for agg in aggs:
+            if agg not in agg_funcs:
+                raise ValueError(
+                    "aggs must be a subset of {a}. value was: {v}".format(
+                        a=list(agg_funcs), v=agg
+                    )
+                )
+        if as_dataframe:
+            try:
+                import pandas as pd
+            except ImportError as err:  # pragma: no cover
+                raise ImportError(
+                    "pandas must be installed to get a DataFrame."
+                ) from err
+
+        if isinstance(bucket, str):
+            # truncate the UTC time, not the time in the session's time zone
+            bucket_expr = func.timezone(
+                "UTC", func.date_trunc(bucket, func.timezone("UTC", status.time))
+            )
+        elif isinstance(bucket, (int, float)) and bucket > 0:
+            epoch = func.extract("epoch", status.time)
+            bucket_expr = func.to_timestamp(func.floor(epoch / bucket) * bucket)
         else:
-            return query.all()
+            raise ValueError(
+                "bucket must be a date_trunc unit or a positive number of seconds. "
+                "value was: {b}".format(b=bucket)
+            )
+        bucket_expr = bucket_expr.label("bucket")
+
+        selected = [status.hardware_id, bucket_expr]
+        for col in columns:
+            attr = getattr(status, col)
+            for agg in aggs:
+                if agg == "count":
+                    expr = func.count(attr)
+                else:
+                    expr = cast(agg_funcs[agg](attr), Float)
+                selected.append(expr.label("{c}_{a}".format(c=col, a=agg)))
 
-    def _insert_ignoring_duplicates(self, table_class, obj_list, update=False):
+        stmt = select(*selected).where(
+            status.time.between(
+                _time_bound(status.time, starttime),
+                _time_bound(status.time, stoptime, upper=True),
+            )
+        )
+        if hardware_ids is not None:
+            if not _is_value_list(hardware_ids):
+                hardware_ids = [hardware_ids]
+            stmt = stmt.where(status.hardware_id.in_(hardware_ids))
+        stmt = stmt.group_by(status.hardware_id, bucket_expr).order_by(
+            status.hardware_id, bucket_expr
+        )
+
+        rows = self.execute(stmt).all()
+        if as_dataframe:
+            return pd.DataFrame(rows, columns=[s.name for s in selected])
+        return rows
+
+    @_replica_read
+    def _write_query_to_file(
+        self, query, table_class, filename=None, compression=None, chunk_size=10000
+    ):
+        """
+        Write the results of a query to a CSV file.
+
+        On PostgreSQL (with psycopg2) the query is run through ``COPY (...) TO
+        STDOUT WITH CSV HEADER`` and streamed straight into the file. Otherwise
+        the rows are fetched and written in chunks. In both cases the results are
+        never turned into ORM objects.
+
+        Parameters
+        ----------
+        query : sqlalchemy.orm.Query
+            Query whose results are written.
+        table_class : class
+            Class specifying the table being queried, used for the default
+            filename.
+        filename : str
+            Name of file to write to. If not provided, defaults to a file in the
+            current directory named based on the table name (with a ".gz" or
+            ".zst" extension if compressed).
+        compression : {None, "gzip", "zstd"}
+            Compression to apply to the file. If None, it is inferred from a
+            ".gz" or ".zst" filename extension, otherwise no compression.
+        chunk_size : int
+            Number of rows to fetch at a time. Only used for non-PostgreSQL
+            databases.
+
+        """
+        if compression is None and filename is not None:
+            if filename.endswith(".gz"):
+                compression = "gzip"
+            elif filename.endswith(".zst"):
+                compression = "zstd"
+        if filename is None:
+            extension = {None: "", "gzip": ".gz", "zstd": ".zst"}.get(compression, "")
+            filename = table_class.__tablename__ + ".csv" + extension
+
+        statement = query.statement
+        with _open_text_output(filename, compression=compression) as f:
+            if self.bind.dialect.driver == "psycopg2":
+                compiled = statement.compile(
+                    dialect=self.bind.dialect,
+                    # expand the IN lists into one parameter per value
+                    compile_kwargs={"render_postcompile": True},
+                )
+                cursor = self.connection().connection.cursor()
+                # let the driver render the bound parameters as literals
+                sql = cursor.mogrify(str(compiled), compiled.params).decode()
+                cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH CSV HEADER", f)
+            else:
+                import csv
+
+                result = self.connection().execute(statement)
+                writer = csv.writer(f)
+                writer.writerow(result.keys())
+                while True:
+                    rows = result.fetchmany(chunk_size)
+                    if len(rows) == 0:
+                        break
+                    writer.writerows(rows)
+
+    def _stream_query(self, query, batch_size=None):
+        """
+        Stream the results of a query through a server-side cursor.
+
+        Parameters
+        ----------
+        query : sqlalchemy.orm.Query
+            Query to stream.
+        batch_size : int
+            Number of records to fetch from the server at a time. If set, lists
+            of up to batch_size objects are yielded, otherwise single objects
+            are yielded (fetched 1000 at a time).
+
+        Yields
+        ------
+        object or list of objects
+            Records (or batches of records) that match the query.
+
+        """
+        # yield_per turns on stream_results, so only one batch of rows is
+        # held in memory at a time.
+        with self._replica_reads():
+            # only the execution, the session may write while this is consumed
+            results = self.execute(
+                query.statement, execution_options={"yield_per": batch_size or 1000}
+            ).scalars()
+        if batch_size is None:
+            yield from results
+            return
+
+        batch = []
+        for obj in results:
+            batch.append(obj)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
+
+    def _insert_ignoring_duplicates(
+        self, table_class, obj_list, update=False, batch_size=500
+    ):
         """
         Insert record handling duplication based on update flag.
 
@@ -204,6 +1635,17 @@ class CMSession(Session):
         sample certain data (especially redis data) densely on qmaster or to
         update an existing record.
 
+        On PostgreSQL the records are sent as multi-row ``INSERT ... VALUES``
+        statements of up to `batch_size` rows each, so a batch costs one round
+        trip rather than one per record. Records sharing a primary key within
+        a batch are resolved as if they had been inserted one at a time: the
+        last one wins if `update` is True, otherwise the first one is kept.
+
+        Ids given for identity columns (e.g. status_id of records copied from
+        another database) are inserted as given, with ``OVERRIDING SYSTEM
+        VALUE``, which is what makes primary key conflicts possible. The
+        identity sequence does not advance for them.
+
         Parameters
         ----------
         table_class : class
@@ -214,48 +1656,449 @@ class CMSession(Session):
             If true, update the existing record with the new data, otherwise do
             nothing (which is appropriate if the data is the same because of
             dense sampling).
+        batch_size : int
+            Maximum number of records to send in a single statement. Use 1 to
+            get one statement per record.
+
+        Returns
+        -------
+        dict
+            Number of records that were "inserted", "updated" and "skipped"
+            (already present and left untouched).
 
         """
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise ValueError("batch_size must be a positive integer.")
+
+        counts = {"inserted": 0, "updated": 0, "skipped": 0}
         if self.bind.dialect.name == "postgresql":
-            from sqlalchemy import inspect
+            from sqlalchemy import inspect, tuple_
             from sqlalchemy.dialects.postgresql import insert
 
-            ies = [c.name for c in inspect(table_class).primary_key]
+            mapper = inspect(table_class)
+            ies = [c.name for c in mapper.primary_key]
+            # map attribute keys to column names once per table rather than
+            # once per object.
+            col_keys = [
+                (col.expression.name, col.key) for col in mapper.column_attrs
+            ]
+            defaulted = _defaulted_columns(table_class)
+            # the statements bypass the session, so record the write for the
+            # query cache and to keep the following reads off the replicas
+            self._mark_written(table_class.__tablename__)
             conn = self.connection()
 
-            for obj in obj_list:
-                # This appears to be the most correct way to map each row
-                # object into a dictionary:
-                values = {}
-                for col in inspect(obj).mapper.column_attrs:
-                    values[col.expression.name] = getattr(obj, col.key)
+            for start in range(0, len(obj_list), batch_size):
+                rows = {}
+                n_dup = 0
+                for obj in obj_list[start : start + batch_size]:
+                    values = {name: getattr(obj, key) for name, key in col_keys}
+                    pk = tuple(values[col] for col in ies)
+                    if None in pk:
+                        # no primary key supplied, cannot collide in the batch
+                        pk = object()
+                    if pk in rows:
+                        n_dup += 1
+                        if not update:
+                            continue
+                    rows[pk] = values
+                rows = list(rows.values())
 
-                if update:
-                    # create dict of columns to update (everything other than
-                    # the primary keys)
-                    update_dict = {}
-                    for col, val in values.items():
-                        if col not in ies:
-                            update_dict[col] = val
-
-                    # The special PostgreSQL insert statement lets us update
-                    # existing rows via `ON CONFLICT ... DO UPDATE` syntax.
-                    stmt = (
-                        insert(table_class)
-                        .values(**values)
-                        .on_conflict_do_update(index_elements=ies, set_=update_dict)
+                # records that supply different sets of defaulted columns
+                # (e.g. some with their ids and some without) cannot share a
+                # statement
+                groups = {}
+                for values in rows:
+                    supplied = tuple(
+                        col for col in sorted(defaulted) if values[col] is not None
                     )
+                    groups.setdefault(supplied, []).append(values)
+
+                n_existing = 0
+                n_written = 0
+                for supplied, group in groups.items():
+                    for values in group:
+                        for col in defaulted.difference(supplied):
+                            del values[col]
+
+                    if update and set(ies) <= set(group[0]):
+                        pk_tuple = tuple_(
+                            *[table_class.__table__.c[col] for col in ies]
+                        )
+                        n_existing += conn.execute(
+                            select(func.count())
+                            .select_from(table_class.__table__)
+                            .where(
+                                pk_tuple.in_(
+                                    [
+                                        tuple(values[col] for col in ies)
+                                        for values in group
+                                    ]
+                                )
+                            )
+                        ).scalar()
+
+                    stmt = insert(table_class).values(group)
+                    if _supplies_identity(table_class, group[0]):
+                        stmt = stmt.with_dialect_options(
+                            postgresql_overriding_system_value=True
+                        )
+                    stmt = _on_conflict(stmt, ies, list(group[0]), update)
+                    n_written += len(conn.execute(stmt).all())
+
+                counts["inserted"] += n_written - n_existing
+                counts["updated"] += n_existing
+                counts["skipped"] += len(rows) - n_written
+                # in-batch duplicates behave like a second insert of the row
+                if update:
+                    counts["updated"] += n_dup
                 else:
-                    # The special PostgreSQL insert statement lets us ignore
-                    # existing rows via `ON CONFLICT ... DO NOTHING` syntax.
-                    stmt = (
-                        insert(table_class)
-                        .values(**values)
-                        .on_conflict_do_nothing(index_elements=ies)
-                    )
-                conn.execute(stmt)
+                    counts["skipped"] += n_dup
         else:  # pragma: no cover
             # Generic approach:
             for obj in obj_list:
                 self.add(obj)
+            counts["inserted"] = len(obj_list)
+
+        return counts
+
+    def bulk_copy(self, table_class, rows, update=False, chunk_size=10000, key=None):
+        """
+        Bulk load records via a PostgreSQL ``COPY`` into a staging table.
+
+        The records are streamed in chunks with ``COPY ... FROM STDIN`` into a
+        temporary staging table and then merged into the real table with a
+        single ``INSERT ... SELECT ... ON CONFLICT`` using the same primary key
+        handling as `_insert_ignoring_duplicates`. This is much faster than the
+        ORM or multi-row inserts for large backfills. On other databases (or
+        PostgreSQL drivers other than psycopg2) this falls back to
+        `_insert_ignoring_duplicates`.
+
+        The set of columns to load is decided from the first chunk: columns
+        with a database or column default (e.g. identity primary keys) are
+        left for the database to fill in if no record in that chunk supplies
+        a value for them.
+        Given ids are inserted with ``OVERRIDING SYSTEM VALUE``, as in
+        `_insert_ignoring_duplicates`.
+
+        Parameters
+        ----------
+        table_class : class
+            Class specifying a table to insert into.
+        rows : iterable of objects or dicts
+            Records to insert, either objects of class table_class or dicts
+            keyed by column name. May be a generator, only one chunk is held
+            in memory at a time. Values are converted by the column types as
+            for an insert (e.g. arrays for `Float32Array` columns).
+        update : bool
+            If true, update the existing record with the new data, otherwise do
+            nothing. Records sharing a primary key are resolved as in
+            `_insert_ignoring_duplicates`.
+        chunk_size : int
+            Number of records to buffer per ``COPY`` call.
+        key : list of str
+            Names of the columns that identify a record, to use instead of the
+            primary key, e.g. ``["hardware_id", "time"]`` for status records
+            whose ids are assigned by this database. Records whose key is
+            already in the table (or earlier in the input) are skipped, which
+            makes loading the same records again harmless. The key does not
+            need a unique constraint, but it should be indexed. Cannot be
+            combined with update.
+
+        Returns
+        -------
+        dict
+            Number of records that were "inserted", "updated" and "skipped"
+            (already present and left untouched).
+
+        """
+        import io
+        from itertools import islice
+        from sqlalchemy import and_, column, exists, inspect, table, text
+        from sqlalchemy.dialects.postgresql import insert
+
+        if not isinstance(chunk_size, int) or chunk_size < 1:
+            raise ValueError("chunk_size must be a positive integer.")
+        if key is not None:
+            key = list(key)
+            for name in key:
+                if name not in table_class.__table__.columns:
+                    raise ValueError(
+                        "{n} is not a column of {t}.".format(
+                            n=name, t=table_class.__tablename__
+                        )
+                    )
+            if update:
+                raise ValueError("update cannot be combined with key.")
+
+        mapper = inspect(table_class)
+        col_keys = [(col.expression.name, col.key) for col in mapper.column_attrs]
+
+        def _as_values(row):
+            if isinstance(row, dict):
+                return {name: row.get(name) for name, _ in col_keys}
+            return {name: getattr(row, key) for name, key in col_keys}
+
+        rows = iter(rows)
+        if self.bind.dialect.driver != "psycopg2":  # pragma: no cover
+            obj_list = [
+                table_class(**row) if isinstance(row, dict) else row for row in rows
+            ]
+            if key is None:
+                return self._insert_ignoring_duplicates(
+                    table_class, obj_list, update=update
+                )
+            from sqlalchemy import tuple_
+
+            key_cols = [table_class.__table__.c[col] for col in key]
+            keys = [tuple(_as_values(obj)[col] for col in key) for obj in obj_list]
+            seen = set()
+            if keys:
+                seen.update(
+                    tuple(row)
+                    for row in self.execute(
+                        select(*key_cols).where(tuple_(*key_cols).in_(set(keys)))
+                    )
+                )
+            kept = []
+            for obj, obj_key in zip(obj_list, keys):
+                if obj_key not in seen:
+                    seen.add(obj_key)
+                    kept.append(obj)
+            counts = self._insert_ignoring_duplicates(table_class, kept)
+            counts["skipped"] += len(obj_list) - len(kept)
+            return counts
+
+        counts = {"inserted": 0, "updated": 0, "skipped": 0}
+        chunk = [_as_values(row) for row in islice(rows, chunk_size)]
+        if len(chunk) == 0:
+            return counts
+
+        defaulted = _defaulted_columns(table_class)
+        columns = [
+            name
+            for name, _ in col_keys
+            if name not in defaulted or any(vals[name] is not None for vals in chunk)
+        ]
+        ies = [c.name for c in mapper.primary_key]
+        if key is not None and not set(key) <= set(columns):
+            raise ValueError("the records must supply the key columns.")
+
+        preparer = self.bind.dialect.identifier_preparer
+        target = preparer.format_table(table_class.__table__)
+        stage = "_ntk_stage_" + table_class.__tablename__
+        col_str = ", ".join(preparer.quote(col) for col in columns)
+
+        self._mark_written(table_class.__tablename__)
+        conn = self.connection()
+        # The staging table has the column types of the real table but none of
+        # its constraints. The sequence column records the input order so that
+        # duplicate keys can be resolved like sequential inserts.
+        conn.execute(text(f"DROP TABLE IF EXISTS {stage}"))
+        conn.execute(
+            text(
+                f"CREATE TEMPORARY TABLE {stage} ON COMMIT DROP AS "
+                f"SELECT {col_str} FROM {target} WITH NO DATA"
+            )
+        )
+        conn.execute(text(f"ALTER TABLE {stage} ADD COLUMN _ntk_seq BIGSERIAL"))
+
+        # conversions the driver would otherwise apply (e.g. of arrays to bytes)
+        processors = [
+            (col, table_class.__table__.c[col].type.bind_processor(self.bind.dialect))
+            for col in columns
+        ]
+        cursor = conn.connection.cursor()
+        n_copied = 0
+        while len(chunk) > 0:
+            buffer = io.StringIO()
+            for vals in chunk:
+                buffer.write(
+                    "\t".join(
+                        _copy_text(vals[col] if proc is None else proc(vals[col]))
+                        for col, proc in processors
+                    )
+                    + "\n"
+                )
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {stage} ({col_str}) FROM STDIN", buffer)
+            n_copied += len(chunk)
+            chunk = [_as_values(row) for row in islice(rows, chunk_size)]
+
+        stage_table = table(stage, *[column(col) for col in columns + ["_ntk_seq"]])
+        source = select(*[stage_table.c[col] for col in columns])
+        if key is not None:
+            # keep the first record per key that is not in the table yet
+            target_table = table_class.__table__
+            key_cols = [stage_table.c[col] for col in key]
+            source = (
+                source.where(
+                    ~exists().where(
+                        *[target_table.c[col] == stage_table.c[col] for col in key]
+                    )
+                )
+                .distinct(*key_cols)
+                .order_by(*key_cols, stage_table.c._ntk_seq)
+            )
+        elif set(ies) <= set(columns):
+            # keep only one record per primary key, which one depends on update
+            pk_cols = [stage_table.c[col] for col in ies]
+            if update:
+                seq_order = stage_table.c._ntk_seq.desc()
+            else:
+                seq_order = stage_table.c._ntk_seq.asc()
+            source = source.distinct(*pk_cols).order_by(*pk_cols, seq_order)
+        else:
+            source = source.order_by(stage_table.c._ntk_seq)
+
+        source = source.subquery()
+        n_merge = conn.execute(select(func.count()).select_from(source)).scalar()
+        n_existing = 0
+        if update and set(ies) <= set(columns):
+            target_table = table_class.__table__
+            n_existing = conn.execute(
+                select(func.count())
+                .select_from(source)
+                .join(
+                    target_table,
+                    and_(*[source.c[col] == target_table.c[col] for col in ies]),
+                )
+            ).scalar()
+
+        merge = insert(table_class).from_select(columns, select(source))
+        if _supplies_identity(table_class, columns):
+            merge = merge.with_dialect_options(postgresql_overriding_system_value=True)
+        merge = _on_conflict(merge, ies, columns, update).cte("merged")
+        n_written = conn.execute(select(func.count()).select_from(merge)).scalar()
+        conn.execute(text(f"DROP TABLE {stage}"))
+
+        n_dup = n_copied - n_merge
+        counts["inserted"] = n_written - n_existing
+        counts["updated"] = n_existing
+        counts["skipped"] = n_merge - n_written
+        # duplicate keys in the input behave like a second insert of the row
+        if update:
+            counts["updated"] += n_dup
+        else:
+            counts["skipped"] += n_dup
+
+        return counts
+
+
+# Keep track of the tables each session writes to, so that cached query
+# results read from them can be dropped when the session commits.
+@event.listens_for(CMSession, "after_flush")
+def _record_flushed_tables(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        session._mark_written(obj.__table__.name)
+
+
+@event.listens_for(CMSession, "do_orm_execute")
+def _record_executed_tables(orm_execute_state):
+    session = orm_execute_state.session
+    statement = orm_execute_state.statement
+    if orm_execute_state.is_insert or orm_execute_state.is_update or (
+        orm_execute_state.is_delete
+    ):
+        session._mark_written(statement.table.name)
+    elif hasattr(statement, "text") and not statement.text.lstrip().upper().startswith(
+        "SELECT"
+    ):
+        # raw SQL could write to any table
+        session._mark_written(None)
 
+
+@event.listens_for(CMSession, "after_commit")
+def _invalidate_written_tables(session):
+    tables = session.info.pop("written_tables", None)
+    created = session.info.pop("created_metadata_ids", None)
+    if tables:
+        tables = None if None in tables else tables
+        for cache in (session.query_cache, session.dimension_cache):
+            if cache is not None:
+                cache.invalidate(tables)
+    if created and session.dimension_cache is not None:
+        session.dimension_cache.update("metadata", created)
+
+
+@event.listens_for(CMSession, "after_rollback")
+def _forget_written_tables(session):
+    session.info.pop("written_tables", None)
+    session.info.pop("created_metadata_ids", None)
+
+
+class AsyncCMSession(AsyncSession):
+    """
+    asyncio counterpart of CMSession.
+
+    The queries are run by the CMSession methods of the underlying
+    synchronous session (`sync_session`) through `run_sync`, so they behave
+    the same as in CMSession. Requires an async driver (e.g. asyncpg), see
+    `ntk.AsyncDB`.
+
+    """
+
+    sync_session_class = CMSession
+
+    async def __aenter__(self):
+        """Enter the session."""
+        return self
+
+    async def __aexit__(self, etype, evalue, etb):
+        """Exit the session, rollback if there's an error otherwise commit."""
+        if etype is not None:
+            await self.rollback()  # exception raised
+        else:
+            await self.commit()  # success
+        await self.close()
+        return False  # propagate exception if any occurred
+
+    async def get_current_db_time(self, force=False):
+        """
+        Get the current time according to the database.
+
+        See `CMSession.get_current_db_time`.
+
+        """
+        return await self.run_sync(CMSession.get_current_db_time, force=force)
+
+    async def get_fleet_snapshot(self, hardware_id=None):
+        """
+        Get the most recent status of every sensor.
+
+        See `CMSession.get_fleet_snapshot`.
+
+        """
+        return await self.run_sync(
+            CMSession.get_fleet_snapshot, hardware_id=hardware_id
+        )
+
+    async def _time_filter(self, table_class, time_column, **kwargs):
+        """
+        Fiter entries by time.
+
+        See `CMSession._time_filter`, streaming is not supported.
+
+        """
+        if kwargs.get("stream"):
+            raise ValueError("stream is not supported by AsyncCMSession.")
+        return await self.run_sync(
+            CMSession._time_filter, table_class, time_column, **kwargs
+        )
+
+    async def _insert_ignoring_duplicates(
+        self, table_class, obj_list, update=False, batch_size=500
+    ):
+        """
+        Insert records in batches, handling primary key conflicts.
+
+        See `CMSession._insert_ignoring_duplicates`.
+
+        """
+        return await self.run_sync(
+            CMSession._insert_ignoring_duplicates,
+            table_class,
+            obj_list,
+            update=update,
+            batch_size=batch_size,
+        )
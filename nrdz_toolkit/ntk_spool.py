@@ -0,0 +1,169 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""
+Local SQLite spool for the status and outputs records of a sensor.
+
+The sensor tooling writes its records into a SQLite file with the same
+tables as the central database (through `DeclarativeDB`, e.g. with a
+`ntk_writer.StatusWriter`), and `replay_spool` ships the records that were
+not sent yet to the central database in large batches whenever the uplink
+is available. The foreign keys (hardware_id, metadata_id) must hold the
+central database's ids, and times should be UTC (SQLite does not keep time
+zones).
+"""
+
+import datetime
+
+from sqlalchemy import BigInteger, Column, MetaData, String, Table, event, select
+from sqlalchemy.types import DateTime
+
+from .ntk import DeclarativeDB
+from .ntk_session import CMSession
+from .ntk_tables import outputs, status
+
+# bookkeeping of the spool, kept out of CMDeclarativeBase so that it is never
+# created in the central database
+spool_metadata = MetaData()
+spool_state = Table(
+    "spool_state",
+    spool_metadata,
+    Column("table_name", String(100), primary_key=True),
+    Column("last_sent_id", BigInteger(), nullable=False),
+)
+
+# spooled tables, their identity column, which orders the records in the
+# spool (the central database assigns its own), and the columns identifying a
+# record in the central database
+spooled_tables = {
+    "status": (status, "status_id", ["hardware_id", "time"]),
+    "outputs": (outputs, "output_id", ["hardware_id", "metadata_id", "created_at"]),
+}
+
+
+def open_spool(path):
+    """
+    Open (and create if needed) a spool file.
+
+    Parameters
+    ----------
+    path : str
+        Path of the SQLite file.
+
+    Returns
+    -------
+    DeclarativeDB object
+        Database object for the spool.
+
+    """
+    db = DeclarativeDB("sqlite:///" + path)
+
+    @event.listens_for(db.engine, "connect")
+    def _set_wal(dbapi_connection, connection_record):
+        # let the collectors keep writing while the spool is replayed
+        dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
+    db.create_tables()
+    spool_metadata.create_all(db.engine)
+    return db
+
+
+def replay_spool(spool_db, central_db, tables=None, batch_size=5000, delete_sent=False):
+    """
+    Send the records in a spool that were not sent yet to the central database.
+
+    Each batch is loaded with `CMSession.bulk_copy` and committed before the
+    spool records it as sent, so a failure (e.g. the uplink dropping) loses
+    nothing and the next replay starts from the first unsent batch. A batch
+    that was committed just before a failure is sent again, its records are
+    then recognized by their sensor and time (and metadata for outputs) and
+    skipped, so they are not duplicated. For the same reason, records of a
+    sensor sharing a time (and metadata) are only sent once.
+
+    Parameters
+    ----------
+    spool_db : DB object
+        Spool database, from `open_spool`.
+    central_db : DB object
+        Central database, e.g. from `ntk.connect_to_cm_db`.
+    tables : list of str
+        Names of the tables to send, any of "status" and "outputs". Defaults
+        to both.
+    batch_size : int
+        Number of records to send per transaction.
+    delete_sent : bool
+        Option to delete the records from the spool once they are sent.
+
+    Returns
+    -------
+    dict
+        Number of records sent, keyed by table name.
+
+    """
+    if tables is None:
+        tables = list(spooled_tables)
+    if not isinstance(batch_size, int) or batch_size < 1:
+        raise ValueError("batch_size must be a positive integer.")
+
+    n_sent = {}
+    for name in tables:
+        if name not in spooled_tables:
+            raise ValueError(
+                "tables must be a subset of {t}. value was: {v}".format(
+                    t=list(spooled_tables), v=name
+                )
+            )
+        table_class, id_column, key = spooled_tables[name]
+        table = table_class.__table__
+        id_attr = table.c[id_column]
+        time_columns = [c.name for c in table.columns if isinstance(c.type, DateTime)]
+        n_sent[name] = 0
+
+        spool = CMSession(bind=spool_db.engine)
+        central = CMSession(bind=central_db.engine)
+        try:
+            last_sent = spool.execute(
+                select(spool_state.c.last_sent_id).where(
+                    spool_state.c.table_name == name
+                )
+            ).scalar()
+            while True:
+                query = select(table).order_by(id_attr).limit(batch_size)
+                if last_sent is not None:
+                    query = query.where(id_attr > last_sent)
+                records = spool.execute(query).mappings().all()
+                if len(records) == 0:
+                    break
+
+                rows = []
+                for record in records:
+                    row = {key: val for key, val in record.items() if key != id_column}
+                    for col in time_columns:
+                        if row[col] is not None and row[col].tzinfo is None:
+                            row[col] = row[col].replace(tzinfo=datetime.timezone.utc)
+                    rows.append(row)
+                central.bulk_copy(table_class, rows, key=key)
+                central.commit()
+
+                last_sent = records[-1][id_column]
+                updated = spool.execute(
+                    spool_state.update()
+                    .where(spool_state.c.table_name == name)
+                    .values(last_sent_id=last_sent)
+                ).rowcount
+                if updated == 0:
+                    spool.execute(
+                        spool_state.insert().values(
+                            table_name=name, last_sent_id=last_sent
+                        )
+                    )
+                spool.commit()
+                n_sent[name] += len(records)
+            if delete_sent and last_sent is not None:
+                spool.execute(table.delete().where(id_attr <= last_sent))
+                spool.commit()
+        finally:
+            spool.close()
+            central.close()
+    return n_sent
@@ -9,22 +9,101 @@ from sqlalchemy import (
         BigInteger, 
         Boolean,
         CHAR,
+        CheckConstraint,
         Column, 
         DateTime, 
         Float, 
         ForeignKey, 
         Identity, 
+        Index,
         Integer, 
+        LargeBinary,
         Numeric, 
+        PrimaryKeyConstraint,
         String, 
         Text, 
         func, 
-        UniqueConstraint
+        ForeignKeyConstraint,
+        UniqueConstraint,
+        event
     )
 from sqlalchemy.dialects.postgresql import INET, MACADDR
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.sql import func
 from . import CMDeclarativeBase, NotNull
 import copy
+import numpy as np
+
+
+class Float32Array(TypeDecorator):
+    """
+    One dimensional float32 array stored as raw little-endian bytes.
+
+    Values are given as anything NumPy can turn into a 1D array and read back
+    as read-only NumPy arrays that are views of the bytes returned by the
+    database driver (no copy or per-element conversion).
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    dtype = np.dtype("<f4")
+
+    @property
+    def python_type(self):
+        # the stored type, as for LargeBinary, so that the schema check
+        # (db_check.is_valid_database) matches the reflected bytea column
+        return bytes
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        value = np.asarray(value, dtype=self.dtype)
+        if value.ndim != 1:
+            raise ValueError("Float32Array values must be one dimensional.")
+        return value.tobytes()
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return np.frombuffer(value, dtype=self.dtype)
+
+    def compare_values(self, x, y):
+        if x is None or y is None:
+            return x is y
+        return np.array_equal(x, y)
+
+
+# SQLite (used e.g. for the spool on the sensors, see ntk_spool) only
+# generates keys for a lone INTEGER PRIMARY KEY column. On SQLite the identity
+# column of a composite primary key (e.g. status_id of (status_id, time)) is
+# made the primary key on its own, the rest of the key is then still unique.
+def _is_sqlite_identity_key(constraint):
+    return len(constraint.columns) > 1 and any(
+        col.identity is not None for col in constraint.columns
+    )
+
+
+@compiles(CreateColumn, "sqlite")
+def _sqlite_create_column(element, compiler, **kw):
+    column = element.element
+    if column.identity is not None and _is_sqlite_identity_key(
+        column.table.primary_key
+    ):
+        return "{c} INTEGER PRIMARY KEY AUTOINCREMENT".format(
+            c=compiler.preparer.format_column(column)
+        )
+    return compiler.visit_create_column(element, **kw)
+
+
+@compiles(PrimaryKeyConstraint, "sqlite")
+def _sqlite_primary_key(constraint, compiler, **kw):
+    if _is_sqlite_identity_key(constraint):
+        return None
+    return compiler.visit_primary_key_constraint(constraint, **kw)
+
 
 class storage(CMDeclarativeBase):
     """
@@ -95,13 +174,14 @@ class status(CMDeclarativeBase):
     Attributes:
     -----------
     status_id : Integer Column.
-        Primary key.
+        Primary key (with time).
     hostname : String Column
     time : Timestamp Column
         Timestamp in local time at which the information was collected.
-    rpi_cpu_temp : Numeric Column
+        Part of the primary key, the table is partitioned by month on it.
+    rpi_cpu_temp : Float Column
         Raspberry Pi CPU temperature.
-    sdr_temp : Numeric Column
+    sdr_temp : Float Column
         Software defined radio temperature.
     avg_cpu_usage : Float Column.
         Average CPU usage over time.
@@ -127,18 +207,28 @@ class status(CMDeclarativeBase):
     wr_crtt : Integer Column
     wr_clck_offset : Integer Column
     wr_updt_cnt : Integer Column
-    wr_temp : Numeric Column
+    wr_temp : Float Column
     wr_host : String Column
     """
        
     __tablename__ = "status"
 
+    __table_args__ = (
+            Index("ix_status_hardware_id_time", "hardware_id", "time"),
+            Index("ix_status_time_brin", "time", postgresql_using="brin"),
+            {"postgresql_partition_by": "RANGE (time)"},
+        )
+
     status_id = Column(BigInteger(), Identity(always=True), primary_key=True)
     hostname = Column(String(100), nullable=False)
-    time = Column(DateTime(timezone=True), default=func.current_timestamp())
-    rpi_cpu_temp = Column(Numeric(), nullable=False)
-    sdr_temp = Column(Numeric(), nullable=False)
-    avg_cpu_usage = Column(Numeric(), nullable=False)
+    time = Column(
+            DateTime(timezone=True),
+            primary_key=True,
+            default=func.current_timestamp()
+        )
+    rpi_cpu_temp = Column(Float(), nullable=False)
+    sdr_temp = Column(Float(), nullable=False)
+    avg_cpu_usage = Column(Float(), nullable=False)
     bytes_recorded = Column(BigInteger(), nullable=False)
     rem_nfs_storage_cap = Column(BigInteger(), nullable=False)
     rem_rpi_storage_cap = Column(BigInteger(), nullable=False)
@@ -164,7 +254,200 @@ class status(CMDeclarativeBase):
     wr_crtt = Column(Integer(), nullable=True)
     wr_clck_offset = Column(Integer(), nullable=True)
     wr_updt_cnt = Column(Integer(), nullable=True)
-    wr_temp = Column(Numeric(), nullable=True)
+    wr_temp = Column(Float(), nullable=True)
+    wr_host = Column(String(100), nullable=True)
+
+class status_latest(CMDeclarativeBase):
+    """
+    Most recent row of the status table for each sensor.
+
+    On PostgreSQL this table is kept up to date by triggers on the status
+    table, so a snapshot of the whole fleet is a read of one row per sensor
+    however much history the status table holds. The columns are the same as
+    in the status table, but keyed by hardware_id.
+
+    Attributes:
+    -----------
+    hardware_id : Integer Column
+        Foreign key from hardware table. Primary key.
+    status_id : BigInteger Column
+        status_id of the status row this row was copied from.
+    See the status table for the other columns.
+    """
+
+    __tablename__ = "status_latest"
+
+    hardware_id = Column(
+            Integer(),
+            ForeignKey(
+                "hardware.hardware_id",
+                onupdate="CASCADE",
+                ondelete="CASCADE",
+            ),
+            primary_key=True
+        )
+    status_id = Column(BigInteger(), nullable=False)
+    hostname = Column(String(100), nullable=False)
+    time = Column(DateTime(timezone=True), nullable=True)
+    rpi_cpu_temp = Column(Float(), nullable=False)
+    sdr_temp = Column(Float(), nullable=False)
+    avg_cpu_usage = Column(Float(), nullable=False)
+    bytes_recorded = Column(BigInteger(), nullable=False)
+    rem_nfs_storage_cap = Column(BigInteger(), nullable=False)
+    rem_rpi_storage_cap = Column(BigInteger(), nullable=False)
+    rpi_uptime_minutes = Column(BigInteger(), nullable=False)
+    wr_servo_state = Column(String(50), nullable=True)
+    wr_sfp1_link = Column(Boolean(), nullable=True)
+    wr_sfp2_link = Column(Boolean(), nullable=True)
+    wr_sfp1_tx = Column(BigInteger(), nullable=True)
+    wr_sfp1_rx = Column(BigInteger(), nullable=True)
+    wr_sfp2_tx = Column(BigInteger(), nullable=True)
+    wr_sfp2_rx = Column(BigInteger(), nullable=True)
+    wr_phase_setp = Column(Integer(), nullable=True)
+    wr_rtt = Column(Integer(), nullable=True)
+    wr_crtt = Column(Integer(), nullable=True)
+    wr_clck_offset = Column(Integer(), nullable=True)
+    wr_updt_cnt = Column(Integer(), nullable=True)
+    wr_temp = Column(Float(), nullable=True)
+    wr_host = Column(String(100), nullable=True)
+
+def _status_latest_ddl():
+    """
+    Build the SQL for the triggers that maintain the status_latest table.
+
+    The triggers are statement level and read the transition table of the
+    new rows, so a multi-row insert into status costs one upsert into
+    status_latest. Rows older than the stored one are ignored.
+    """
+    columns = [c.name for c in status_latest.__table__.columns]
+    col_str = ", ".join(columns)
+    set_str = ", ".join(
+        "{0} = EXCLUDED.{0}".format(c) for c in columns if c != "hardware_id"
+    )
+    function = (
+        "CREATE OR REPLACE FUNCTION status_latest_update() RETURNS trigger AS $$\n"
+        "BEGIN\n"
+        "    INSERT INTO status_latest ({cols})\n"
+        "    SELECT DISTINCT ON (hardware_id) {cols} FROM new_rows\n"
+        "    ORDER BY hardware_id, time DESC NULLS LAST, status_id DESC\n"
+        "    ON CONFLICT (hardware_id) DO UPDATE SET {sets}\n"
+        "    WHERE status_latest.time IS NULL\n"
+        "    OR EXCLUDED.time >= status_latest.time;\n"
+        "    RETURN NULL;\n"
+        "END;\n"
+        "$$ LANGUAGE plpgsql"
+    ).format(cols=col_str, sets=set_str)
+    triggers = [
+        "CREATE TRIGGER status_latest_{0} AFTER {1} ON status "
+        "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT "
+        "EXECUTE PROCEDURE status_latest_update()".format(action.lower(), action)
+        for action in ["INSERT", "UPDATE"]
+    ]
+    return function, triggers
+
+def _create_status_latest_triggers(target, connection, **kw):
+    """Create the status_latest triggers after the tables are created."""
+    if connection.dialect.name != "postgresql":
+        return
+    function, triggers = _status_latest_ddl()
+    connection.exec_driver_sql(function)
+    for action in ["insert", "update"]:
+        connection.exec_driver_sql(
+            "DROP TRIGGER IF EXISTS status_latest_{0} ON status".format(action)
+        )
+    for trigger in triggers:
+        connection.exec_driver_sql(trigger)
+
+def _drop_status_latest_triggers(target, connection, **kw):
+    """Drop the status_latest trigger function after the tables are dropped."""
+    if connection.dialect.name != "postgresql":
+        return
+    connection.exec_driver_sql("DROP FUNCTION IF EXISTS status_latest_update()")
+
+event.listen(CMDeclarativeBase.metadata, "after_create", _create_status_latest_triggers)
+event.listen(CMDeclarativeBase.metadata, "after_drop", _drop_status_latest_triggers)
+
+class status_hourly(CMDeclarativeBase):
+    """
+    Hourly summary of the status table, kept for rows past their retention age.
+
+    Filled by `CMSession.rollup_status`, which moves old status rows into
+    this table. The numeric columns of the status table are summarized by
+    their minimum, maximum and mean over the hour, the WR columns hold the
+    last value seen in the hour.
+
+    Attributes:
+    -----------
+    hardware_id : Integer Column
+        Foreign key from hardware table. Primary key (with hour).
+    hour : Timestamp Column
+        Start of the hour (UTC). Primary key (with hardware_id).
+    n_samples : Integer Column
+        Number of status rows summarized.
+    first_time : Timestamp Column
+        Time of the first status row in the hour.
+    last_time : Timestamp Column
+        Time of the last status row in the hour.
+    hostname : String Column
+        Last hostname seen in the hour.
+    <column>_min, <column>_max, <column>_mean : Columns
+        Minimum, maximum and mean of the status columns rpi_cpu_temp,
+        sdr_temp, avg_cpu_usage, bytes_recorded, rem_nfs_storage_cap,
+        rem_rpi_storage_cap and rpi_uptime_minutes.
+    wr_* : Columns
+        Last value seen in the hour of each WR column of the status table.
+    """
+
+    __tablename__ = "status_hourly"
+
+    hardware_id = Column(
+            Integer(),
+            ForeignKey(
+                "hardware.hardware_id",
+                onupdate="CASCADE",
+                ondelete="CASCADE",
+            ),
+            primary_key=True
+        )
+    hour = Column(DateTime(timezone=True), primary_key=True)
+    n_samples = Column(Integer(), nullable=False)
+    first_time = Column(DateTime(timezone=True), nullable=False)
+    last_time = Column(DateTime(timezone=True), nullable=False)
+    hostname = Column(String(100), nullable=False)
+    rpi_cpu_temp_min = Column(Float(), nullable=False)
+    rpi_cpu_temp_max = Column(Float(), nullable=False)
+    rpi_cpu_temp_mean = Column(Float(), nullable=False)
+    sdr_temp_min = Column(Float(), nullable=False)
+    sdr_temp_max = Column(Float(), nullable=False)
+    sdr_temp_mean = Column(Float(), nullable=False)
+    avg_cpu_usage_min = Column(Float(), nullable=False)
+    avg_cpu_usage_max = Column(Float(), nullable=False)
+    avg_cpu_usage_mean = Column(Float(), nullable=False)
+    bytes_recorded_min = Column(BigInteger(), nullable=False)
+    bytes_recorded_max = Column(BigInteger(), nullable=False)
+    bytes_recorded_mean = Column(Float(), nullable=False)
+    rem_nfs_storage_cap_min = Column(BigInteger(), nullable=False)
+    rem_nfs_storage_cap_max = Column(BigInteger(), nullable=False)
+    rem_nfs_storage_cap_mean = Column(Float(), nullable=False)
+    rem_rpi_storage_cap_min = Column(BigInteger(), nullable=False)
+    rem_rpi_storage_cap_max = Column(BigInteger(), nullable=False)
+    rem_rpi_storage_cap_mean = Column(Float(), nullable=False)
+    rpi_uptime_minutes_min = Column(BigInteger(), nullable=False)
+    rpi_uptime_minutes_max = Column(BigInteger(), nullable=False)
+    rpi_uptime_minutes_mean = Column(Float(), nullable=False)
+    wr_servo_state = Column(String(50), nullable=True)
+    wr_sfp1_link = Column(Boolean(), nullable=True)
+    wr_sfp2_link = Column(Boolean(), nullable=True)
+    wr_sfp1_tx = Column(BigInteger(), nullable=True)
+    wr_sfp1_rx = Column(BigInteger(), nullable=True)
+    wr_sfp2_tx = Column(BigInteger(), nullable=True)
+    wr_sfp2_rx = Column(BigInteger(), nullable=True)
+    wr_phase_setp = Column(Integer(), nullable=True)
+    wr_rtt = Column(Integer(), nullable=True)
+    wr_crtt = Column(Integer(), nullable=True)
+    wr_clck_offset = Column(Integer(), nullable=True)
+    wr_updt_cnt = Column(Integer(), nullable=True)
+    wr_temp = Column(Float(), nullable=True)
     wr_host = Column(String(100), nullable=True)
 
 class rpi(CMDeclarativeBase):
@@ -194,8 +477,8 @@ class rpi(CMDeclarativeBase):
 
     rpi_id = Column(Integer(), Identity(always=True), primary_key=True)
     hostname = Column(String(100), nullable=False, unique=True)
-    rpi_ip = Column(INET(), nullable=False)
-    rpi_mac = Column(MACADDR(), nullable=False)
+    rpi_ip = Column(INET().with_variant(String(43), "sqlite"), nullable=False)
+    rpi_mac = Column(MACADDR().with_variant(String(17), "sqlite"), nullable=False)
     rpi_v = Column(String(255), nullable=False)
     os_v = Column(String(255), nullable=False)
     memory = Column(BigInteger(), nullable=False)
@@ -244,8 +527,8 @@ class wrlen(CMDeclarativeBase):
 
     wr_id = Column(Integer(), Identity(always=True), primary_key=True)
     wr_serial = Column(String(100), nullable=True, unique=True)
-    wr_ip = Column(INET(), nullable=True)
-    wr_mac = Column(MACADDR(), nullable=True)
+    wr_ip = Column(INET().with_variant(String(43), "sqlite"), nullable=True)
+    wr_mac = Column(MACADDR().with_variant(String(17), "sqlite"), nullable=True)
     mode = Column(String(100), nullable=True)
     wr_host = Column(String(100), nullable=True)
     op_status = Column(Integer(), nullable=False)
@@ -316,9 +599,23 @@ class metadata(CMDeclarativeBase):
 class outputs(CMDeclarativeBase):
     """
     XXX DESCRIPTION NEEDED
+
+    The primary key is (output_id, created_at), the table is partitioned by
+    month on created_at.
     """
     __tablename__ = "outputs"
 
+    __table_args__ = (
+            Index(
+                "ix_outputs_hardware_id_metadata_id_created_at",
+                "hardware_id",
+                "metadata_id",
+                "created_at",
+            ),
+            Index("ix_outputs_created_at_brin", "created_at", postgresql_using="brin"),
+            {"postgresql_partition_by": "RANGE (created_at)"},
+        )
+
     output_id = Column(BigInteger(), Identity(always=True), primary_key=True)
     hardware_id = Column(
             Integer(), 
@@ -338,10 +635,83 @@ class outputs(CMDeclarativeBase):
             ), 
             nullable=False
         )
-    created_at = Column(DateTime(timezone=True), nullable=False)
-    average_db = Column(Numeric(21,16), nullable=False)
-    max_db = Column(Numeric(21,16), nullable=False)
-    median_db = Column(Numeric(21,16), nullable=False)
-    std_dev = Column(Numeric(), nullable=False)
-    kurtosis = Column(Numeric(), nullable=False)
+    created_at = Column(DateTime(timezone=True), primary_key=True)
+    average_db = Column(Float(), nullable=False)
+    max_db = Column(Float(), nullable=False)
+    median_db = Column(Float(), nullable=False)
+    std_dev = Column(Float(), nullable=False)
+    kurtosis = Column(Float(), nullable=False)
+
+
+class output_spectra(CMDeclarativeBase):
+    """
+    Power spectrum of each recording, companion of the outputs table.
+
+    Each row holds the per frequency bin statistics of one outputs row as
+    float32 arrays (see `Float32Array`), which are read back as NumPy arrays.
+
+    The primary key is (output_id, created_at), which is also the foreign
+    key to outputs. Like outputs, the table is partitioned by month on
+    created_at, its partitions need to be removed before the matching
+    outputs partitions.
+
+    Attributes:
+    -----------
+    output_id : BigInteger Column
+        output_id of the outputs row.
+    created_at : Timestamp Column
+        created_at of the outputs row.
+    n_bins : Integer Column
+        Number of frequency bins, the length of the arrays.
+    mean_power : Float32Array Column
+        Mean power in dB of each frequency bin.
+    max_power : Float32Array Column
+        Maximum power in dB of each frequency bin.
+    median_power : Float32Array Column
+        Median power in dB of each frequency bin.
+    """
+
+    __tablename__ = "output_spectra"
+
+    __table_args__ = (
+            ForeignKeyConstraint(
+                ["output_id", "created_at"],
+                ["outputs.output_id", "outputs.created_at"],
+                onupdate="CASCADE",
+                ondelete="CASCADE",
+            ),
+            CheckConstraint(
+                "length(mean_power) = 4 * n_bins "
+                "AND length(max_power) = 4 * n_bins "
+                "AND length(median_power) = 4 * n_bins",
+                name="output_spectra_n_bins_check",
+            ),
+            {"postgresql_partition_by": "RANGE (created_at)"},
+        )
+
+    output_id = Column(BigInteger(), primary_key=True)
+    created_at = Column(DateTime(timezone=True), primary_key=True)
+    n_bins = Column(Integer(), nullable=False)
+    mean_power = Column(Float32Array(), nullable=False)
+    max_power = Column(Float32Array(), nullable=False)
+    median_power = Column(Float32Array(), nullable=False)
+
+
+def _create_default_partition(target, connection, **kw):
+    """
+    Create the default partition of a table partitioned by month.
+
+    This catches rows that fall outside of the monthly partitions, which are
+    created ahead of time by `CMSession.create_time_partitions`.
+    """
+    if connection.dialect.name != "postgresql":
+        return
+    connection.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS {0}_default PARTITION OF {0} DEFAULT".format(
+            target.name
+        )
+    )
 
+event.listen(status.__table__, "after_create", _create_default_partition)
+event.listen(outputs.__table__, "after_create", _create_default_partition)
+event.listen(output_spectra.__table__, "after_create", _create_default_partition)
@@ -0,0 +1,394 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""
+Background (write-behind) writers for the telemetry tables.
+
+Collectors hand records to a writer, which buffers them and inserts them in
+batches from a background thread, so collecting never waits on the database.
+If the database cannot be reached, the batches are appended to a local spill
+file and replayed once it is back. Records are written at least once: a
+batch that was committed just before a failure can be sent again, its
+records are then recognized by their sensor and time (see `ntk_spool`) and
+skipped, so they are not duplicated. Records
+the database rejects (e.g. for a constraint violation) are isolated from the
+rest of their batch and set aside in a ".rejected" file next to the spill
+file (or logged, without a spill file).
+
+Example::
+
+    writer = StatusWriter(db, spill_file="/var/spool/nrdz/status.jsonl")
+    writer.write({"hostname": "rpi1", "hardware_id": 1, ...})
+    ...
+    writer.close()
+"""
+
+import atexit
+import datetime
+import decimal
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.types import DateTime, Numeric
+
+from .ntk_tables import outputs, status
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(value):
+    """Encode the values json does not handle natively."""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if hasattr(value, "item"):
+        # numpy scalars
+        return value.item()
+    raise TypeError("cannot encode {v!r} for the spill file".format(v=value))
+
+
+def _is_unreachable(err):
+    """Check if a database error means the database could not be reached."""
+    if isinstance(err, (OSError, OperationalError, InterfaceError)):
+        return True
+    return isinstance(err, DBAPIError) and err.connection_invalidated
+
+
+class _TableWriter(object):
+    """
+    Base class of the background writers.
+
+    Parameters
+    ----------
+    db : DB object
+        Database to write to, from `ntk.connect_to_cm_db`.
+    batch_size : int
+        Maximum number of records inserted at a time.
+    flush_interval : float
+        Maximum time (in seconds) a record waits in the buffer.
+    max_buffer : int
+        Maximum number of records in the buffer. Once it is full `write`
+        blocks until there is room again (backpressure).
+    spill_file : str
+        Path of the file to append batches to while the database is
+        unreachable. If None, failed batches are retried from memory: up to
+        max_buffer records are held for the retry, then no more records are
+        taken from the buffer and `write` blocks until the database is back.
+    retry_interval : float
+        Time (in seconds) to wait after a failure before trying the database
+        again. Batches are spilled without trying the database meanwhile.
+
+    """
+
+    table_class = None
+    time_column = None
+    # columns identifying a record, the ids are assigned by the database
+    key = None
+
+    def __init__(
+        self,
+        db,
+        batch_size=500,
+        flush_interval=5.0,
+        max_buffer=10000,
+        spill_file=None,
+        retry_interval=30.0,
+    ):
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise ValueError("batch_size must be a positive integer.")
+        if not isinstance(max_buffer, int) or max_buffer < 1:
+            raise ValueError("max_buffer must be a positive integer.")
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_file = spill_file
+        self.retry_interval = retry_interval
+        self.max_buffer = max_buffer
+        self.n_written = 0
+        self.n_spilled = 0
+        self.n_rejected = 0
+
+        self._columns = {col.key: col for col in self.table_class.__table__.columns}
+        self._queue = queue.Queue(maxsize=max_buffer)
+        self._retry_after = 0.0
+        self._closed = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="{c}-{t}".format(c=type(self).__name__, t=self.table_class.__tablename__),
+            daemon=True,
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def __enter__(self):
+        """Enter the writer."""
+        return self
+
+    def __exit__(self, etype, evalue, etb):
+        """Exit the writer, writing out the buffered records."""
+        self.close()
+        return False  # propagate exception if any occurred
+
+    def write(self, record, timeout=None):
+        """
+        Add a record to the buffer.
+
+        Parameters
+        ----------
+        record : dict or table object
+            Record to write. If it has no time, it gets the current time.
+        timeout : float
+            Maximum time (in seconds) to wait for room in the buffer. Waits
+            as long as needed if None.
+
+        Raises
+        ------
+        queue.Full
+            If there is still no room in the buffer after timeout seconds.
+
+        """
+        if self._closed.is_set():
+            raise ValueError("cannot write to a closed writer.")
+        if isinstance(record, dict):
+            row = {key: val for key, val in record.items() if key in self._columns}
+        else:
+            row = {key: getattr(record, key) for key in self._columns}
+        if row.get(self.time_column) is None:
+            row[self.time_column] = datetime.datetime.now(datetime.timezone.utc)
+        self._queue.put(row, timeout=timeout)
+
+    def flush(self):
+        """
+        Wait until every record written so far is in the database or spilled
+        (or, without a spill file, held in memory for a retry).
+        """
+        self._queue.join()
+
+    def close(self):
+        """Write out the buffered records and stop the background thread."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def replay(self):
+        """
+        Insert the records in the spill file into the database.
+
+        This is done automatically by the background thread, it can also be
+        called to replay a spill file left behind by another process (with
+        the same spill_file path) while no writer is using it. Records the
+        database rejects (e.g. for a constraint violation) are moved to a
+        ".rejected" file next to the spill file.
+
+        Returns
+        -------
+        bool
+            True if the spill file was fully replayed (or there was none).
+
+        """
+        if self.spill_file is None:
+            return True
+        replay_file = self.spill_file + ".replay"
+        if not os.path.exists(replay_file):
+            if not os.path.exists(self.spill_file):
+                return True
+            # new spills go to a fresh file while this one is replayed
+            os.replace(self.spill_file, replay_file)
+
+        # read a batch at a time, the file can be large after a long outage
+        with open(replay_file, "rb") as f:
+            while True:
+                # offset of the start of each line, to rewrite from
+                offsets = []
+                lines = []
+                while len(lines) < self.batch_size:
+                    offset = f.tell()
+                    line = f.readline()
+                    if not line:
+                        break
+                    if line.strip():
+                        offsets.append(offset)
+                        lines.append(line)
+                if len(lines) == 0:
+                    break
+                rows = [self._decode(line) for line in lines]
+                unwritten = self._insert_or_reject(rows)
+                if unwritten:
+                    # keep what is left for the next attempt
+                    f.seek(offsets[len(rows) - len(unwritten)])
+                    temp_file = replay_file + ".tmp"
+                    with open(temp_file, "wb") as temp:
+                        shutil.copyfileobj(f, temp)
+                    os.replace(temp_file, replay_file)
+                    return False
+        os.remove(replay_file)
+        if os.path.exists(self.spill_file):
+            return self.replay()
+        return True
+
+    def _run(self):
+        """Collect records into batches and write them until closed."""
+        pending = []
+        while True:
+            deadline = time.monotonic() + self.flush_interval
+            batch = []
+            # records held for a retry count against max_buffer, once it is
+            # reached the queue fills up and `write` blocks (until closing,
+            # when the queue is drained for a last attempt)
+            n_batch = self.batch_size
+            if not self._closed.is_set():
+                n_batch = min(n_batch, self.max_buffer - len(pending))
+            while len(batch) < n_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=min(remaining, 0.1)))
+                except queue.Empty:
+                    if self._closed.is_set():
+                        break
+            closing = self._closed.is_set() and self._queue.empty()
+
+            if time.monotonic() >= self._retry_after:
+                try:
+                    self.replay()
+                except Exception:  # pragma: no cover
+                    logger.exception("replaying the spill file failed")
+            pending.extend(batch)
+            if pending:
+                pending = self._write_batch(pending, final=closing)
+            for _ in batch:
+                self._queue.task_done()
+            if closing:
+                if pending:
+                    logger.error(
+                        "%s: %d records could not be written", type(self).__name__,
+                        len(pending),
+                    )
+                return
+
+    def _write_batch(self, rows, final=False):
+        """
+        Insert a batch, spilling it if the database cannot be reached.
+
+        Returns
+        -------
+        list of dict
+            Records to retry from memory (only without a spill file).
+
+        """
+        if time.monotonic() >= self._retry_after:
+            rows = self._insert_or_reject(rows)
+            if not rows:
+                return []
+        if self.spill_file is None:
+            if not final:
+                time.sleep(min(self.retry_interval, 1.0))
+            return rows
+        self._spill(rows)
+        return []
+
+    def _insert_or_reject(self, rows):
+        """
+        Insert records, setting aside the ones the database rejects.
+
+        A batch the database rejects for a reason other than being
+        unreachable (e.g. a constraint violation) is split in halves, which
+        are inserted separately, until the rejected records are isolated. A
+        bad record costs about 2 log2(len(rows)) extra inserts and the rest
+        of its batch is still written.
+
+        Returns
+        -------
+        list of dict
+            Records left unwritten because the database became unreachable,
+            always the last ones of rows.
+
+        """
+        try:
+            self._insert(rows)
+            return []
+        except (DBAPIError, OSError) as err:
+            if _is_unreachable(err):
+                logger.warning("%s: database unreachable (%s)", type(self).__name__, err)
+                self._retry_after = time.monotonic() + self.retry_interval
+                return rows
+            if len(rows) == 1:
+                self._reject(rows[0], err)
+                return []
+        half = len(rows) // 2
+        unwritten = self._insert_or_reject(rows[:half])
+        if unwritten:
+            return unwritten + rows[half:]
+        return self._insert_or_reject(rows[half:])
+
+    def _reject(self, row, err):
+        """Set aside a record the database rejected."""
+        self.n_rejected += 1
+        if self.spill_file is None:
+            logger.error(
+                "%s: dropping a rejected record (%s): %r", type(self).__name__,
+                err, row,
+            )
+            return
+        logger.error(
+            "%s: moving a rejected record to %s (%s)", type(self).__name__,
+            self.spill_file + ".rejected", err,
+        )
+        with open(self.spill_file + ".rejected", "a") as f:
+            f.write(json.dumps(row, default=_json_default) + "\n")
+
+    def _insert(self, rows):
+        with self.db.sessionmaker() as session:
+            session.bulk_copy(
+                self.table_class, rows, chunk_size=self.batch_size, key=self.key
+            )
+        self.n_written += len(rows)
+
+    def _spill(self, rows):
+        """Append records to the spill file and make sure they are on disk."""
+        with open(self.spill_file, "a") as f:
+            for row in rows:
+                f.write(json.dumps(row, default=_json_default) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.n_spilled += len(rows)
+
+    def _decode(self, line):
+        """Read a record from a line of the spill file."""
+        row = json.loads(line)
+        for key, val in row.items():
+            if val is None:
+                continue
+            sqltype = self._columns[key].type
+            if isinstance(sqltype, DateTime):
+                row[key] = datetime.datetime.fromisoformat(val)
+            elif isinstance(sqltype, Numeric) and isinstance(val, str):
+                row[key] = decimal.Decimal(val)
+        return row
+
+
+class StatusWriter(_TableWriter):
+    """Background writer for the status table, see `_TableWriter`."""
+
+    table_class = status
+    time_column = "time"
+    key = ["hardware_id", "time"]
+
+
+class OutputsWriter(_TableWriter):
+    """Background writer for the outputs table, see `_TableWriter`."""
+
+    table_class = outputs
+    time_column = "created_at"
+    key = ["hardware_id", "metadata_id", "created_at"]
@@ -0,0 +1,93 @@
+#! /usr/bin/env python
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""
+Compare the storage and read cost of numeric and double precision columns.
+
+Loads the same random outputs-like records (five measurement columns) into
+two temporary tables, one with the numeric types the measurements used to
+have and one with double precision, then reports the size of each table and
+the best time to read all the records through SQLAlchemy. The temporary
+tables disappear with the connection, nothing is left in the database.
+Requires PostgreSQL.
+"""
+
+import time
+
+from sqlalchemy import text
+
+from nrdz_toolkit import ntk
+
+# measurement columns of outputs with their old (numeric) types
+columns = {
+    "average_db": "numeric(21, 16)",
+    "max_db": "numeric(21, 16)",
+    "median_db": "numeric(21, 16)",
+    "std_dev": "numeric",
+    "kurtosis": "numeric",
+}
+
+if __name__ == "__main__":
+    parser = ntk.get_cm_argument_parser()
+    parser.add_argument(
+        "--n-records",
+        type=int,
+        default=500000,
+        help="Number of records to load into each table.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of times to read each table, the best time is reported.",
+    )
+    args = parser.parse_args()
+
+    db = ntk.connect_to_cm_db(args)
+    with db.engine.connect() as conn:
+        for name, float_types in [("numeric", False), ("double", True)]:
+            table = "_ntk_bench_" + name
+            conn.execute(
+                text(
+                    "CREATE TEMPORARY TABLE {t} (id bigint PRIMARY KEY, {c})".format(
+                        t=table,
+                        c=", ".join(
+                            "{c} {n}".format(
+                                c=col, n="double precision" if float_types else typ
+                            )
+                            for col, typ in columns.items()
+                        ),
+                    )
+                )
+            )
+            conn.execute(
+                text(
+                    "INSERT INTO {t} SELECT g, -80 - random() * 10, "
+                    "-60 - random() * 10, -80 - random() * 10, random() * 3, "
+                    "random() * 5 FROM generate_series(1, :n) AS g".format(t=table)
+                ),
+                {"n": args.n_records},
+            )
+            size = conn.execute(
+                text("SELECT pg_table_size(CAST(:t AS regclass))"), {"t": table}
+            ).scalar()
+
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                rows = conn.execute(text("SELECT * FROM {t}".format(t=table))).all()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print(
+                "{n:>8}: {s:6.1f} MB, read in {t:.2f} s (best of {r}), "
+                "values are {v}".format(
+                    n=name,
+                    s=size / 2**20,
+                    t=best,
+                    r=args.repeat,
+                    v=type(rows[0][1]).__name__,
+                )
+            )
+        conn.rollback()
@@ -0,0 +1,67 @@
+#! /usr/bin/env python
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""
+Manage the monthly partitions of the status, outputs and output_spectra
+tables.
+
+Creates the partitions for the coming months and, if a retention period is
+given, detaches (or drops) the partitions that have expired. Intended to be
+run regularly, e.g. from a daily cron job.
+"""
+
+from nrdz_toolkit import ntk, ntk_tables
+
+# output_spectra references outputs, so its expired partitions must be
+# removed first
+partitioned_tables = {
+    "status": ntk_tables.status,
+    "output_spectra": ntk_tables.output_spectra,
+    "outputs": ntk_tables.outputs,
+}
+
+if __name__ == "__main__":
+    parser = ntk.get_cm_argument_parser()
+    parser.add_argument(
+        "--tables",
+        nargs="+",
+        choices=list(partitioned_tables),
+        default=list(partitioned_tables),
+        help="Tables to manage the partitions of (default: all).",
+    )
+    parser.add_argument(
+        "--months-ahead",
+        type=int,
+        default=3,
+        help="Number of months after the current one to create partitions for.",
+    )
+    parser.add_argument(
+        "--keep-months",
+        type=int,
+        default=None,
+        help="Number of months before the current one to keep. Older "
+        "partitions are detached. Nothing is removed if unspecified.",
+    )
+    parser.add_argument(
+        "--drop",
+        action="store_true",
+        help="Drop the expired partitions instead of detaching them.",
+    )
+    args = parser.parse_args()
+
+    db = ntk.connect_to_cm_db(args)
+    with db.sessionmaker() as session:
+        for name in [name for name in partitioned_tables if name in args.tables]:
+            table_class = partitioned_tables[name]
+            for partition in session.create_time_partitions(
+                table_class, months_ahead=args.months_ahead
+            ):
+                print("created partition {p}".format(p=partition))
+            if args.keep_months is not None:
+                for partition in session.remove_time_partitions(
+                    table_class, args.keep_months, drop=args.drop
+                ):
+                    action = "dropped" if args.drop else "detached"
+                    print("{a} partition {p}".format(a=action, p=partition))
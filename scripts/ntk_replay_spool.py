@@ -0,0 +1,49 @@
+#! /usr/bin/env python
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""
+Send the records in a sensor's local spool to the central database.
+
+Only the records that were not sent yet are sent, in large batches. Intended
+to be run regularly on the sensor, e.g. from a cron job, it is safe to run
+while the uplink is unreliable.
+"""
+
+from nrdz_toolkit import ntk, ntk_spool
+
+if __name__ == "__main__":
+    parser = ntk.get_cm_argument_parser()
+    parser.add_argument("spool", type=str, help="Path of the spool (SQLite) file.")
+    parser.add_argument(
+        "--tables",
+        nargs="+",
+        choices=list(ntk_spool.spooled_tables),
+        default=list(ntk_spool.spooled_tables),
+        help="Tables to send (default: all).",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=5000,
+        help="Number of records to send per transaction.",
+    )
+    parser.add_argument(
+        "--delete-sent",
+        action="store_true",
+        help="Delete the records from the spool once they are sent.",
+    )
+    args = parser.parse_args()
+
+    central_db = ntk.connect_to_cm_db(args)
+    spool_db = ntk_spool.open_spool(args.spool)
+    n_sent = ntk_spool.replay_spool(
+        spool_db,
+        central_db,
+        tables=args.tables,
+        batch_size=args.batch_size,
+        delete_sent=args.delete_sent,
+    )
+    for name, n_records in n_sent.items():
+        print("sent {n} {t} records".format(n=n_records, t=name))
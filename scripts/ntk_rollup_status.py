@@ -0,0 +1,37 @@
+#! /usr/bin/env python
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""
+Roll old status records up into hourly summaries.
+
+Status records older than the given age are summarized per sensor and hour
+in the status_hourly table and deleted from the status table, in small
+batches. Intended to be run regularly, e.g. from a daily cron job.
+"""
+
+from nrdz_toolkit import ntk
+
+if __name__ == "__main__":
+    parser = ntk.get_cm_argument_parser()
+    parser.add_argument(
+        "--max-age-days",
+        type=float,
+        default=28,
+        help="Age (in days) past which status records are rolled up.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=10000,
+        help="Maximum number of status records to move per transaction.",
+    )
+    args = parser.parse_args()
+
+    db = ntk.connect_to_cm_db(args)
+    with db.sessionmaker() as session:
+        n_rows = session.rollup_status(
+            max_age_days=args.max_age_days, batch_size=args.batch_size
+        )
+        print("rolled up {n} status records".format(n=n_rows))
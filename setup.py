@@ -34,13 +34,26 @@ setup_args = {
     ],
     "extras_require": {
         "sqlite": ["tabulate"],
-        "all": ["h5py", "pandas", "psutil", "python-dateutil", "tabulate"],
+        "async": ["asyncpg", "greenlet"],
+        "all": [
+            "asyncpg",
+            "greenlet",
+            "h5py",
+            "pandas",
+            "psutil",
+            "python-dateutil",
+            "tabulate",
+            "zstandard",
+        ],
         "dev": [
+            "asyncpg",
+            "greenlet",
             "h5py",
             "pandas",
             "psutil",
             "python-dateutil",
             "tabulate",
+            "zstandard",
             "pytest",
             "pre-commit",
         ],
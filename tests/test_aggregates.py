@@ -0,0 +1,48 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""Tests of CMSession.get_status_aggregates."""
+
+import datetime
+
+import pytest
+from astropy.time import Time
+from sqlalchemy import text
+
+from conftest import t0
+from nrdz_toolkit.ntk_tables import status
+
+day = datetime.timedelta(days=1)
+
+
+@pytest.mark.parametrize("timezone", ["UTC", "America/Denver", "Asia/Tokyo"])
+def test_buckets_are_utc(session, make_status, timezone):
+    # hourly records for 30 hours from midnight UTC, on two sensors
+    for hardware_id in [1, 2]:
+        session.bulk_copy(
+            status, make_status(30, hardware_id=hardware_id, step=3600)
+        )
+    session.commit()
+    session.execute(text("SET TIME ZONE '{z}'".format(z=timezone)))
+
+    rows = session.get_status_aggregates(
+        "day",
+        ["sdr_temp", "rpi_cpu_temp"],
+        Time(t0),
+        Time(t0 + 2 * day),
+        hardware_ids=[2],
+    )
+    assert [(row.hardware_id, row.bucket, row.sdr_temp_count) for row in rows] == [
+        (2, t0, 24),
+        (2, t0 + day, 6),
+    ]
+    assert rows[0].rpi_cpu_temp_min == 40.0
+    assert rows[0].rpi_cpu_temp_max == 49.0
+
+    rows = session.get_status_aggregates(
+        6 * 3600, "sdr_temp", Time(t0), Time(t0 + 2 * day), aggs="count"
+    )
+    assert len(rows) == 10
+    assert rows[4].bucket == t0 + day
+    assert [row.sdr_temp_count for row in rows[:5]] == [6, 6, 6, 6, 6]
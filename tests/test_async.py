@@ -0,0 +1,101 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""Tests of AsyncDB and AsyncCMSession on asyncpg."""
+
+import asyncio
+import json
+
+import pytest
+from astropy.time import Time
+
+from conftest import test_db_url
+from nrdz_toolkit import ntk, ntk_session
+from nrdz_toolkit.ntk_tables import status
+
+pytest.importorskip("asyncpg")
+
+
+@pytest.fixture
+def async_args(session, tmp_path):
+    """Arguments of connect_to_cm_db_async for the (emptied) test database."""
+    config_path = tmp_path / "cm.json"
+    config_path.write_text(
+        json.dumps(
+            {
+                "default_db_name": "test",
+                "databases": {
+                    "test": {"url": test_db_url, "mode": "testing", "pool_size": 2}
+                },
+            }
+        )
+    )
+    return ntk.get_cm_argument_parser().parse_args(["--config", str(config_path)])
+
+
+def test_async_session(async_args, make_status):
+    rows = [dict(row, status_id=i + 1) for i, row in enumerate(make_status(5))]
+
+    async def run():
+        db = await ntk.connect_to_cm_db_async(async_args)
+        try:
+            assert db.engine.url.drivername == "postgresql+asyncpg"
+            async with db.sessionmaker() as session:
+                first = await session._insert_ignoring_duplicates(
+                    status, [status(**row) for row in rows[:3]], batch_size=2
+                )
+            # the first records are sent again with the rest
+            async with db.sessionmaker() as session:
+                again = await session._insert_ignoring_duplicates(
+                    status, [status(**row) for row in rows], batch_size=2
+                )
+
+            async with db.sessionmaker() as session:
+                latest = await session._time_filter(
+                    status, "time", filter_column="hardware_id", filter_value=1
+                )
+                records = await session._time_filter(
+                    status,
+                    "time",
+                    most_recent=False,
+                    starttime=Time(rows[1]["time"]),
+                    stoptime=Time(rows[3]["time"]),
+                )
+                with pytest.raises(ValueError, match="stream"):
+                    await session._time_filter(status, "time", stream=True)
+
+                ntk_session._clock_offsets.clear()
+                db_time = await session.get_current_db_time()
+                forced = await session.get_current_db_time(force=True)
+            return first, again, latest, records, db_time, forced
+        finally:
+            await db.dispose()
+
+    first, again, latest, records, db_time, forced = asyncio.run(run())
+    assert first == {"inserted": 3, "updated": 0, "skipped": 0}
+    assert again == {"inserted": 2, "updated": 0, "skipped": 3}
+    assert [rec.bytes_recorded for rec in latest] == [4]
+    assert [rec.bytes_recorded for rec in records] == [1, 2, 3]
+    assert abs((db_time - Time.now()).sec) < 5
+    assert abs((forced - Time.now()).sec) < 5
+
+
+def test_connect_failure(tmp_path):
+    config_path = tmp_path / "cm.json"
+    config_path.write_text(
+        json.dumps(
+            {
+                "default_db_name": "test",
+                "databases": {
+                    "test": {
+                        "url": "postgresql://nobody@127.0.0.1:1/nowhere",
+                        "mode": "testing",
+                    }
+                },
+            }
+        )
+    )
+    args = ntk.get_cm_argument_parser().parse_args(["--config", str(config_path)])
+    with pytest.raises(RuntimeError, match="connection"):
+        asyncio.run(ntk.connect_to_cm_db_async(args))
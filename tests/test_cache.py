@@ -0,0 +1,65 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""Tests of the query cache invalidation on commit."""
+
+import pytest
+
+from nrdz_toolkit.ntk_cache import QueryCache
+from nrdz_toolkit.ntk_tables import status
+
+
+@pytest.mark.parametrize("method", ["_insert_ignoring_duplicates", "bulk_copy"])
+def test_commit_invalidates_cached_reads(session, make_status, method):
+    session.query_cache = QueryCache(ttl=600)
+
+    def read():
+        latest = session._time_filter(
+            status, "time", filter_column="hardware_id", filter_value=1
+        )
+        snapshot = session.get_fleet_snapshot()
+        return (
+            [rec.bytes_recorded for rec in latest],
+            [(rec.hardware_id, rec.bytes_recorded) for rec in snapshot],
+        )
+
+    rows = make_status(3)
+    session.bulk_copy(status, rows[:2])
+    session.commit()
+    assert read() == ([1], [(1, 1)])
+    # the second read comes from the cache
+    assert read() == ([1], [(1, 1)])
+    assert session.query_cache.hits == 2
+
+    if method == "bulk_copy":
+        session.bulk_copy(status, rows[2:])
+    else:
+        session._insert_ignoring_duplicates(status, [status(**rows[2])])
+    session.commit()
+    assert read() == ([2], [(1, 2)])
+
+
+def test_pending_delete_bypasses_cache(session, make_status):
+    session.query_cache = QueryCache(ttl=600)
+    session.bulk_copy(status, make_status(2))
+    session.commit()
+
+    def read():
+        return [
+            rec.bytes_recorded
+            for rec in session._time_filter(
+                status, "time", filter_column="hardware_id", filter_value=1
+            )
+        ]
+
+    assert read() == [1]
+    assert read() == [1]
+    assert session.query_cache.hits == 1
+
+    # the delete is not flushed yet, the read must not come from the cache
+    latest = session.query(status).filter_by(bytes_recorded=1).one()
+    session.delete(latest)
+    assert session.deleted
+    assert read() == [0]
+    assert session.query_cache.hits == 1
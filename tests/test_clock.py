@@ -0,0 +1,86 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""Tests of the cached database clock offset of CMSession.get_current_db_time."""
+
+import datetime
+import time
+
+import pytest
+from astropy.time import Time
+
+from nrdz_toolkit import ntk_session
+
+
+class _Result:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+@pytest.fixture
+def clock(session, monkeypatch):
+    """Database clock 100 s ahead of the local one, with a settable monotonic."""
+    ntk_session._clock_offsets.clear()
+    queries = []
+    monotonic = [1000.0]
+
+    def execute(statement, *args, **kwargs):
+        queries.append(str(statement))
+        return _Result(
+            datetime.datetime.fromtimestamp(
+                time.time() + 100, tz=datetime.timezone.utc
+            )
+        )
+
+    monkeypatch.setattr(session, "execute", execute)
+    monkeypatch.setattr(ntk_session.time, "monotonic", lambda: monotonic[0])
+    yield queries, monotonic
+    ntk_session._clock_offsets.clear()
+
+
+def _offset(db_time):
+    return (db_time - Time.now()).sec
+
+
+def test_offset_is_cached(session, clock):
+    queries, monotonic = clock
+    session.clock_refresh_interval = 600.0
+
+    for _ in range(3):
+        assert _offset(session.get_current_db_time()) == pytest.approx(100, abs=1)
+        monotonic[0] += 100
+    assert len(queries) == 1
+    assert "clock_timestamp" in queries[0]
+
+    # past the refresh interval the offset is measured again, once
+    monotonic[0] += 400
+    for _ in range(3):
+        assert _offset(session.get_current_db_time()) == pytest.approx(100, abs=1)
+    assert len(queries) == 2
+
+
+def test_force_queries_every_time(session, clock):
+    queries, _ = clock
+
+    session.get_current_db_time()
+    assert len(queries) == 1
+    for _ in range(2):
+        assert _offset(session.get_current_db_time(force=True)) == pytest.approx(
+            100, abs=1
+        )
+    assert len(queries) == 3
+    assert all("current_timestamp" in query.lower() for query in queries[1:])
+
+    # forced reads do not touch the cached offset
+    session.get_current_db_time()
+    assert len(queries) == 3
+
+
+def test_real_database_time(session):
+    ntk_session._clock_offsets.clear()
+    assert abs(_offset(session.get_current_db_time())) < 5
+    assert abs(_offset(session.get_current_db_time(force=True))) < 5
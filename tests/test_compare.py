@@ -0,0 +1,45 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""Tests of the bulk comparison of records."""
+
+import numpy as np
+
+from conftest import t0
+from nrdz_toolkit.ntk_compare import compare_rows
+from nrdz_toolkit.ntk_tables import output_spectra
+
+
+def _spectra(output_id, mean_power, max_power=(1.0, 2.0, 3.0), median_power=None):
+    return {
+        "output_id": output_id,
+        "created_at": t0,
+        "n_bins": len(mean_power),
+        "mean_power": np.asarray(mean_power, dtype="<f4"),
+        "max_power": np.asarray(max_power, dtype="<f4"),
+        "median_power": median_power,
+    }
+
+
+def test_compare_array_columns():
+    rows_a = [
+        _spectra(1, [1.0, 2.0, 3.0]),
+        _spectra(2, [1.0, 2.0, 3.0]),
+        _spectra(3, [1.0, 2.0, 3.0]),
+        _spectra(4, [1.0, 2.0, 3.0], median_power=np.zeros(3, dtype="<f4")),
+    ]
+    rows_b = [
+        # within numpy's default tolerances
+        _spectra(1, [1.0, 2.0, 3.0 + 1e-6]),
+        _spectra(2, [1.0, 2.0, 3.1]),
+        _spectra(3, [1.0, 2.0, 3.0], max_power=[1.0, 2.0]),
+        _spectra(4, [1.0, 2.0, 3.0]),
+    ]
+    result = compare_rows(output_spectra, rows_a, rows_b)
+    assert result["only_a"] == [] and result["only_b"] == []
+    assert result["different"] == {
+        (2, t0): ["mean_power"],
+        (3, t0): ["max_power"],
+        (4, t0): ["median_power"],
+    }
@@ -0,0 +1,137 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""Tests of the database connections made by ntk.connect_to_cm_db."""
+
+import json
+import os
+
+import pytest
+from sqlalchemy import text
+
+from conftest import test_db_url
+from nrdz_toolkit import ntk
+
+# never connected to, engines connect lazily
+url = "postgresql://nobody@localhost/nowhere"
+
+
+def _config(path, **entry):
+    databases = {
+        name: dict({"url": url, "mode": "testing"}, **entry) for name in ["a", "b"]
+    }
+    path.write_text(json.dumps({"default_db_name": "a", "databases": databases}))
+    return str(path)
+
+
+def _args(config_path, *extra):
+    return ntk.get_cm_argument_parser().parse_args(["--config", config_path, *extra])
+
+
+def _has_asyncpg():
+    try:
+        import asyncpg  # noqa
+    except ImportError:
+        return False
+    return True
+
+
+@pytest.fixture(autouse=True)
+def empty_db_cache():
+    ntk.clear_db_cache()
+    yield
+    ntk.clear_db_cache()
+
+
+def test_pool_options(tmp_path, monkeypatch):
+    created = []
+    create_engine = ntk.create_engine
+
+    def record(db_url, **kwargs):
+        created.append((db_url, kwargs))
+        return create_engine(db_url, **kwargs)
+
+    monkeypatch.setattr(ntk, "create_engine", record)
+    config_path = _config(
+        tmp_path / "cm.json",
+        pool_size=3,
+        max_overflow=1,
+        pool_timeout=5,
+        pool_recycle=60,
+        pool_pre_ping=True,
+        replicas=[url + "_replica"],
+    )
+    db = ntk.connect_to_cm_db(_args(config_path), check_connect=False)
+
+    pool_options = {
+        "pool_size": 3,
+        "max_overflow": 1,
+        "pool_timeout": 5,
+        "pool_recycle": 60,
+        "pool_pre_ping": True,
+    }
+    assert created == [(url, pool_options), (url + "_replica", pool_options)]
+    assert db.engine.pool.size() == 3
+    assert db.engine.pool._pre_ping
+    assert db.replicas.engines[0].pool.size() == 3
+
+
+def test_db_cache(tmp_path):
+    config_path = _config(tmp_path / "cm.json")
+    other_path = _config(tmp_path / "other.json")
+
+    db = ntk.connect_to_cm_db(_args(config_path), check_connect=False)
+    assert ntk.connect_to_cm_db(_args(config_path), check_connect=False) is db
+    # another database or config file has its own DB object
+    db_b = ntk.connect_to_cm_db(_args(config_path, "--db", "b"), check_connect=False)
+    db_other = ntk.connect_to_cm_db(_args(other_path), check_connect=False)
+    assert len({id(db), id(db_b), id(db_other)}) == 3
+    assert ntk.connect_to_cm_db(_args(other_path), check_connect=False) is db_other
+
+    uncached = ntk.connect_to_cm_db(
+        _args(config_path), check_connect=False, use_cache=False
+    )
+    assert uncached is not db
+    assert ntk.connect_to_cm_db(_args(config_path), check_connect=False) is db
+
+
+def test_dispose_engines_after_fork(tmp_path):
+    db = ntk.connect_to_cm_db(
+        _args(_config(tmp_path / "cm.json", replicas=[url])), check_connect=False
+    )
+    async_db = ntk.AsyncDB(url) if _has_asyncpg() else None
+    pools = [db.engine.pool, db.replicas.engines[0].pool]
+    if async_db is not None:
+        pools.append(async_db.engine.sync_engine.pool)
+
+    ntk._dispose_engines_after_fork()
+
+    new_pools = [db.engine.pool, db.replicas.engines[0].pool]
+    if async_db is not None:
+        new_pools.append(async_db.engine.sync_engine.pool)
+    assert all(new is not old for new, old in zip(new_pools, pools))
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_fork_gets_own_connections(db):
+    with db.engine.connect() as conn:
+        parent_pid = conn.execute(text("SELECT pg_backend_pid()")).scalar()
+    # the pooled connection of the parent is not used by the child
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # pragma: no cover
+        try:
+            with db.engine.connect() as conn:
+                child_pid = conn.execute(text("SELECT pg_backend_pid()")).scalar()
+            os.write(write, str(child_pid).encode())
+        finally:
+            os._exit(0)
+    os.close(write)
+    child_pid = int(os.read(read, 32) or 0)
+    os.close(read)
+    os.waitpid(pid, 0)
+    assert child_pid not in [0, parent_pid]
+
+    with db.engine.connect() as conn:
+        assert conn.execute(text("SELECT pg_backend_pid()")).scalar() == parent_pid
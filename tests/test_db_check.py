@@ -0,0 +1,70 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""Tests of the schema check of existing databases."""
+
+import json
+
+import pytest
+from sqlalchemy import text
+
+from conftest import test_db_url
+from nrdz_toolkit import CMDeclarativeBase, db_check, ntk
+
+
+@pytest.fixture
+def fingerprint_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "schema_fingerprints.json")
+    monkeypatch.setattr(db_check, "fingerprint_file", path)
+    return path
+
+
+@pytest.mark.parametrize("migrated", [True, False])
+def test_automapped_db(db, migrated, fingerprint_file, request):
+    if migrated:
+        url = request.getfixturevalue("migrated_db_url")
+    else:
+        url = test_db_url
+    automapped = ntk.AutomappedDB(url)
+    automapped.engine.dispose()
+
+
+def _count_full_checks(monkeypatch):
+    calls = []
+    full_check = db_check.is_valid_database
+
+    def _counted(base, session):
+        calls.append(session)
+        return full_check(base, session)
+
+    monkeypatch.setattr(db_check, "is_valid_database", _counted)
+    return calls
+
+
+def test_check_database_fingerprint(migrated_db_url, fingerprint_file, monkeypatch):
+    automapped = ntk.AutomappedDB(migrated_db_url)
+    calls = _count_full_checks(monkeypatch)
+    with automapped.sessionmaker() as session:
+        # the fingerprint matches, nothing is reflected
+        assert db_check.check_database(CMDeclarativeBase, session)
+        assert len(calls) == 0
+
+        # a migration changes the revision, the full check runs again
+        session.execute(text("UPDATE alembic_version SET version_num = 'next'"))
+        session.commit()
+        assert db_check.check_database(CMDeclarativeBase, session)
+        assert len(calls) == 1
+        assert db_check.check_database(CMDeclarativeBase, session)
+        assert len(calls) == 1
+
+        # a migration that does not match the table classes
+        session.execute(text("ALTER TABLE hardware DROP COLUMN location"))
+        session.execute(text("UPDATE alembic_version SET version_num = 'bad'"))
+        session.commit()
+    with pytest.raises(RuntimeError, match="does not match expected schema"):
+        ntk.AutomappedDB(migrated_db_url)
+    assert len(calls) == 2
+    with open(fingerprint_file) as f:
+        assert list(json.load(f).values())[0]["revision"] == "next"
+    automapped.engine.dispose()
@@ -0,0 +1,121 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""Tests of the batched foreign key lookups and the DimensionCache."""
+
+import pytest
+from sqlalchemy import event
+
+from nrdz_toolkit.ntk_cache import DimensionCache
+from nrdz_toolkit.ntk_session import metadata_key_columns
+from nrdz_toolkit.ntk_tables import rpi, wrlen
+
+existing_key = (1, 2, 3, 4, 1, 10, "16")
+
+
+def _statements(session, func, *args, **kwargs):
+    """Call func, return its result and the SQL statements it ran."""
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.lstrip().split()[0].upper())
+
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", _record)
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        event.remove(engine, "before_cursor_execute", _record)
+    return result, statements
+
+
+@pytest.fixture
+def sensors(session):
+    """Sensors 1 and 2 with an rpi, sensor 3 only known by its White Rabbit host."""
+    for hardware_id in [1, 2]:
+        session.add(
+            rpi(
+                hostname="rpi{h}".format(h=hardware_id),
+                rpi_ip="10.0.0.{h}".format(h=hardware_id),
+                rpi_mac="00:00:00:00:00:0{h}".format(h=hardware_id),
+                rpi_v="4B",
+                os_v="12",
+                memory=4,
+                storage_cap=32,
+                cpu_type="arm",
+                cpu_cores=4,
+                op_status=1,
+                hardware_id=hardware_id,
+            )
+        )
+    # the rpi hostname wins over a White Rabbit host of the same name
+    session.add(wrlen(wr_host="rpi1", op_status=1, hardware_id=2))
+    session.add(wrlen(wr_host="wr3", op_status=1, hardware_id=3))
+    session.commit()
+    session.dimension_cache = DimensionCache()
+    return session
+
+
+def test_hardware_ids(sensors):
+    session = sensors
+    hostnames = ["rpi2", "wr3", "rpi1", "rpi2", "rpi1"]
+    ids, statements = _statements(session, session.get_hardware_ids, hostnames)
+    assert ids == [2, 3, 1, 2, 1]
+    assert statements == ["SELECT"]
+    assert session.dimension_cache.misses == 3
+
+    # all cached now
+    ids, statements = _statements(session, session.get_hardware_ids, ["wr3", "rpi1"])
+    assert ids == [3, 1]
+    assert statements == []
+    assert session.dimension_cache.hits == 2
+
+
+def test_unknown_hostname(sensors):
+    session = sensors
+    session.get_hardware_ids(["rpi1"])
+    with pytest.raises(ValueError, match="unknown hostnames: \\['rpi9'\\]"):
+        session.get_hardware_ids(["rpi1", "rpi9"])
+    # the unknown hostname is not cached
+    assert session.dimension_cache.get_many("hardware", ["rpi1", "rpi9"]) == (
+        {"rpi1": 1},
+        ["rpi9"],
+    )
+
+
+def test_metadata_ids(sensors):
+    session = sensors
+    new_key = dict(zip(metadata_key_columns, (2, 2, 3, 4, 1, 10, None)))
+    other_key = (3, 2, 3, 4, 1, 10, "8")
+    keys = [existing_key, new_key, other_key, existing_key, new_key]
+    ids, statements = _statements(session, session.get_metadata_ids, keys)
+    assert ids[0] == ids[3] == 1
+    assert ids[1] == ids[4]
+    assert len(set(ids)) == 3
+    # one lookup of the missing keys, one insert of the new ones
+    assert statements == ["SELECT", "INSERT"]
+
+    # created ids are only cached once committed
+    _, statements = _statements(session, session.get_metadata_ids, keys)
+    assert statements == ["SELECT"]
+    session.commit()
+    # the commit wrote to metadata, so only the created ids are still cached
+    found, missing = session.dimension_cache.get_many(
+        "metadata", [existing_key, other_key]
+    )
+    assert missing == [existing_key]
+    assert found == {other_key: ids[2]}
+    session.get_metadata_ids(keys)
+    again, statements = _statements(session, session.get_metadata_ids, keys)
+    assert again == ids
+    assert statements == []
+
+
+def test_unknown_metadata_key(sensors):
+    session = sensors
+    unknown = (9, 9, 9, 9, 9, 9, "9")
+    with pytest.raises(ValueError, match="unknown metadata keys"):
+        session.get_metadata_ids([existing_key, unknown], create=False)
+    assert session.dimension_cache.get_many("metadata", [unknown])[0] == {}
+    assert session.get_metadata_ids([existing_key], create=False) == [1]
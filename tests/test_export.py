@@ -0,0 +1,33 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""Tests of writing query results to files."""
+
+import csv
+
+from astropy.time import Time
+
+from nrdz_toolkit.ntk_tables import status
+
+
+def test_write_to_file_with_list_filter(session, make_status, tmp_path):
+    for hardware_id in [1, 2, 3]:
+        session.bulk_copy(status, make_status(5, hardware_id=hardware_id))
+    session.commit()
+
+    filename = str(tmp_path / "status.csv")
+    session._time_filter(
+        status,
+        "time",
+        starttime=Time("2025-12-31"),
+        stoptime=Time("2026-01-02"),
+        filter_column="hardware_id",
+        filter_value=[1, 3],
+        write_to_file=True,
+        filename=filename,
+    )
+    with open(filename) as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 10
+    assert {row["hardware_id"] for row in rows} == {"1", "3"}
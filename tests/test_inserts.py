@@ -0,0 +1,129 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""Tests of the duplicate handling of CMSession inserts and bulk loads."""
+
+import datetime
+
+import numpy as np
+import pytest
+from sqlalchemy import func, select
+
+from conftest import t0
+from nrdz_toolkit.ntk_tables import output_spectra, outputs, status
+
+
+def _with_ids(rows, first_id=1):
+    return [dict(row, status_id=first_id + i) for i, row in enumerate(rows)]
+
+
+@pytest.mark.parametrize("update", [False, True])
+def test_insert_ignoring_duplicates_conflicts(session, make_status, update):
+    rows = _with_ids(make_status(4))
+    counts = session._insert_ignoring_duplicates(
+        status, [status(**row) for row in rows]
+    )
+    assert counts == {"inserted": 4, "updated": 0, "skipped": 0}
+
+    # two records collide with stored ones, one is new
+    again = [dict(row, sdr_temp=50.0) for row in rows[2:]]
+    again.append(dict(_with_ids(make_status(5), first_id=1)[4]))
+    counts = session._insert_ignoring_duplicates(
+        status, [status(**row) for row in again], update=update
+    )
+    if update:
+        assert counts == {"inserted": 1, "updated": 2, "skipped": 0}
+    else:
+        assert counts == {"inserted": 1, "updated": 0, "skipped": 2}
+
+    temps = session.execute(
+        select(status.status_id, status.sdr_temp).order_by(status.status_id)
+    ).all()
+    assert [row[0] for row in temps] == [1, 2, 3, 4, 5]
+    assert temps[2][1] == (50.0 if update else 30.0)
+
+
+def test_insert_ignoring_duplicates_mixed_ids(session, make_status):
+    rows = make_status(4)
+    rows[0]["status_id"] = 100
+    counts = session._insert_ignoring_duplicates(
+        status, [status(**row) for row in rows]
+    )
+    assert counts == {"inserted": 4, "updated": 0, "skipped": 0}
+    assert session.execute(select(func.count()).select_from(status)).scalar() == 4
+
+
+@pytest.mark.parametrize("update", [False, True])
+def test_bulk_copy_conflicts(session, make_status, update):
+    rows = _with_ids(make_status(4))
+    counts = session.bulk_copy(status, rows)
+    assert counts == {"inserted": 4, "updated": 0, "skipped": 0}
+
+    # a duplicate within the input and two collisions with stored records
+    again = [dict(row, sdr_temp=50.0) for row in rows[2:]]
+    again.append(dict(rows[3], sdr_temp=60.0))
+    again.append(_with_ids(make_status(5), first_id=1)[4])
+    counts = session.bulk_copy(status, again, update=update)
+    if update:
+        assert counts == {"inserted": 1, "updated": 3, "skipped": 0}
+    else:
+        assert counts == {"inserted": 1, "updated": 0, "skipped": 3}
+
+    temp = session.execute(
+        select(status.sdr_temp).where(status.status_id == 4)
+    ).scalar()
+    assert temp == (60.0 if update else 30.0)
+
+
+def test_bulk_copy_natural_key(session, make_status):
+    rows = make_status(4)
+    counts = session.bulk_copy(status, rows[:2], key=["hardware_id", "time"])
+    assert counts == {"inserted": 2, "updated": 0, "skipped": 0}
+    # one record is stored already and one is repeated in the input
+    counts = session.bulk_copy(
+        status, rows[1:] + rows[3:], key=["hardware_id", "time"]
+    )
+    assert counts == {"inserted": 2, "updated": 0, "skipped": 2}
+    assert session.execute(select(func.count()).select_from(status)).scalar() == 4
+
+    with pytest.raises(ValueError, match="update cannot be combined"):
+        session.bulk_copy(status, rows, update=True, key=["hardware_id", "time"])
+
+
+def test_bulk_copy_array_columns(session):
+    output_ids = []
+    for i in range(2):
+        output = outputs(
+            hardware_id=1,
+            metadata_id=1,
+            created_at=t0 + datetime.timedelta(seconds=i),
+            average_db=-80.0,
+            max_db=-60.0,
+            median_db=-80.0,
+            std_dev=1.0,
+            kurtosis=3.0,
+        )
+        session.add(output)
+        session.flush()
+        output_ids.append(output.output_id)
+    # the bytes include a backslash (0x5c) and a tab (0x09)
+    power = np.frombuffer(b"\\\t\n\x00" * 3, dtype="<f4")
+    counts = session.bulk_copy(
+        output_spectra,
+        [
+            {
+                "output_id": output_id,
+                "created_at": t0 + datetime.timedelta(seconds=i),
+                "n_bins": 3,
+                "mean_power": power,
+                "max_power": [1.5, 2.5, -3.5],
+                "median_power": np.zeros(3),
+            }
+            for i, output_id in enumerate(output_ids)
+        ],
+    )
+    assert counts == {"inserted": 2, "updated": 0, "skipped": 0}
+    for spectra in session.execute(select(output_spectra)).scalars():
+        assert spectra.mean_power.tobytes() == power.tobytes()
+        assert list(spectra.max_power) == [1.5, 2.5, -3.5]
@@ -0,0 +1,177 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""Tests of the management of the monthly partitions."""
+
+import datetime
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from astropy.time import Time
+from sqlalchemy import func, select, text
+
+from conftest import test_db_url
+from nrdz_toolkit.ntk_tables import output_spectra, outputs, status
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+script = os.path.join(root, "scripts", "ntk_manage_partitions.py")
+
+
+def _exists(session, table):
+    return session.execute(
+        text("SELECT to_regclass(:t) IS NOT NULL"), {"t": table}
+    ).scalar()
+
+
+def _drop_partition(session, table_class, name):
+    """Drop a partition made by a test, attached or not."""
+    table = table_class.__tablename__
+    if name in session._list_time_partitions(table_class):
+        session.execute(
+            text("ALTER TABLE {t} DETACH PARTITION {p}".format(t=table, p=name))
+        )
+    session.execute(text("DROP TABLE IF EXISTS {p}".format(p=name)))
+    session.commit()
+
+
+def test_create_partitions_keeps_referencing_records(session):
+    # no partition exists for that month yet, the records go to the default
+    # partitions
+    created_at = datetime.datetime(2027, 3, 5, tzinfo=datetime.timezone.utc)
+    for i in range(3):
+        output = outputs(
+            hardware_id=1, metadata_id=1, created_at=created_at, average_db=-80.0,
+            max_db=-60.0, median_db=-80.0, std_dev=1.0, kurtosis=3.0,
+        )
+        session.add(output)
+        session.flush()
+        session.add(
+            output_spectra(
+                output_id=output.output_id, created_at=created_at, n_bins=4,
+                mean_power=np.full(4, i), max_power=np.full(4, i),
+                median_power=np.full(4, i),
+            )
+        )
+    session.commit()
+
+    # in the order of scripts/ntk_manage_partitions.py
+    for table_class in [output_spectra, outputs]:
+        assert session.create_time_partitions(
+            table_class, months_ahead=0, start=Time(created_at)
+        ) == ["{t}_y2027m03".format(t=table_class.__tablename__)]
+    session.commit()
+
+    for table in ["outputs", "output_spectra"]:
+        assert session.execute(
+            text("SELECT count(*) FROM {t}_y2027m03".format(t=table))
+        ).scalar() == 3
+        assert session.execute(
+            text("SELECT count(*) FROM {t}_default".format(t=table))
+        ).scalar() == 0
+    powers = session.execute(
+        select(output_spectra.mean_power).order_by(output_spectra.output_id)
+    ).scalars()
+    assert [power[0] for power in powers] == [0, 1, 2]
+    assert session.execute(select(func.count()).select_from(outputs)).scalar() == 3
+
+
+@pytest.mark.parametrize("drop", [False, True])
+def test_remove_partitions(session, make_status, monkeypatch, drop):
+    start = datetime.datetime(2001, 1, 1, tzinfo=datetime.timezone.utc)
+    assert session.create_time_partitions(
+        status, months_ahead=2, start=Time(start)
+    ) == ["status_y2001m01", "status_y2001m02", "status_y2001m03"]
+    session.bulk_copy(status, make_status(3, start=start, step=40 * 86400))
+    session.commit()
+
+    # keeping one month before April 2001 expires January and February
+    monkeypatch.setattr(
+        session,
+        "get_current_db_time",
+        lambda force=False: Time(datetime.datetime(2001, 4, 15)),
+    )
+    with pytest.raises(ValueError, match="keep_months"):
+        session.remove_time_partitions(status, -1)
+    removed = session.remove_time_partitions(status, 1, drop=drop)
+    session.commit()
+    try:
+        assert removed == ["status_y2001m01", "status_y2001m02"]
+        assert [rec.bytes_recorded for rec in session.query(status)] == [2]
+        assert "status_y2001m03" in session._list_time_partitions(status)
+        for name in removed:
+            assert name not in session._list_time_partitions(status)
+            # detached partitions remain as tables with their records
+            assert _exists(session, name) is not drop
+        if not drop:
+            assert session.execute(
+                text("SELECT bytes_recorded FROM status_y2001m02")
+            ).scalar() == 1
+    finally:
+        for name in ["status_y2001m01", "status_y2001m02", "status_y2001m03"]:
+            _drop_partition(session, status, name)
+
+
+def test_manage_partitions_script(session, tmp_path):
+    tables = [status, output_spectra, outputs]
+    before = {
+        table_class: list(session._list_time_partitions(table_class))
+        for table_class in tables
+    }
+    # a month old enough to expire whatever the current date
+    start = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+    for table_class in tables:
+        session.create_time_partitions(table_class, months_ahead=0, start=Time(start))
+    session.commit()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    keep_months = (now.year - 2000) * 12 + now.month - 2
+
+    config_path = tmp_path / "cm.json"
+    config_path.write_text(
+        json.dumps(
+            {
+                "default_db_name": "test",
+                "databases": {"test": {"url": test_db_url, "mode": "testing"}},
+            }
+        )
+    )
+    try:
+        result = subprocess.run(
+            [
+                sys.executable,
+                script,
+                "--config",
+                str(config_path),
+                "--months-ahead",
+                "0",
+                "--keep-months",
+                str(keep_months),
+                "--drop",
+            ],
+            env=dict(os.environ, PYTHONPATH=root),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        dropped = [
+            line.split()[-1]
+            for line in result.stdout.splitlines()
+            if line.startswith("dropped")
+        ]
+        assert dropped == [
+            "status_y2000m01", "output_spectra_y2000m01", "outputs_y2000m01"
+        ]
+        for name in dropped:
+            assert not _exists(session, name)
+        assert "status_y2026m01" in session._list_time_partitions(status)
+    finally:
+        # including the partitions of the current month made by the script
+        for table_class in tables:
+            name = table_class.__tablename__ + "_y2000m01"
+            for partition in [name, *session._list_time_partitions(table_class)]:
+                if partition not in before[table_class]:
+                    _drop_partition(session, table_class, partition)
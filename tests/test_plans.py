@@ -0,0 +1,140 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""
+Query plan regression tests for the hot queries.
+
+These load a synthetic status table large enough for PostgreSQL to prefer
+an index over a sequential scan, and check the plans of the queries. The
+records all fall in the monthly partitions, so the (empty) default partition
+is left out of the checks.
+"""
+
+import datetime
+import re
+
+from astropy.time import Time
+
+from conftest import capture_statements, plan, t0
+from nrdz_toolkit.ntk_tables import status
+
+n_records = 300000
+
+
+def _scanned(nodes, relation_prefix="status", default=False):
+    """
+    Get the scanned partitions of a table, with the scan node types and
+    indexes used. The default partition is included if default is true.
+    """
+    pattern = re.escape(relation_prefix) + r"(_y\d{4}m\d{2}"
+    pattern += r"|_default)?" if default else r")?"
+    return [
+        (node["Relation Name"], node["Node Type"], node.get("Index Name"))
+        for node in nodes
+        if node["Node Type"].endswith("Scan")
+        and re.fullmatch(pattern, node.get("Relation Name", ""))
+    ]
+
+
+def _uses_time_index(scans):
+    return len(scans) > 0 and all(
+        node_type != "Seq Scan" and (index or "").endswith("hardware_id_time_idx")
+        for _, node_type, index in scans
+        if node_type != "Bitmap Heap Scan"
+    )
+
+
+def test_time_range_uses_index(session, synthetic_status, plan_of):
+    synthetic_status(session, n_records)
+    start = t0 + datetime.timedelta(days=2)
+    nodes = plan_of(
+        session,
+        session._time_filter,
+        status,
+        "time",
+        starttime=Time(start),
+        stoptime=Time(start + datetime.timedelta(hours=1)),
+    )
+    scans = _scanned(nodes)
+    assert len(scans) > 0
+    assert all(node_type != "Seq Scan" for _, node_type, _ in scans)
+
+
+def test_time_range_accepts_other_time_scales(session, make_status):
+    session.bulk_copy(status, make_status(10))
+    session.commit()
+    start = Time(t0).gps
+    # GPS times are in the TAI scale
+    records = session._time_filter(
+        status,
+        "time",
+        starttime=Time(start, format="gps"),
+        stoptime=Time(start + 45, format="gps"),
+    )
+    assert len(records) == 5
+    columns = session.get_columns(
+        status,
+        "bytes_recorded",
+        Time(start, format="gps"),
+        Time(start + 45, format="gps"),
+    )
+    assert list(columns["bytes_recorded"]) == [0, 1, 2, 3, 4]
+
+
+def test_most_recent_uses_index(session, synthetic_status, plan_of):
+    synthetic_status(session, n_records)
+    nodes = plan_of(
+        session,
+        session._time_filter,
+        status,
+        "time",
+        filter_column="hardware_id",
+        filter_value=2,
+    )
+    assert _uses_time_index(_scanned(nodes))
+
+
+def test_most_recent_per_value_uses_index(session, synthetic_status, plan_of):
+    synthetic_status(session, n_records)
+    nodes = plan_of(
+        session,
+        session._time_filter,
+        status,
+        "time",
+        filter_column="hardware_id",
+        filter_value=[1, 2, 3],
+    )
+    # one index probe per value rather than a subquery per record
+    assert "Values Scan" in [node["Node Type"] for node in nodes]
+    assert "SubPlan" not in [node.get("Parent Relationship") for node in nodes]
+    assert _uses_time_index(_scanned(nodes))
+
+
+def test_fleet_snapshot_reads_latest_table(session, synthetic_status, plan_of):
+    synthetic_status(session, n_records)
+    nodes = plan_of(session, session.get_fleet_snapshot)
+    assert _scanned(nodes) == []
+    assert len(_scanned(nodes, "status_latest")) == 1
+
+
+def test_rollup_batches_use_index(session, synthetic_status):
+    synthetic_status(session, n_records)
+    # roll up the first two hours only
+    now = session.get_current_db_time().to_datetime(timezone=datetime.timezone.utc)
+    max_age = now - (t0 + datetime.timedelta(hours=2))
+    statements = capture_statements(
+        session,
+        session.rollup_status,
+        max_age_days=max_age.total_seconds() / 86400,
+        batch_size=100,
+    )
+    batches = [stmt for stmt in statements if stmt[0].startswith("WITH")]
+    probes = [stmt for stmt in statements if stmt[0].startswith("SELECT status.time")]
+    assert len(batches) > 3 and len(probes) > 3
+    for statement, parameters in [batches[-1], probes[-1]]:
+        nodes = plan(session, statement, parameters)
+        assert _uses_time_index(_scanned(nodes))
+        # only the partition holding the window is read
+        scans = _scanned(nodes, default=True)
+        assert {relation for relation, _, _ in scans} == {"status_y2026m01"}
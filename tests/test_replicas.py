@@ -0,0 +1,52 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""Tests of the routing of reads to read replicas."""
+
+import pytest
+from sqlalchemy import create_engine
+
+from conftest import test_db_url
+from nrdz_toolkit import ntk
+from nrdz_toolkit.ntk_tables import status
+
+
+@pytest.fixture
+def replica_session(session):
+    # a second engine on the test database stands in for a replica, it only
+    # sees committed records
+    engine = create_engine(test_db_url)
+    session.replicas = ntk.ReplicaSet([engine])
+    yield session
+    session.rollback()
+    engine.dispose()
+
+
+@pytest.mark.parametrize("method", ["_insert_ignoring_duplicates", "bulk_copy"])
+def test_reads_see_own_writes(replica_session, make_status, method):
+    session = replica_session
+
+    def read():
+        return [
+            rec.bytes_recorded
+            for rec in session._time_filter(
+                status, "time", filter_column="hardware_id", filter_value=1
+            )
+        ]
+
+    assert read() == []
+    rows = make_status(2)
+    if method == "bulk_copy":
+        session.bulk_copy(status, rows)
+    else:
+        session._insert_ignoring_duplicates(status, [status(**row) for row in rows])
+    # uncommitted, only the primary has the records
+    with session._replica_reads():
+        assert session.get_bind() is not session.replicas.engines[0]
+    assert read() == [1]
+    session.commit()
+
+    with session._replica_reads():
+        assert session.get_bind() is session.replicas.engines[0]
+    assert read() == [1]
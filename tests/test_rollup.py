@@ -0,0 +1,29 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""Tests of CMSession.rollup_status."""
+
+from sqlalchemy import func, select
+
+from nrdz_toolkit.ntk_tables import status, status_hourly
+
+
+def test_rollup_status_batches(session, make_status):
+    for hardware_id in [1, 2]:
+        session.bulk_copy(status, make_status(1000, hardware_id=hardware_id))
+    # more records at the same time than fit in a batch
+    tied = make_status(1, hardware_id=3) * 10
+    session.bulk_copy(status, tied)
+    session.commit()
+
+    assert session.rollup_status(max_age_days=0, batch_size=7) == 2010
+    assert session.execute(select(func.count()).select_from(status)).scalar() == 0
+    hours = session.execute(
+        select(
+            status_hourly.hardware_id,
+            func.sum(status_hourly.n_samples),
+            func.max(status_hourly.bytes_recorded_max),
+        ).group_by(status_hourly.hardware_id).order_by(status_hourly.hardware_id)
+    ).all()
+    assert hours == [(1, 1000, 999), (2, 1000, 999), (3, 10, 0)]
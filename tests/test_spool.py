@@ -0,0 +1,32 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""Tests of the replay of a spool to the central database."""
+
+from sqlalchemy import func, select
+
+from nrdz_toolkit import ntk_spool
+from nrdz_toolkit.ntk_session import CMSession
+from nrdz_toolkit.ntk_tables import status
+
+
+def test_replay_spool_is_idempotent(db, session, make_status, tmp_path):
+    spool_db = ntk_spool.open_spool(str(tmp_path / "spool.sqlite"))
+    with CMSession(bind=spool_db.engine) as spool:
+        spool.add_all([status(**row) for row in make_status(5)])
+
+    assert ntk_spool.replay_spool(spool_db, db, tables=["status"], batch_size=2) == {
+        "status": 5
+    }
+    # a failure after the commit of the last batch loses the spool's record
+    # of it, it is sent again
+    with CMSession(bind=spool_db.engine) as spool:
+        spool.execute(ntk_spool.spool_state.update().values(last_sent_id=3))
+    assert ntk_spool.replay_spool(spool_db, db, tables=["status"]) == {"status": 2}
+
+    times = session.execute(
+        select(status.time, func.count()).group_by(status.time).order_by(status.time)
+    ).all()
+    assert [row[1] for row in times] == [1] * 5
+    spool_db.engine.dispose()
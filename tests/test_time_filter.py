@@ -0,0 +1,104 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""Tests of CMSession._time_filter."""
+
+import datetime
+
+import pytest
+from astropy.time import Time
+
+from nrdz_toolkit.ntk_tables import status
+
+
+def test_most_recent_per_value(session, make_status):
+    for hardware_id, n in [(1, 5), (2, 3), (3, 4)]:
+        session.bulk_copy(status, make_status(n, hardware_id=hardware_id))
+    # a second record at the latest time of sensor 2
+    tie = make_status(3, hardware_id=2)[2]
+    tie["hostname"] = "other"
+    session.bulk_copy(status, [tie])
+    session.commit()
+
+    def summary(records):
+        return sorted(
+            (rec.hardware_id, rec.hostname, rec.bytes_recorded) for rec in records
+        )
+
+    latest = session._time_filter(
+        status, "time", filter_column="hardware_id", filter_value=[1, 2, 99]
+    )
+    assert summary(latest) == [(1, "rpi1", 4), (2, "other", 2), (2, "rpi2", 2)]
+
+    # one call per value gives the same records
+    single = []
+    for hardware_id in [1, 2, 99]:
+        single.extend(
+            session._time_filter(
+                status, "time", filter_column="hardware_id", filter_value=hardware_id
+            )
+        )
+    assert summary(single) == summary(latest)
+
+    first = session._time_filter(
+        status,
+        "time",
+        most_recent=False,
+        starttime=Time(make_status(1)[0]["time"] + datetime.timedelta(seconds=25)),
+        filter_column=["hardware_id", "hostname"],
+        filter_value=[[1, 3], "rpi3"],
+    )
+    assert summary(first) == [(3, "rpi3", 3)]
+
+    assert session._time_filter(
+        status, "time", filter_column="hardware_id", filter_value=[]
+    ) == []
+
+
+def test_most_recent_repeated_values(session, make_status, tmp_path):
+    for hardware_id in [1, 2]:
+        session.bulk_copy(status, make_status(3, hardware_id=hardware_id))
+    session.commit()
+
+    kwargs = {"filter_column": "hardware_id", "filter_value": [1, 2, 1]}
+    assert len(session._time_filter(status, "time", **kwargs)) == 2
+    streamed = session._time_filter(status, "time", stream=True, **kwargs)
+    assert len(list(streamed)) == 2
+    filename = str(tmp_path / "latest.csv")
+    session._time_filter(
+        status, "time", write_to_file=True, filename=filename, **kwargs
+    )
+    with open(filename) as f:
+        assert len(f.readlines()) == 3  # with the header
+
+
+def test_stream_batches(session, make_status):
+    session.bulk_copy(status, make_status(23))
+    session.commit()
+    kwargs = {
+        "most_recent": False,
+        "starttime": Time(make_status(1)[0]["time"]),
+        "stoptime": Time(make_status(23)[22]["time"]),
+    }
+
+    def summary(records):
+        return [(rec.time, rec.bytes_recorded) for rec in records]
+
+    listed = session._time_filter(status, "time", **kwargs)
+    assert len(listed) == 23
+
+    batches = list(
+        session._time_filter(status, "time", stream=True, batch_size=5, **kwargs)
+    )
+    assert [len(batch) for batch in batches] == [5, 5, 5, 5, 3]
+    assert summary(rec for batch in batches for rec in batch) == summary(listed)
+
+    streamed = list(session._time_filter(status, "time", stream=True, **kwargs))
+    assert summary(streamed) == summary(listed)
+
+    for batch_size in [0, 2.5]:
+        with pytest.raises(ValueError, match="batch_size"):
+            session._time_filter(
+                status, "time", stream=True, batch_size=batch_size, **kwargs
+            )
@@ -0,0 +1,113 @@
+# -*- mode: python; coding: utf-8 -*-
+# Copyright 2022 David R. DeBoer
+# Licensed under the 2-clause BSD license.
+
+"""Tests of the background writers."""
+
+import json
+import os
+import queue
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import DBAPIError
+
+from conftest import status_rows
+from nrdz_toolkit import ntk
+from nrdz_toolkit.ntk_tables import status
+from nrdz_toolkit.ntk_writer import StatusWriter
+
+
+def test_rejected_records_are_isolated(db, session, tmp_path):
+    rows = status_rows(10)
+    rows[3]["hardware_id"] = 99  # no such sensor
+    spill_file = str(tmp_path / "status.jsonl")
+    with StatusWriter(
+        db, batch_size=10, flush_interval=0.05, spill_file=spill_file
+    ) as writer:
+        for row in rows:
+            writer.write(row)
+    assert (writer.n_written, writer.n_rejected, writer.n_spilled) == (9, 1, 0)
+    assert session.execute(select(func.count()).select_from(status)).scalar() == 9
+    with open(spill_file + ".rejected") as f:
+        rejected = [json.loads(line) for line in f]
+    assert [row["hardware_id"] for row in rejected] == [99]
+
+
+def test_replay_isolates_rejected_records(db, session, tmp_path):
+    rows = status_rows(10)
+    rows[7]["hardware_id"] = 99  # no such sensor
+    spill_file = str(tmp_path / "status.jsonl")
+    writer = StatusWriter(db, batch_size=4, spill_file=spill_file)
+    writer.close()
+    writer._spill(rows)
+    assert writer.replay()
+    assert (writer.n_written, writer.n_rejected) == (9, 1)
+    assert session.execute(select(func.count()).select_from(status)).scalar() == 9
+    with open(spill_file + ".rejected") as f:
+        assert [json.loads(line)["hardware_id"] for line in f] == [99]
+
+
+def test_batch_sent_again_is_not_duplicated(db, session, tmp_path):
+    rows = status_rows(6)
+    spill_file = str(tmp_path / "status.jsonl")
+    writer = StatusWriter(
+        db, batch_size=4, flush_interval=0.05, spill_file=spill_file
+    )
+    for row in rows:
+        writer.write(row)
+    writer.flush()
+    # a batch committed just before a failure is spilled and replayed
+    writer._spill(rows[2:])
+    assert writer.replay()
+    writer.close()
+    assert session.execute(select(func.count()).select_from(status)).scalar() == 6
+
+
+def test_replay_resumes_after_failure(tmp_path, monkeypatch):
+    spill_file = str(tmp_path / "status.jsonl")
+    writer = StatusWriter(None, batch_size=3, spill_file=spill_file)
+    writer.close()
+    rows = status_rows(8)
+    writer._spill(rows)
+
+    inserted = []
+    down = [True]
+
+    def _insert(batch):
+        values = [row["bytes_recorded"] for row in batch]
+        if 4 in values and down[0]:
+            if len(batch) > 1:
+                # rejected, the batch is split
+                raise DBAPIError("INSERT", {}, ValueError("bad record"))
+            raise OSError("uplink down")
+        inserted.extend(values)
+
+    monkeypatch.setattr(writer, "_insert", _insert)
+    assert not writer.replay()
+    assert inserted == [0, 1, 2, 3]
+    with open(spill_file + ".replay") as f:
+        assert [json.loads(line)["bytes_recorded"] for line in f] == [4, 5, 6, 7]
+
+    down[0] = False
+    assert writer.replay()
+    assert inserted == list(range(8))
+    assert not os.path.exists(spill_file + ".replay")
+
+
+def test_backpressure_without_spill_file(tmp_path):
+    pytest.importorskip("psycopg2")
+    # no server listens in an empty directory
+    unreachable = ntk.DeclarativeDB(
+        "postgresql://postgres:@/ntk?host={d}".format(d=tmp_path)
+    )
+    writer = StatusWriter(
+        unreachable, batch_size=2, flush_interval=0.01, max_buffer=4,
+        retry_interval=0.01,
+    )
+    # the records held for a retry and the buffer fill up
+    with pytest.raises(queue.Full):
+        for row in status_rows(20):
+            writer.write(row, timeout=0.5)
+    writer.close()
+    assert writer.n_written == 0